@@ -0,0 +1,80 @@
+"""Generate one document per row of a CSV or JSONL manifest.
+
+Usage:
+    python batch_generate.py tickets.csv --template customer_complaint_response --output responses.zip --formats pdf md
+
+Each row needs a "query" column (the document requirements) and may set
+"id", "knowledge_file" and "knowledge_base"; every other column overrides
+the template variable of the same name instead of generating it. Progress
+is kept in a work directory next to the output, so re-running the same
+command after an interruption only generates the rows that are missing,
+failed or changed. The ZIP holds the documents and a report.csv with the
+status, token usage and cost of every row.
+"""
+import sys
+import argparse
+from pathlib import Path
+from dotenv import load_dotenv
+
+from utils.batch_generation import (
+    BatchRunner,
+    read_batch_manifest,
+    BATCH_CONCURRENCY,
+    EXPORT_FORMATS,
+    GENERATION_METHODS
+)
+from utils.rag_tools import RETRIEVAL_ENGINES
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", help="CSV or JSONL manifest, one document per row")
+    parser.add_argument("--template", required=True, help="Template name from templates/index.json")
+    parser.add_argument("--output", default="batch_output.zip", help="ZIP file to write")
+    parser.add_argument("--work-dir", help="Directory for generated files and resume state (default: next to the output)")
+    parser.add_argument("--formats", nargs="+", choices=EXPORT_FORMATS, default=["md"], help="Export formats")
+    parser.add_argument("--method", choices=GENERATION_METHODS, default="standard", help="Generation method")
+    parser.add_argument("--retrieval", choices=list(RETRIEVAL_ENGINES), default="bm25", help="Retrieval engine for RAG")
+    parser.add_argument("--knowledge-file", help="PDF, DOCX or text file used by rows without their own")
+    parser.add_argument("--knowledge-base", help="Knowledge base used by rows without their own (RAG only)")
+    parser.add_argument("--token-budget", type=int, help="Context token budget per document")
+    parser.add_argument("--group-size", type=int, help="Generate variables in concurrent groups of this size")
+    parser.add_argument("--no-routing", action="store_true", help="Generate every variable with the pro model")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Rows generated at the same time")
+    args = parser.parse_args()
+
+    load_dotenv()
+    output = Path(args.output)
+    work_dir = Path(args.work_dir) if args.work_dir else output.with_name(output.stem + "_work")
+
+    try:
+        rows = read_batch_manifest(args.manifest)
+        runner = BatchRunner(
+            args.template, work_dir,
+            formats=args.formats,
+            method=args.method,
+            retrieval_method=args.retrieval,
+            knowledge_file=args.knowledge_file,
+            knowledge_base=args.knowledge_base,
+            token_budget=args.token_budget,
+            group_size=args.group_size,
+            route_models=not args.no_routing,
+            concurrency=args.concurrency
+        )
+        records = runner.run(
+            rows,
+            on_row=lambda record, done, total: print(f"[{done}/{total}] {record['id']}: {record['status']} {record['error']}".rstrip())
+        )
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+    runner.write_zip(records, output)
+    counts = {}
+    for record in records:
+        counts[record["status"]] = counts.get(record["status"], 0) + 1
+    cost = sum(float(record["cost_usd"]) for record in records)
+    print(f"Wrote {output}: " + ", ".join(f"{count} {status}" for status, count in sorted(counts.items())) + f", ~${cost:.4f}")
+    return 0 if counts.get("error", 0) == 0 else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
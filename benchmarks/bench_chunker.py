@@ -0,0 +1,88 @@
+"""Benchmark the offset-based chunker against the legacy string-concatenating one.
+
+Usage:
+    python benchmarks/bench_chunker.py --sizes 10 100 1000
+
+Sizes are in MB of synthetic text. Peak memory is measured with tracemalloc
+and excludes the corpus itself, which both chunkers share.
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.rag_tools import iter_chunk_offsets
+
+WORDS = (
+    "policy refund shipping warranty customer product order delivery invoice "
+    "account support manual section device battery install configure update"
+).split()
+
+def legacy_chunk_text(text, chunk_size=1000, overlap=200):
+    """The original list-building chunker, kept here for comparison."""
+    sentences = re.split(r'(?<=[.!?])\s+', text)
+    chunks = []
+    current_chunk = ""
+    for sentence in sentences:
+        if len(current_chunk) + len(sentence) > chunk_size and current_chunk:
+            chunks.append(current_chunk)
+            if len(current_chunk) > overlap:
+                current_chunk = current_chunk[-overlap:] + " " + sentence
+            else:
+                current_chunk = sentence
+        else:
+            current_chunk += " " + sentence if current_chunk else sentence
+    if current_chunk:
+        chunks.append(current_chunk)
+    return chunks
+
+def make_corpus(size_mb, seed=0):
+    """Build a synthetic corpus of roughly size_mb megabytes."""
+    rng = random.Random(seed)
+    sentences = [
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 30))).capitalize() + "."
+        for _ in range(2000)
+    ]
+    block = " ".join(sentences) + " "
+    repeats = max(1, (size_mb * 1024 * 1024) // len(block))
+    return block * repeats
+
+def measure(fn):
+    """Run fn and return (result, seconds, peak_bytes)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="Corpus sizes in MB")
+    parser.add_argument("--legacy-max-mb", type=int, default=100, help="Skip the legacy chunker above this size")
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'chunker':>8} {'chunks':>10} {'seconds':>9} {'MB/s':>8} {'peak MB':>9}")
+    for size_mb in args.sizes:
+        text = make_corpus(size_mb)
+        actual_mb = len(text) / (1024 * 1024)
+
+        # Consume the generator without keeping chunks, as the RAG pipeline does
+        count, elapsed, peak = measure(lambda: sum(1 for _ in iter_chunk_offsets(text)))
+        print(f"{size_mb:>6}MB {'offsets':>8} {count:>10} {elapsed:>9.2f} {actual_mb / elapsed:>8.1f} {peak / 2**20:>9.1f}")
+
+        if size_mb <= args.legacy_max_mb:
+            chunks, elapsed, peak = measure(lambda: legacy_chunk_text(text))
+            print(f"{size_mb:>6}MB {'legacy':>8} {len(chunks):>10} {elapsed:>9.2f} {actual_mb / elapsed:>8.1f} {peak / 2**20:>9.1f}")
+            del chunks
+
+        del text
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Benchmark the main-content extractor against the legacy full-text extractor.
+
+Usage:
+    python benchmarks/bench_extraction.py --pages 200
+    python benchmarks/bench_extraction.py --files saved_pages/*.html
+
+Synthetic pages wrap an article in navigation, a cookie banner, a sidebar
+of links, related stories and a footer. Reports pages per second, the
+tokens each extractor keeps (after the 15,000-character scrape limit) and,
+for synthetic pages, how much of the article text was kept.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.web_tools import extract_full_text, clean_text
+from utils.content_extraction import extract_main_content
+from utils.tokens import estimate_tokens
+
+WORDS = (
+    "policy refund shipping warranty customer product order delivery invoice "
+    "account support manual section device battery install configure update"
+).split()
+
+def sentence(rng, low=6, high=25):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(low, high))]
+    if len(words) > 8:
+        words[len(words) // 2] += ","
+    return " ".join(words).capitalize() + "."
+
+def link_list(rng, count, cls):
+    items = "".join(f'<li><a href="/p/{rng.randint(1, 9999)}">{sentence(rng, 1, 4)}</a></li>' for _ in range(count))
+    return f'<ul class="{cls}">{items}</ul>'
+
+def make_page(rng, paragraphs=12):
+    """Build a synthetic news-style page; returns (html, article paragraphs)."""
+    article = [" ".join(sentence(rng) for _ in range(rng.randint(3, 7))) for _ in range(paragraphs)]
+    body = "".join(f"<p>{text}</p>" for text in article)
+    html = f"""<!DOCTYPE html><html><head><title>{sentence(rng, 3, 6)}</title>
+<style>body {{ font-family: sans-serif; }}</style><script>window.dataLayer = [];</script></head>
+<body>
+<div class="cookie-banner">{sentence(rng)} <a href="/privacy">Privacy policy</a> <button>Accept all</button></div>
+<header class="site-header"><nav>{link_list(rng, 40, "menu")}</nav></header>
+<div class="layout">
+  <div class="content"><article><h1>{sentence(rng, 4, 8)}</h1>{body}</article>
+    <div class="share-tools">{link_list(rng, 6, "social")}</div>
+    <section class="related-stories"><h2>Related</h2>{link_list(rng, 12, "stories")}</section>
+  </div>
+  <div class="sidebar"><h3>Popular</h3>{link_list(rng, 20, "popular")}<div class="ad">{sentence(rng)}</div></div>
+</div>
+<footer>{link_list(rng, 30, "footer-links")}<p>{sentence(rng)} All rights reserved.</p></footer>
+</body></html>"""
+    return html, article
+
+def article_recall(text, article):
+    """Fraction of article paragraphs whose opening appears in the extracted text."""
+    flat = " ".join(text.split())
+    return sum(1 for p in article if p[:60] in flat) / len(article)
+
+def run(name, extract, pages):
+    start = time.perf_counter()
+    outputs = [clean_text(extract(html)) for html, _ in pages]
+    elapsed = time.perf_counter() - start
+    tokens = sum(estimate_tokens(text) for text in outputs) / len(outputs)
+    recalls = [article_recall(text, article) for text, (_, article) in zip(outputs, pages) if article]
+    recall = f"{sum(recalls) / len(recalls):>8.0%}" if recalls else f"{'-':>8}"
+    print(f"{name:>8} {len(pages) / elapsed:>10.1f} {tokens:>12.0f} {recall}")
+    return tokens
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200, help="Number of synthetic pages")
+    parser.add_argument("--paragraphs", type=int, default=12, help="Article paragraphs per synthetic page")
+    parser.add_argument("--files", nargs="+", help="Saved HTML pages to use instead of synthetic ones")
+    args = parser.parse_args()
+
+    if args.files:
+        pages = []
+        for path in args.files:
+            with open(path, "rb") as f:
+                pages.append((f.read(), None))
+    else:
+        rng = random.Random(0)
+        pages = [make_page(rng, args.paragraphs) for _ in range(args.pages)]
+
+    print(f"{'extractor':>8} {'pages/s':>10} {'tokens/page':>12} {'article':>8}")
+    full_tokens = run("full", extract_full_text, pages)
+    main_tokens = run("main", extract_main_content, pages)
+    print(f"Main-content extraction keeps {main_tokens / full_tokens:.0%} of the tokens of full-text extraction")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Micro-benchmark response post-processing on large synthetic LLM outputs.
+
+Usage:
+    python benchmarks/bench_response_processing.py --variables 50 500 --words 400
+
+Compares the legacy six-pass sanitizer and per-variable regex fallback
+against the precompiled sanitizer and the tolerant streaming parser, and
+measures streaming parse throughput when the response arrives in small
+fragments.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.response_processing import (
+    IncrementalJSONParser,
+    process_variables_response,
+    sanitize_text
+)
+
+MARKUP_WORDS = "**growth** *risk* `metric` <b>team</b>".split()
+PLAIN_WORDS = "revenue plan market customer strategy it's the and of grew".split()
+
+def legacy_sanitize(text):
+    """The original per-variable clean-up, kept here for comparison."""
+    text = re.sub(r'^#+\s+', '', text, flags=re.MULTILINE)
+    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)
+    text = re.sub(r'\*(.*?)\*', r'\1', text)
+    text = re.sub(r'`(.*?)`', r'\1', text)
+    text = re.sub(r'```.*?```', '', text, flags=re.DOTALL)
+    return re.sub(r'<[^>]*>', '', text)
+
+def legacy_fallback(json_str, variables):
+    """The original regex fallback for unparseable JSON, kept here for comparison."""
+    result = {}
+    for var in variables:
+        pattern = fr'["\']?{var}["\']?\s*:\s*["\']([^"\']+)["\']'
+        match = re.search(pattern, json_str)
+        result[var] = match.group(1) if match else f"[Content for {var} not found]"
+    return result
+
+def make_response(n_variables, words, markup_rate, seed=0):
+    """Build a fenced JSON response; markup_rate is the share of values containing markdown/HTML."""
+    rng = random.Random(seed)
+    content = {}
+    for i in range(n_variables):
+        if rng.random() < markup_rate:
+            value = "## Heading\n" + " ".join(rng.choice(MARKUP_WORDS + PLAIN_WORDS) for _ in range(words))
+        else:
+            value = " ".join(rng.choice(PLAIN_WORDS) for _ in range(words)) + "."
+        content[f"variable_{i}"] = value
+    return "```json\n" + json.dumps(content, indent=2) + "\n```", list(content)
+
+def timed(fn, repeat=3):
+    """Return (result, best seconds) over repeat runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--variables", type=int, nargs="+", default=[50, 500], help="Variables per response")
+    parser.add_argument("--words", type=int, default=400, help="Words per variable")
+    parser.add_argument("--markup-rate", type=float, default=0.2, help="Share of values containing markup")
+    parser.add_argument("--fragment", type=int, default=32, help="Characters per streamed fragment")
+    args = parser.parse_args()
+
+    print(f"{'vars':>5} {'MB':>6} {'legacy clean s':>15} {'new s':>9} {'same':>5} {'legacy fallback s':>18} "
+          f"{'exact':>6} {'repair s':>9} {'exact':>6} {'stream MB/s':>12}")
+    for n_variables in args.variables:
+        response, variables = make_response(n_variables, args.words, args.markup_rate)
+        original = json.loads(response[8:-4])
+        values = list(original.values())
+        megabytes = len(response) / 1e6
+
+        legacy_values, legacy_clean = timed(lambda: [legacy_sanitize(v) for v in values])
+        sanitized, precompiled = timed(lambda: [sanitize_text(v) for v in values])
+        # Values the precompiled sanitizer cleans exactly like the legacy one
+        same = sum(1 for a, b in zip(legacy_values, sanitized) if a == b)
+
+        # Truncate mid-response to force the fallback path
+        truncated = response[:int(len(response) * 0.9)]
+        legacy_result, legacy_seconds = timed(lambda: legacy_fallback(truncated[8:], variables))
+        repaired, repair_seconds = timed(lambda: process_variables_response(truncated, variables))
+        # Values recovered exactly (the legacy fallback stops at the first quote or apostrophe)
+        legacy_recovered = sum(1 for var in variables if legacy_result[var] == original[var])
+        recovered = sum(1 for var in variables if repaired[var] == sanitize_text(original[var]))
+
+        def stream():
+            streaming = IncrementalJSONParser()
+            for start in range(0, len(response), args.fragment):
+                streaming.feed(response[start:start + args.fragment])
+        _, stream_seconds = timed(stream)
+
+        print(
+            f"{n_variables:>5} {megabytes:>6.2f} {legacy_clean:>15.4f} {precompiled:>9.4f} {same:>5} {legacy_seconds:>18.4f} "
+            f"{legacy_recovered:>6} {repair_seconds:>9.4f} {recovered:>6} {megabytes / stream_seconds:>12.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
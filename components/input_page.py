@@ -5,10 +5,19 @@ import os
 from utils.template_manager import (
     get_template_list, 
     get_template_content, 
+    get_template_routing,
     display_template_preview,
     save_new_template
 )
 from utils.document_processing import extract_text_from_uploaded_file
+from utils.knowledge_base import (
+    list_knowledge_bases,
+    load_manifest,
+    has_document,
+    add_document,
+    content_hash,
+    safe_knowledge_base_name
+)
 from utils.web_tools import scrape_webpage, search_for_template_by_name
 
 def render_input_page():
@@ -26,10 +35,11 @@ def render_input_page():
     st.header("2. Select Knowledge Source")
     knowledge_source = st.radio(
         "Choose your knowledge source",
-        ["Upload Document", "Search the Web", "Specific URL"]
+        ["Upload Document", "Search the Web", "Specific URL", "Knowledge Base"]
     )
     
     knowledge_data = None
+    knowledge_base = None
     
     if knowledge_source == "Upload Document":
         uploaded_file = st.file_uploader("Upload a document (PDF, DOCX, or TXT)", type=["pdf", "docx", "txt"])
@@ -48,9 +58,51 @@ def render_input_page():
         if specific_url and st.button("Fetch Content"):
             st.info(f"Fetching content from {specific_url}...")
             knowledge_data = scrape_webpage(specific_url)
+            st.session_state.fetched_url = (specific_url, knowledge_data)  # Keep it across reruns
             st.success("Content fetched successfully!")
             with st.expander("Preview Extracted Content"):
                 st.write(knowledge_data[:1000] + "..." if len(knowledge_data) > 1000 else knowledge_data)
+        elif specific_url and st.session_state.get('fetched_url', (None, None))[0] == specific_url:
+            knowledge_data = st.session_state.fetched_url[1]
+            with st.expander("Preview Extracted Content"):
+                st.write(knowledge_data[:1000] + "..." if len(knowledge_data) > 1000 else knowledge_data)
+    
+    elif knowledge_source == "Knowledge Base":
+        new_kb_option = "+ Create new knowledge base"
+        kb_choice = st.selectbox(
+            "Choose a knowledge base",
+            list_knowledge_bases() + [new_kb_option]
+        )
+        kb_name = st.text_input("Enter a name for the new knowledge base") if kb_choice == new_kb_option else kb_choice
+        
+        if kb_name and safe_knowledge_base_name(kb_name):
+            knowledge_base = safe_knowledge_base_name(kb_name)
+            manifest = load_manifest(knowledge_base)
+            documents = manifest["documents"] if manifest else []
+            st.info(f"Knowledge base '{knowledge_base}' contains {len(documents)} document(s).")
+            if documents:
+                with st.expander("View Documents"):
+                    for doc in documents:
+                        st.write(f"**{doc['name']}** ({doc['characters']:,} characters, {doc['chunks']} chunks, added {doc['date_added']})")
+            
+            # New files are indexed on their own; existing documents are never re-processed
+            new_files = st.file_uploader(
+                "Add documents to this knowledge base (PDF, DOCX, or TXT)",
+                type=["pdf", "docx", "txt"],
+                accept_multiple_files=True
+            )
+            if new_files and st.button("Add to Knowledge Base"):
+                for uploaded_file in new_files:
+                    file_hash = content_hash(uploaded_file.getvalue())
+                    if has_document(knowledge_base, file_hash):
+                        st.info(f"{uploaded_file.name} is already in the knowledge base.")
+                        continue
+                    with st.spinner(f"Indexing {uploaded_file.name}..."):
+                        text = extract_text_from_uploaded_file(uploaded_file)
+                        if add_document(knowledge_base, uploaded_file.name, text, document_hash=file_hash):
+                            st.success(f"Added {uploaded_file.name} to the knowledge base.")
+                        else:
+                            st.warning(f"No text could be extracted from {uploaded_file.name}.")
     
     # 3. Template selection
     st.header("3. Select Template")
@@ -61,6 +113,7 @@ def render_input_page():
     )
     
     template_text = None
+    template_routing = None
     
     if template_option == "Use Predefined Template":
         # Get list of template names from file system
@@ -73,6 +126,7 @@ def render_input_page():
         )
         
         template_text = get_template_content(selected_template)
+        template_routing = get_template_routing(selected_template)
         with st.expander("Preview Template"):
             st.write(display_template_preview(template_text), unsafe_allow_html=True)
     
@@ -152,6 +206,8 @@ def render_input_page():
             st.error("Please search for a template first.")
         elif not template_text:
             st.error("Please select or upload a template.")
+        elif knowledge_source == "Knowledge Base" and not (knowledge_base and load_manifest(knowledge_base) and load_manifest(knowledge_base)["documents"]):
+            st.error("Please choose a knowledge base that contains at least one document.")
         else:
             # For search template option, use the found template if available
             if template_option == "Search for Template" and not template_text and 'found_template' in st.session_state:
@@ -160,8 +216,10 @@ def render_input_page():
             # Save data to session state
             st.session_state.user_query = user_query
             st.session_state.template_text = template_text
+            st.session_state.template_routing = template_routing
             st.session_state.knowledge_source = knowledge_source
             st.session_state.knowledge_data = knowledge_data
+            st.session_state.knowledge_base = knowledge_base
             
             # Proceed to verification page
             st.session_state.page = 'verify'
@@ -1,5 +1,6 @@
 import streamlit as st
 import time
+import logging
 
 # Import utilities
 from utils.document_processing import (
@@ -10,6 +11,15 @@ from utils.pdf_tools import (
     markdown_to_pdf_weasyprint,
     markdown_to_html_with_toc
 )
+from utils.llm_cache import response_cache
+from utils.search_cache import search_cache
+from utils.llm_client import rate_limiter
+from utils.llm_usage import usage_tracker
+from utils.model_routing import routing_savings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 def render_results_page():
     """Render the results page."""
@@ -83,6 +93,102 @@ def render_results_page():
             st.write("Template Variables Used:")
             for var, value in st.session_state.content_variables.items():
                 st.write(f"**{var}:** {value[:100]}..." if len(str(value)) > 100 else f"**{var}:** {value}")
+        
+        report = st.session_state.get('generation_report')
+        if report and 'context_tokens' in report:
+            st.write("Retrieval:")
+            chunks_note = f"{report['context_chunks']} chunks, " if 'context_chunks' in report else ""
+            budget_note = f" of a {report['context_budget']:,} token budget" if 'context_budget' in report else ""
+            st.write(f"**Context:** {chunks_note}~{report['context_tokens']:,} tokens{budget_note}")
+            if 'mmr' in report:
+                mmr = report['mmr']
+                st.write(
+                    f"**MMR re-ranking:** kept {mmr.get('selected', 0)} of {mmr.get('candidates', 0)} candidates "
+                    f"(lambda {mmr.get('lambda', 0):.2f}), saving ~{mmr.get('tokens_saved', 0):,} redundant tokens"
+                )
+        
+        if report and 'summary_chunks' in report:
+            st.write(
+                f"**Map-reduce summary:** {report['summary_chunks']} parts "
+                f"({report['summary_cached']} summaries reused), {report['summary_levels']} levels "
+                f"in {report['summary_seconds']:.1f}s"
+            )
+        
+        if report and 'first_content_seconds' in report:
+            st.write(f"**Time to first content:** {report['first_content_seconds']:.1f}s")
+        if report and 'generation_groups' in report:
+            st.write(
+                f"**Concurrent generation:** {report['generation_groups']} variable groups "
+                f"in {report['generation_seconds']:.1f}s"
+            )
+        
+        if report and report.get('routing') and 'document_id' in report:
+            savings = routing_savings(
+                usage_tracker.records(document_id=report['document_id']), since=report.get('routing_started')
+            )
+            tiers = ", ".join(f"{len(variables)} on {model}" for model, variables in report['routing'].items())
+            cost_note = (
+                f"saved ~${savings['cost_saved_usd']:.4f}" if savings['cost_saved_usd'] >= 0
+                else f"cost ~${-savings['cost_saved_usd']:.4f} more"
+            )
+            latency_note = (
+                f" and ~{savings['latency_saved_seconds']:.1f}s of generation time"
+                if savings['latency_saved_seconds'] > 0 else ""
+            )
+            st.write(f"**Model routing:** {tiers}; {cost_note}{latency_note} compared to the pro model")
+        
+        # Token, latency and cost accounting for this document and the whole session
+        usage_scopes = []
+        if report and 'document_id' in report:
+            usage_scopes.append(("This document", usage_tracker.summary(document_id=report['document_id'])))
+        if st.session_state.get('session_id'):
+            usage_scopes.append(("This session", usage_tracker.summary(session_id=st.session_state.session_id)))
+        for label, usage in usage_scopes:
+            if usage['calls']:
+                st.write(
+                    f"**LLM usage ({label.lower()}):** {usage['calls']} calls ({usage['cached_calls']} cached, "
+                    f"{usage['failed_calls']} failed), {usage['prompt_tokens']:,} prompt + "
+                    f"{usage['output_tokens']:,} output tokens, {usage['total_latency_seconds']:.1f}s of model time "
+                    f"({usage['wait_seconds']:.1f}s queued), ~${usage['cost_usd']:.4f}"
+                )
+        if usage_scopes and usage_scopes[0][1]['by_model']:
+            st.dataframe(
+                [{"model": model, **totals} for model, totals in usage_scopes[0][1]['by_model'].items()],
+                hide_index=True
+            )
+        
+        # A locked or unreadable cache database only hides its panel
+        try:
+            cache_stats = response_cache.stats()
+        except Exception as e:
+            logger.error(f"Error reading AI response cache stats: {str(e)}")
+            cache_stats = None
+        if cache_stats and cache_stats['hits'] + cache_stats['misses']:
+            st.write(
+                f"**AI response cache:** {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                f"({cache_stats['hit_rate']:.0%} hit rate), {cache_stats['entries']} entries, "
+                f"{cache_stats['bytes'] / (1024 * 1024):.1f} MB"
+            )
+        
+        try:
+            search_stats = search_cache.stats()
+        except Exception as e:
+            logger.error(f"Error reading web search cache stats: {str(e)}")
+            search_stats = None
+        if search_stats and search_stats['hits'] + search_stats['coalesced'] + search_stats['misses']:
+            st.write(
+                f"**Web search cache:** {search_stats['hits']} hits, {search_stats['coalesced']} shared in-flight, "
+                f"{search_stats['misses']} API calls ({search_stats['hit_rate']:.0%} hit rate), "
+                f"{search_stats['entries']} cached queries"
+            )
+        
+        limiter = rate_limiter.metrics()
+        if limiter['requests']:
+            st.write(
+                f"**Gemini rate limiting:** {limiter['requests']} requests, {limiter['waited_requests']} queued "
+                f"(average wait {limiter['average_wait_seconds']:.1f}s, max {limiter['max_wait_seconds']:.1f}s), "
+                f"{limiter['retries']} retries, {limiter['queue_depth']} waiting now"
+            )
     
     # Show sources if applicable
     if st.session_state.knowledge_source == "Search the Web" and st.session_state.search_results:
@@ -1,13 +1,16 @@
+import time
+import contextlib
 import streamlit as st
 
 # Import utilities
 from utils.template_manager import (
     display_template_preview,
-    extract_variables_from_template
+    extract_variables_from_template,
+    render_partial_template
 )
 from utils.web_tools import (
     search_web, 
-    scrape_webpage, 
+    scrape_webpages, 
     format_source_data
 )
 from utils.ai_tools import generate_document_with_gemini
@@ -15,6 +18,23 @@ from utils.rag_tools import (
     generate_rag_content,
     create_rag_from_scraped_content
 )
+from utils.knowledge_base import load_manifest
+from utils.dedup import deduplicate_scraped_content
+from utils.llm_cache import bypass as bypass_response_cache
+from utils.llm_usage import new_usage_id, usage_scope
+from utils.section_generation import VARIABLE_GROUP_SIZE
+from utils.model_routing import ModelRouter, FAST_MODEL, PRO_MODEL
+from utils.reranking import DEFAULT_MMR_LAMBDA
+from utils.context_packer import DEFAULT_RAG_BUDGET, context_budget, pack_source_text
+from utils.summarization import summarize_source
+from utils.tokens import estimate_tokens
+
+# Retrieval engines offered for RAG generation
+RETRIEVAL_METHODS = {
+    "TF-IDF": "tfidf",
+    "BM25 (Inverted Index)": "bm25",
+    "Dense Vectors (Local ANN)": "dense",
+}
 
 def render_verify_page():
     """Render the verification page."""
@@ -42,15 +62,26 @@ def render_verify_page():
                     st.error("Could not find relevant information. Please try a different query.")
                     st.stop()
                 
-                # Scrape content from search results
-                scraped_contents = []
+                # Scrape all search results concurrently, reporting pages as they complete
                 progress_bar = st.progress(0)
+                scraped_count = 0
                 
-                for i, result in enumerate(search_results):
-                    st.write(f"Scraping: {result['title']}")
-                    content = scrape_webpage(result["link"])
-                    scraped_contents.append(content)
-                    progress_bar.progress((i + 1) / len(search_results))
+                def show_page(i, url, content):
+                    nonlocal scraped_count
+                    scraped_count += 1
+                    st.write(f"Scraped: {search_results[i]['title']}")
+                    progress_bar.progress(scraped_count / len(search_results))
+                
+                scraped_contents = scrape_webpages([result["link"] for result in search_results], on_page=show_page)
+                
+                # Drop mirrored pages and repeated passages before they are chunked and sent to Gemini
+                search_results, scraped_contents, dedup_stats = deduplicate_scraped_content(search_results, scraped_contents)
+                if dedup_stats["characters_removed"]:
+                    st.info(
+                        f"Removed {dedup_stats['pages_removed']} duplicate pages and "
+                        f"{dedup_stats['passages_removed']} repeated passages "
+                        f"({dedup_stats['characters_removed']:,} characters)"
+                    )
                 
                 # Save search results and scraped contents
                 st.session_state.search_results = search_results
@@ -69,20 +100,114 @@ def render_verify_page():
         else:
             st.error("No knowledge source data available. Please go back and provide a valid document or URL.")
     
+    elif st.session_state.knowledge_source == "Knowledge Base":
+        manifest = load_manifest(st.session_state.knowledge_base) if st.session_state.knowledge_base else None
+        if manifest and manifest["documents"]:
+            with st.expander(f"View Knowledge Base ({len(manifest['documents'])} documents)"):
+                for doc in manifest["documents"]:
+                    st.write(f"**{doc['name']}** ({doc['chunks']} chunks)")
+        else:
+            st.error("The selected knowledge base is empty. Please go back and add documents to it.")
+    
     # Choose content generation method
     st.subheader("Content Generation Method")
-    generation_method = st.radio(
-        "Select content generation method",
-        ["Standard AI Generation", "RAG (Retrieval-Augmented Generation)"],
-        help="RAG improves document relevance by focusing on your knowledge source"
-    )
+    if st.session_state.knowledge_source == "Knowledge Base":
+        # Knowledge bases are too large to paste into a prompt, so they are always retrieved from
+        st.info("Knowledge bases are searched with RAG using their persistent BM25 index.")
+        generation_method = "RAG (Retrieval-Augmented Generation)"
+    else:
+        generation_method = st.radio(
+            "Select content generation method",
+            ["Standard AI Generation", "RAG (Retrieval-Augmented Generation)"],
+            help="RAG improves document relevance by focusing on your knowledge source"
+        )
     
     # Save generation method to session state
     st.session_state.generation_method = generation_method
     
+    # Choose the retrieval engine used by RAG
+    retrieval_method = "tfidf"
+    per_variable = False
+    mmr_lambda = None
+    if generation_method == "RAG (Retrieval-Augmented Generation)":
+        if st.session_state.knowledge_source != "Knowledge Base":
+            retrieval_label = st.radio(
+                "Select retrieval engine",
+                list(RETRIEVAL_METHODS.keys()),
+                help="BM25 and dense vectors use prebuilt indexes that scale better to very large knowledge sources"
+            )
+            retrieval_method = RETRIEVAL_METHODS[retrieval_label]
+        per_variable = st.checkbox(
+            "Retrieve context for each template variable",
+            help="Runs one batched retrieval per template variable so wide templates get focused context"
+        )
+        use_mmr = st.checkbox(
+            "Remove redundant context (MMR re-ranking)",
+            help="Re-ranks retrieved chunks to skip near-duplicates, saving prompt tokens"
+        )
+        if use_mmr:
+            mmr_lambda = st.slider(
+                "Relevance vs. diversity (lambda)",
+                0.0, 1.0, DEFAULT_MMR_LAMBDA, 0.05,
+                help="1.0 ranks purely by relevance; lower values favour more diverse chunks"
+            )
+    st.session_state.retrieval_method = retrieval_method
+    st.session_state.per_variable_retrieval = per_variable
+    
+    # Token budget for the source context included in the prompt
+    is_rag = generation_method == "RAG (Retrieval-Augmented Generation)"
+    # CONTEXT_TOKEN_BUDGET can set the maximum below the usual minimum and default
+    max_budget = context_budget()
+    token_budget = st.number_input(
+        "Context token budget",
+        min_value=min(500, max_budget),
+        max_value=max_budget,
+        value=min(DEFAULT_RAG_BUDGET, max_budget) if is_rag else max_budget,
+        step=500,
+        help="Most relevant source content is packed into this many tokens; the rest is left out of the prompt"
+    )
+    
+    # Sources larger than the budget can be summarized instead of cut down to the most relevant chunks
+    summarize_large_sources = False
+    if not is_rag and st.session_state.knowledge_source in ("Upload Document", "Specific URL"):
+        summarize_large_sources = st.checkbox(
+            "Summarize sources larger than the budget (map-reduce)",
+            help="Summarizes every part of a large document in parallel and combines the summaries into a brief; "
+                 "slower the first time, but nothing is left out, and unchanged parts are not summarized again"
+        )
+    
+    # Wide templates can be generated as several smaller concurrent calls
+    concurrent_sections = st.checkbox(
+        "Generate sections concurrently",
+        help=f"Splits the template variables into groups of {VARIABLE_GROUP_SIZE} generated in parallel; "
+             "faster for wide templates, and a malformed response only affects its own group"
+    )
+    group_size = VARIABLE_GROUP_SIZE if concurrent_sections else None
+    
+    # Short fields such as names and dates do not need the pro model
+    routing_config = st.session_state.get("template_routing") or {}
+    route_models = st.checkbox(
+        f"Route simple fields to {FAST_MODEL}",
+        value=routing_config.get("enabled", False),
+        help=f"Names, dates and other short fields are generated with {FAST_MODEL}; "
+             f"long-form sections stay on {PRO_MODEL}. On by default for templates that opt in "
+             "with \"enabled\": true in templates/index.json"
+    )
+    router = ModelRouter(st.session_state.template_text, {**routing_config, "enabled": True}) if route_models else None
+    
+    # Identical prompts are answered from the shared response cache unless bypassed
+    use_response_cache = st.checkbox(
+        "Reuse cached AI responses",
+        value=True,
+        help="Skips the Gemini call when the exact same prompt was answered before; untick to force fresh content"
+    )
+    
     # Buttons for navigation
     col1, col2, col3 = st.columns(3)
     
+    # Filled in progressively while the document is being generated
+    preview = st.empty()
+    
     with col1:
         if st.button("← Back to Input", key="back_button"):
             st.session_state.page = 'input'
@@ -91,10 +216,29 @@ def render_verify_page():
     with col3:
         # Generate document button
         if st.button("Generate Document →", key="generate_button"):
-            with st.spinner("Generating document..."):
+            cache_mode = contextlib.nullcontext() if use_response_cache else bypass_response_cache()
+            # Every LLM call below is accounted to this session and document
+            document_id = new_usage_id()
+            usage_mode = usage_scope(session_id=st.session_state.get("session_id"), document_id=document_id)
+            with st.spinner("Generating document..."), cache_mode, usage_mode:
                 # Extract variables from template
                 variables = extract_variables_from_template(st.session_state.template_text)
                 
+                # Collects retrieval statistics for the results page
+                generation_report = {"document_id": document_id}
+                
+                # Re-render the template as each variable finishes streaming
+                streamed_content = {}
+                generation_start = time.perf_counter()
+                
+                def show_variable(name, value):
+                    if not streamed_content:
+                        generation_report["first_content_seconds"] = time.perf_counter() - generation_start
+                    streamed_content[name] = value
+                    rendered = render_partial_template(st.session_state.template_text, streamed_content)
+                    if rendered is not None:
+                        preview.markdown(rendered)
+                
                 # Generate document content based on selected method
                 if generation_method == "Standard AI Generation":
                     # Prepare source data
@@ -105,10 +249,31 @@ def render_verify_page():
                         source_data = format_source_data(st.session_state.search_results, st.session_state.scraped_contents)
                     else:
                         # Use uploaded document or specific URL content
-                        source_data = f"## SOURCE DATA:\n\n{st.session_state.knowledge_data}"
+                        knowledge_data = st.session_state.knowledge_data
+                        if summarize_large_sources and estimate_tokens(knowledge_data) > token_budget:
+                            summary_progress = st.progress(0, text="Summarizing source...")
+                            brief = summarize_source(
+                                st.session_state.user_query, knowledge_data, token_budget,
+                                on_progress=lambda done, total: summary_progress.progress(
+                                    done / total, text=f"Summarized {done} of {total} parts"
+                                ),
+                                report=generation_report
+                            )
+                            summary_progress.empty()
+                            source_data = f"## SOURCE BRIEF:\n\n{brief}"
+                        else:
+                            knowledge_data, used_tokens = pack_source_text(
+                                st.session_state.user_query, knowledge_data, token_budget
+                            )
+                            generation_report["context_tokens"] = used_tokens
+                            generation_report["context_budget"] = token_budget
+                            source_data = f"## SOURCE DATA:\n\n{knowledge_data}"
                     
                     # Generate document content with standard method
-                    content_variables = generate_document_with_gemini(st.session_state.user_query, variables, source_data)
+                    content_variables = generate_document_with_gemini(
+                        st.session_state.user_query, variables, source_data,
+                        group_size=group_size, on_variable=show_variable, report=generation_report, router=router
+                    )
                 
                 else:  # RAG method
                     # Generate document content with RAG
@@ -121,14 +286,31 @@ def render_verify_page():
                             st.session_state.search_results,
                             st.session_state.scraped_contents,
                             st.session_state.user_query,
-                            variables
+                            variables,
+                            retrieval_method=retrieval_method,
+                            per_variable=per_variable,
+                            mmr_lambda=mmr_lambda,
+                            token_budget=token_budget,
+                            group_size=group_size,
+                            on_variable=show_variable,
+                            report=generation_report,
+                            router=router
                         )
                     else:
-                        # Use RAG with uploaded document or specific URL
+                        # Use RAG with uploaded document, specific URL or knowledge base
                         content_variables = generate_rag_content(
                             st.session_state.user_query,
                             variables,
-                            st.session_state.knowledge_data
+                            st.session_state.knowledge_data,
+                            retrieval_method=retrieval_method,
+                            per_variable=per_variable,
+                            mmr_lambda=mmr_lambda,
+                            token_budget=token_budget,
+                            group_size=group_size,
+                            on_variable=show_variable,
+                            report=generation_report,
+                            router=router,
+                            knowledge_base=st.session_state.knowledge_base if st.session_state.knowledge_source == "Knowledge Base" else None
                         )
                 
                 # Render the template with generated content
@@ -140,6 +322,7 @@ def render_verify_page():
                     # Save generated document and variables
                     st.session_state.generated_document = generated_document
                     st.session_state.content_variables = content_variables
+                    st.session_state.generation_report = generation_report
                     
                     # Go to results page
                     st.session_state.page = 'results'
@@ -6,6 +6,7 @@ import os
 from components.input_page import render_input_page
 from components.verify_page import render_verify_page
 from components.results_page import render_results_page
+from utils.llm_usage import new_usage_id
 
 # Must be the first Streamlit command
 st.set_page_config(layout="wide", page_title="GenAI Document Generation Bot")
@@ -63,12 +64,15 @@ def sidebar_navigation():
                 # Reset session state
                 st.session_state.user_query = ''
                 st.session_state.template_text = None
+                st.session_state.template_routing = None
                 st.session_state.knowledge_source = None
                 st.session_state.knowledge_data = None
+                st.session_state.knowledge_base = None
                 st.session_state.search_results = None
                 st.session_state.scraped_contents = None
                 st.session_state.generated_document = None
                 st.session_state.content_variables = None
+                st.session_state.generation_report = None
                 st.session_state.page = 'input'
                 st.rerun()
 
@@ -81,10 +85,14 @@ def main():
         st.session_state.user_query = ''
     if 'template_text' not in st.session_state:
         st.session_state.template_text = None
+    if 'template_routing' not in st.session_state:
+        st.session_state.template_routing = None
     if 'knowledge_source' not in st.session_state:
         st.session_state.knowledge_source = None
     if 'knowledge_data' not in st.session_state:
         st.session_state.knowledge_data = None
+    if 'knowledge_base' not in st.session_state:
+        st.session_state.knowledge_base = None
     if 'search_results' not in st.session_state:
         st.session_state.search_results = None
     if 'scraped_contents' not in st.session_state:
@@ -93,6 +101,11 @@ def main():
         st.session_state.generated_document = None
     if 'content_variables' not in st.session_state:
         st.session_state.content_variables = None
+    if 'generation_report' not in st.session_state:
+        st.session_state.generation_report = None
+    if 'session_id' not in st.session_state:
+        # Attributes LLM usage to this browser session
+        st.session_state.session_id = new_usage_id()
     
     # Display sidebar navigation
     sidebar_navigation()
@@ -1,19 +1,17 @@
 import streamlit as st
-import google.generativeai as genai
-import os
-import json
-import re
 import logging
 from jinja2 import Template
 
+from utils.llm_client import DEFAULT_MODEL, generate_text, generate_json_streaming
+from utils.section_generation import generate_in_groups
+from utils.model_routing import generate_routed
+from utils.tokens import estimate_tokens
+from utils.response_processing import process_variables_response, clean_template_response
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Configure Gemini API
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=GOOGLE_API_KEY)
-
 def generate_template_from_search(template_name, source_data):
     """Use Gemini to generate a template based on search results."""
     prompt = f"""
@@ -28,16 +26,10 @@ def generate_template_from_search(template_name, source_data):
     """
     
     try:
-        model = genai.GenerativeModel('gemini-1.5-pro')
-        response = model.generate_content(prompt)
-        generated_template = response.text
-        
-        # Clean up the template to ensure proper Jinja format
-        generated_template = re.sub(r'```jinja2?|```', '', generated_template)
-        generated_template = generated_template.strip()
+        generated_template = generate_text(prompt)
         
-        # Remove any CSS styling that might have been included
-        generated_template = re.sub(r'^body\s*{.*?}\s*h1,\s*h2,\s*h3\s*{.*?}\s*table\s*{.*?}.*?$', '', generated_template, flags=re.MULTILINE)
+        # Clean up the template to ensure proper Jinja format and drop any CSS styling
+        generated_template = clean_template_response(generated_template)
         
         # Validate the template
         try:
@@ -50,8 +42,34 @@ def generate_template_from_search(template_name, source_data):
         logger.error(f"Error generating template: {str(e)}")
         return None
 
-def generate_document_with_gemini(user_query, template_vars, source_data):
-    """Use Gemini to generate content for the document based on user query and sources."""
+def generate_document_with_gemini(user_query, template_vars, source_data, group_size=None, on_variable=None, report=None, router=None, model_name=DEFAULT_MODEL):
+    """Use Gemini to generate content for the document based on user query and sources.
+    
+    With a group_size, variables are generated concurrently in groups of that
+    size. With a ModelRouter, simple fields and long-form sections are
+    generated in separate calls on the fast and pro models. The response is
+    streamed, and on_variable(name, value) is called as soon as each
+    variable's value is complete.
+    """
+    if router is not None:
+        return generate_routed(
+            template_vars,
+            lambda group, emit, model: generate_document_with_gemini(user_query, group, source_data, on_variable=emit, model_name=model),
+            router.assign(template_vars, estimate_tokens(source_data)),
+            group_size,
+            on_variable=on_variable,
+            report=report
+        )
+    
+    if group_size and len(template_vars) > group_size:
+        return generate_in_groups(
+            template_vars,
+            lambda group, emit: generate_document_with_gemini(user_query, group, source_data, on_variable=emit, model_name=model_name),
+            group_size,
+            on_variable=on_variable,
+            report=report
+        )
+    
     prompt = f"""
     Generate content for a document based on the following:
     
@@ -70,51 +88,8 @@ def generate_document_with_gemini(user_query, template_vars, source_data):
     """
     
     try:
-        model = genai.GenerativeModel('gemini-1.5-pro')
-        response = model.generate_content(prompt)
-        
-        # Extract JSON from response
-        content = response.text
-        
-        # Try to find JSON in the response
-        json_match = re.search(r'```json\s*([\s\S]*?)\s*```', content)
-        if json_match:
-            json_str = json_match.group(1)
-        else:
-            # Assume the entire response is JSON
-            json_str = content
-            
-        # Clean up the JSON string
-        json_str = json_str.strip()
-        
-        # Parse JSON
-        try:
-            variables = json.loads(json_str)
-            
-            # Clean up any markdown formatting from the content
-            for key in variables:
-                if isinstance(variables[key], str):
-                    # Remove markdown headings, bold, italic, etc.
-                    variables[key] = re.sub(r'^#+\s+', '', variables[key], flags=re.MULTILINE)  # Remove heading markers
-                    variables[key] = re.sub(r'\*\*(.*?)\*\*', r'\1', variables[key])  # Remove bold
-                    variables[key] = re.sub(r'\*(.*?)\*', r'\1', variables[key])  # Remove italic
-                    variables[key] = re.sub(r'`(.*?)`', r'\1', variables[key])  # Remove code ticks
-                    variables[key] = re.sub(r'```.*?```', '', variables[key], flags=re.DOTALL)  # Remove code blocks
-                    variables[key] = re.sub(r'<[^>]*>', '', variables[key])  # Remove HTML tags
-            
-            return variables
-        except json.JSONDecodeError:
-            # If parsing fails, try to create a JSON object manually
-            variables = {}
-            for var in template_vars:
-                pattern = fr'["\']?{var}["\']?\s*:\s*["\']([^"\']+)["\']'
-                match = re.search(pattern, json_str)
-                if match:
-                    variables[var] = match.group(1)
-                else:
-                    variables[var] = f"[Content for {var} not found]"
-            return variables
-            
+        content = generate_json_streaming(prompt, on_variable, model_name=model_name)
+        return process_variables_response(content, template_vars)
     except Exception as e:
         logger.error(f"Error generating content with Gemini: {str(e)}")
         return {var: f"[Error generating content for {var}]" for var in template_vars}
\ No newline at end of file
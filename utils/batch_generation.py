@@ -0,0 +1,376 @@
+import os
+import re
+import csv
+import json
+import time
+import hashlib
+import logging
+import zipfile
+import threading
+import contextvars
+from io import BytesIO, StringIO
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from jinja2 import Template
+
+from utils.ai_tools import generate_document_with_gemini
+from utils.rag_tools import generate_rag_content, load_or_build_index
+from utils.knowledge_base import load_knowledge_base_index, load_manifest
+from utils.context_packer import DEFAULT_RAG_BUDGET, context_budget, pack_source_text
+from utils.template_manager import get_template_content, get_template_routing, extract_variables_from_template
+from utils.model_routing import ModelRouter
+from utils.document_processing import (
+    extract_text_from_pdf,
+    extract_text_from_docx,
+    extract_text_from_txt,
+    markdown_to_html,
+    html_to_docx
+)
+from utils.pdf_tools import markdown_to_pdf_weasyprint
+from utils.llm_usage import new_usage_id, usage_scope, usage_tracker
+from utils.tokens import estimate_tokens
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rows generated at the same time
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+# Manifest columns that configure a row rather than override a template variable
+RESERVED_COLUMNS = ("id", "query", "knowledge_file", "knowledge_base")
+
+EXPORT_FORMATS = ("md", "pdf", "docx")
+GENERATION_METHODS = ("standard", "rag")
+
+# Columns of the per-row status report
+REPORT_FIELDS = [
+    "id", "status", "error", "files", "missing_variables", "seconds",
+    "llm_calls", "prompt_tokens", "output_tokens", "cost_usd"
+]
+
+# Placeholders left by the generators for variables they could not produce
+PLACEHOLDER = re.compile(r'^\[(?:Error generating content|Content) for \w+')
+
+def safe_row_id(value):
+    """Turn a manifest id into a file-name-safe identifier."""
+    return re.sub(r'[^\w-]+', '_', str(value)).strip('_') or "row"
+
+def read_batch_manifest(path):
+    """Read a CSV or JSONL manifest into [{id, query, knowledge_file, knowledge_base, variables}].
+
+    Every column (or JSON key) that is not reserved is a template variable
+    override; empty values are ignored. JSONL rows may also group overrides
+    under a "variables" object.
+    """
+    path = Path(path)
+    if path.suffix.lower() in (".jsonl", ".ndjson"):
+        with open(path, 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            records = list(csv.DictReader(f))
+
+    rows = []
+    seen = set()
+    for n, record in enumerate(records, 1):
+        variables = dict(record.pop("variables", None) or {})
+        variables.update((key, value) for key, value in record.items() if key not in RESERVED_COLUMNS)
+        row = {
+            "id": safe_row_id(record.get("id") or f"row-{n:04d}"),
+            "query": (record.get("query") or "").strip(),
+            "knowledge_file": (record.get("knowledge_file") or "").strip() or None,
+            "knowledge_base": (record.get("knowledge_base") or "").strip() or None,
+            "variables": {
+                key: value for key, value in variables.items()
+                if key and value is not None and str(value).strip() != ""
+            },
+        }
+        if row["id"] in seen:
+            raise ValueError(f"Duplicate row id '{row['id']}' in {path}")
+        seen.add(row["id"])
+        rows.append(row)
+    return rows
+
+def read_knowledge_file(path):
+    """Extract the text of a PDF, DOCX or text file on disk."""
+    path = Path(path)
+    data = BytesIO(path.read_bytes())
+    suffix = path.suffix.lower()
+    if suffix == ".pdf":
+        return extract_text_from_pdf(data)
+    if suffix == ".docx":
+        return extract_text_from_docx(data)
+    return extract_text_from_txt(data)
+
+def export_document(markdown_text, fmt):
+    """Return the document as bytes in one of EXPORT_FORMATS, or None if conversion failed."""
+    if fmt == "md":
+        return markdown_text.encode("utf-8")
+    if fmt == "pdf":
+        return markdown_to_pdf_weasyprint(markdown_text)
+    if fmt == "docx":
+        return html_to_docx(markdown_to_html(markdown_text))
+    raise ValueError(f"Unknown export format '{fmt}'; expected one of {', '.join(EXPORT_FORMATS)}")
+
+def row_fingerprint(row, template_text, settings, knowledge=None):
+    """Hash everything that affects a row's output, so resumed runs only skip unchanged rows.
+
+    knowledge holds digests of the row's knowledge file text and knowledge
+    base contents, so editing a source regenerates the rows that use it.
+    """
+    payload = json.dumps(
+        {"row": row, "template": template_text, "settings": settings, "knowledge": knowledge or {}},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class BatchRunner:
+    """Generates and exports one document per manifest row into a work directory.
+
+    Each completed row is appended to status.jsonl, so an interrupted run
+    picks up where it stopped: rows that already succeeded with the same
+    inputs are skipped. Knowledge files are read once and their retrieval
+    indexes built once before any row starts; rows then share the on-disk
+    index cache and the LLM response cache.
+    """
+
+    def __init__(self, template_name, output_dir, formats=("md",), method="standard", retrieval_method="bm25",
+                 knowledge_file=None, knowledge_base=None, token_budget=None, group_size=None,
+                 route_models=True, concurrency=BATCH_CONCURRENCY):
+        template_text = get_template_content(template_name)
+        if template_text is None:
+            raise ValueError(f"Template '{template_name}' not found")
+        for fmt in formats:
+            if fmt not in EXPORT_FORMATS:
+                raise ValueError(f"Unknown export format '{fmt}'; expected one of {', '.join(EXPORT_FORMATS)}")
+        if method not in GENERATION_METHODS:
+            raise ValueError(f"Unknown generation method '{method}'; expected one of {', '.join(GENERATION_METHODS)}")
+
+        self.template_name = template_name
+        self.template_text = template_text
+        self.variables = extract_variables_from_template(template_text)
+        self.output_dir = Path(output_dir)
+        self.documents_dir = self.output_dir / "documents"
+        self.status_path = self.output_dir / "status.jsonl"
+        self.formats = list(formats)
+        self.method = method
+        self.retrieval_method = retrieval_method
+        self.knowledge_file = knowledge_file
+        self.knowledge_base = knowledge_base
+        self.token_budget = token_budget or (DEFAULT_RAG_BUDGET if method == "rag" else context_budget())
+        self.group_size = group_size
+        # Only templates that opt in are routed, so --no-routing and an opted-out template fingerprint alike
+        router = ModelRouter(template_text, get_template_routing(template_name))
+        self.router = router if route_models and router.enabled else None
+        self.route_models = self.router is not None
+        self.concurrency = concurrency
+        self.batch_id = new_usage_id()
+        self._knowledge = {}
+        self._knowledge_digests = {}
+        self._lock = threading.Lock()
+
+    @property
+    def settings(self):
+        return {
+            "formats": self.formats,
+            "method": self.method,
+            "retrieval_method": self.retrieval_method,
+            "knowledge_file": self.knowledge_file,
+            "knowledge_base": self.knowledge_base,
+            "token_budget": self.token_budget,
+            "group_size": self.group_size,
+            "route_models": self.route_models,
+        }
+
+    def load_status(self):
+        """Return the latest status record of each row id from a previous run."""
+        statuses = {}
+        if self.status_path.exists():
+            with open(self.status_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A line cut off by an interrupted run
+                        continue
+                    statuses[record["id"]] = record
+        return statuses
+
+    def _save_status(self, record):
+        with self._lock:
+            with open(self.status_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + "\n")
+
+    def _is_done(self, previous, fingerprint):
+        # Partial and failed rows are retried
+        return (
+            previous is not None
+            and previous["status"] == "ok"
+            and previous.get("fingerprint") == fingerprint
+            and all((self.documents_dir / name).exists() for name in previous["files"].split(";") if name)
+        )
+
+    def read_knowledge(self, rows):
+        """Read every knowledge file once and record digests of the knowledge file texts and knowledge bases."""
+        paths = {row["knowledge_file"] or self.knowledge_file for row in rows} - {None}
+        for path in sorted(paths - set(self._knowledge)):
+            text = read_knowledge_file(path)
+            if not text:
+                raise ValueError(f"No text could be extracted from knowledge file '{path}'")
+            self._knowledge[path] = text
+            self._knowledge_digests[("file", path)] = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        bases = {row["knowledge_base"] or self.knowledge_base for row in rows} - {None}
+        for name in sorted(bases):
+            manifest = load_manifest(name)
+            document_hashes = sorted(doc["hash"] for doc in manifest["documents"]) if manifest else []
+            self._knowledge_digests[("base", name)] = hashlib.sha256("\n".join(document_hashes).encode("utf-8")).hexdigest()
+
+    def knowledge_digest(self, row):
+        """Return the digests of the knowledge sources a row uses."""
+        path = row["knowledge_file"] or self.knowledge_file
+        name = row["knowledge_base"] or self.knowledge_base
+        return {
+            "knowledge_file": self._knowledge_digests.get(("file", path)),
+            "knowledge_base": self._knowledge_digests.get(("base", name)),
+        }
+
+    def prepare_knowledge(self, rows):
+        """Build the retrieval index of every knowledge file and base once, before rows run concurrently."""
+        self.read_knowledge(rows)
+        paths = {row["knowledge_file"] or self.knowledge_file for row in rows} - {None}
+        for path in sorted(paths):
+            text = self._knowledge[path]
+            if self.method == "rag":
+                load_or_build_index(text, self.retrieval_method)
+            elif estimate_tokens(text) > self.token_budget:
+                # Used by pack_source_text to pick the relevant chunks
+                load_or_build_index(text, "bm25")
+        bases = {row["knowledge_base"] or self.knowledge_base for row in rows} - {None}
+        for name in sorted(bases):
+            if self.method != "rag":
+                raise ValueError("Knowledge bases can only be used with the rag method")
+            if load_knowledge_base_index(name) is None:
+                raise ValueError(f"Knowledge base '{name}' is empty or does not exist")
+
+    def generate(self, row):
+        """Return the {variable: content} for one row, generating only variables without an override."""
+        overrides = row["variables"]
+        to_generate = [var for var in self.variables if var not in overrides]
+        knowledge_path = row["knowledge_file"] or self.knowledge_file
+        knowledge_data = self._knowledge.get(knowledge_path)
+        knowledge_base = row["knowledge_base"] or self.knowledge_base
+
+        content = {}
+        if to_generate:
+            if not row["query"]:
+                raise ValueError("Row has no query and does not override every template variable")
+            if self.method == "rag":
+                if not knowledge_data and not knowledge_base:
+                    raise ValueError("The rag method needs a knowledge file or knowledge base")
+                content = generate_rag_content(
+                    row["query"], to_generate, knowledge_data,
+                    retrieval_method=self.retrieval_method,
+                    token_budget=self.token_budget,
+                    group_size=self.group_size,
+                    knowledge_base=knowledge_base,
+                    router=self.router
+                )
+            else:
+                source_data = ""
+                if knowledge_data:
+                    packed, _ = pack_source_text(row["query"], knowledge_data, self.token_budget)
+                    source_data = f"## SOURCE DATA:\n\n{packed}"
+                content = generate_document_with_gemini(
+                    row["query"], to_generate, source_data, group_size=self.group_size, router=self.router
+                )
+            for var in to_generate:
+                content.setdefault(var, f"[Content for {var} not found]")
+        content.update(overrides)
+        return content
+
+    def run_row(self, row, fingerprint):
+        """Generate, render and export one row; returns its status record."""
+        start = time.perf_counter()
+        document_id = f"{self.batch_id}:{row['id']}"
+        record = {"id": row["id"], "fingerprint": fingerprint, "status": "ok", "error": "", "files": "", "missing_variables": 0}
+        try:
+            with usage_scope(session_id=self.batch_id, document_id=document_id):
+                content = self.generate(row)
+            record["missing_variables"] = sum(
+                1 for var in self.variables if isinstance(content.get(var), str) and PLACEHOLDER.match(content[var])
+            )
+            document = Template(self.template_text).render(**content)
+
+            files = []
+            for fmt in self.formats:
+                data = export_document(document, fmt)
+                if not data:
+                    raise RuntimeError(f"Could not export {fmt.upper()}")
+                name = f"{row['id']}.{fmt}"
+                (self.documents_dir / name).write_bytes(data)
+                files.append(name)
+            record["files"] = ";".join(files)
+            if record["missing_variables"]:
+                record["status"] = "partial"
+        except Exception as e:
+            logger.error(f"Error generating batch row {row['id']}: {str(e)}")
+            record["status"] = "error"
+            record["error"] = str(e)
+
+        usage = usage_tracker.summary(document_id=document_id)
+        record.update(
+            seconds=round(time.perf_counter() - start, 2),
+            llm_calls=usage["calls"],
+            prompt_tokens=usage["prompt_tokens"],
+            output_tokens=usage["output_tokens"],
+            cost_usd=round(usage["cost_usd"], 6),
+        )
+        self._save_status(record)
+        return record
+
+    def run(self, rows, on_row=None):
+        """Run every row not already completed; returns the status records in manifest order.
+
+        on_row(record, done, total) is called from the calling thread as rows finish.
+        """
+        self.documents_dir.mkdir(parents=True, exist_ok=True)
+        previous = self.load_status()
+        results = {}
+        pending = []
+        # Fingerprints cover the knowledge sources' current contents, so they are read first
+        self.read_knowledge(rows)
+        for row in rows:
+            fingerprint = row_fingerprint(row, self.template_text, self.settings, self.knowledge_digest(row))
+            if self._is_done(previous.get(row["id"]), fingerprint):
+                results[row["id"]] = previous[row["id"]]
+            else:
+                pending.append((row, fingerprint))
+        logger.info(f"Batch {self.batch_id}: {len(pending)} rows to generate, {len(results)} already done")
+
+        self.prepare_knowledge([row for row, _ in pending])
+        with ThreadPoolExecutor(max_workers=max(1, self.concurrency), thread_name_prefix="batch") as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, self.run_row, row, fingerprint)
+                for row, fingerprint in pending
+            ]
+            for done, future in enumerate(as_completed(futures), 1):
+                record = future.result()
+                results[record["id"]] = record
+                if on_row:
+                    on_row(record, done, len(futures))
+        return [results[row["id"]] for row in rows]
+
+    def write_zip(self, records, zip_path):
+        """Write the exported documents and a report.csv of the row statuses to a ZIP archive."""
+        report = StringIO()
+        writer = csv.DictWriter(report, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(records)
+        with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for record in records:
+                for name in record["files"].split(";"):
+                    if name and (self.documents_dir / name).exists():
+                        archive.write(self.documents_dir / name, f"documents/{name}")
+            archive.writestr("report.csv", report.getvalue())
+        return zip_path
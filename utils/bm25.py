@@ -0,0 +1,184 @@
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+
+# Hashed term space: stateless, so indexes never need a fitted vocabulary
+N_FEATURES = 2 ** 20
+
+# Standard Okapi BM25 parameters
+DEFAULT_K1 = 1.5
+DEFAULT_B = 0.75
+
+_vectorizer = HashingVectorizer(
+    n_features=N_FEATURES,
+    alternate_sign=False,
+    norm=None,
+    strip_accents='unicode',
+    dtype=np.float32
+)
+
+def term_counts(texts):
+    """Return a (documents x hashed terms) CSR matrix of raw term counts."""
+    return _vectorizer.transform(texts)
+
+def query_term_ids(query):
+    """Return the unique hashed term ids of a query."""
+    return np.unique(_vectorizer.transform([query]).indices)
+
+def top_k_indices(scores, top_k):
+    """Return the indices of the top_k highest scores, best first, without a full sort."""
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k < len(scores):
+        candidates = np.argpartition(scores, -top_k)[-top_k:]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+def top_k_per_column(scores, top_k):
+    """Return a (top_k x columns) array of row indices, best first, for a dense score matrix."""
+    top_k = min(top_k, scores.shape[0])
+    if top_k <= 0:
+        return np.empty((0, scores.shape[1]), dtype=np.int64)
+    if top_k < scores.shape[0]:
+        candidates = np.argpartition(scores, -top_k, axis=0)[-top_k:]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[0])[:, None], scores.shape)
+    order = np.argsort(np.take_along_axis(scores, candidates, axis=0), axis=0)[::-1]
+    return np.take_along_axis(candidates, order, axis=0)
+
+def bm25_idf(document_frequency, n_docs):
+    """Okapi BM25 inverse document frequency (always non-negative)."""
+    return np.log1p((n_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+
+def bm25_weights(tf, doc_lengths, idf, avgdl, k1=DEFAULT_K1, b=DEFAULT_B):
+    """BM25 contribution of one term to each posting."""
+    norm = k1 * (1.0 - b + b * doc_lengths / avgdl)
+    return idf * tf * (k1 + 1.0) / (tf + norm)
+
+class BM25Index:
+    """Inverted index over hashed terms scored with Okapi BM25.
+
+    Postings are stored term-major (CSC layout), so a query only touches the
+    postings of its own terms instead of every chunk in the corpus.
+    """
+
+    engine = "bm25"
+
+    def __init__(self, indptr, doc_ids, tf, doc_lengths, k1=DEFAULT_K1, b=DEFAULT_B):
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tf = tf
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.n_docs = len(doc_lengths)
+        self.avgdl = float(np.mean(doc_lengths)) if self.n_docs else 0.0
+
+    @classmethod
+    def build(cls, chunks, k1=DEFAULT_K1, b=DEFAULT_B):
+        """Build the index from an iterable of chunk strings."""
+        counts = term_counts(chunks)
+        doc_lengths = np.asarray(counts.sum(axis=1), dtype=np.float32).ravel()
+        postings = counts.tocsc()
+        postings.sort_indices()
+        return cls(
+            postings.indptr.astype(np.int64),
+            postings.indices.astype(np.int32),
+            postings.data.astype(np.float32),
+            doc_lengths,
+            k1=k1,
+            b=b
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        """Rebuild the index from (memory-mapped) cached arrays."""
+        return cls(
+            arrays["postings_indptr"],
+            arrays["postings_docs"],
+            arrays["postings_tf"],
+            arrays["doc_lengths"],
+            k1=meta.get("k1", DEFAULT_K1),
+            b=meta.get("b", DEFAULT_B)
+        )
+
+    def to_arrays(self):
+        """Return (arrays, metadata) suitable for utils.index_cache.save_index."""
+        arrays = {
+            "postings_indptr": self.indptr,
+            "postings_docs": self.doc_ids,
+            "postings_tf": self.tf,
+            "doc_lengths": self.doc_lengths,
+        }
+        return arrays, {"engine": self.engine, "k1": self.k1, "b": self.b}
+
+    def score(self, term_ids):
+        """Return (candidate doc ids, BM25 scores) for the given query term ids."""
+        docs = []
+        weights = []
+        for term in term_ids:
+            start, end = self.indptr[term], self.indptr[term + 1]
+            if start == end:
+                continue
+            df = end - start
+            posting_docs = self.doc_ids[start:end]
+            idf = bm25_idf(df, self.n_docs)
+            docs.append(posting_docs)
+            weights.append(bm25_weights(
+                self.tf[start:end], self.doc_lengths[posting_docs], idf, self.avgdl, self.k1, self.b
+            ))
+
+        if not docs:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # Accumulate per-document scores over the matched postings only
+        candidates, inverse = np.unique(np.concatenate(docs), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights))
+        return candidates, scores
+
+    def search(self, query, top_k=3):
+        """Return [(chunk index, score)] for the top_k chunks matching the query."""
+        candidates, scores = self.score(query_term_ids(query))
+        best = top_k_indices(scores, top_k)
+        return [(int(candidates[i]), float(scores[i])) for i in best]
+
+    def search_batch(self, queries, top_k=3):
+        """Score several queries with one sparse-dense multiply; returns one hit list per query."""
+        query_matrix = term_counts(queries)
+        query_matrix.data[:] = 1.0
+        terms = np.unique(query_matrix.indices)
+        if len(terms) == 0 or self.n_docs == 0:
+            return [[] for _ in queries]
+
+        # Gather the BM25-weighted postings of every query term into a (docs x terms) matrix
+        columns = []
+        rows = []
+        weights = []
+        for column, term in enumerate(terms):
+            start, end = self.indptr[term], self.indptr[term + 1]
+            if start == end:
+                continue
+            posting_docs = self.doc_ids[start:end]
+            rows.append(posting_docs)
+            columns.append(np.full(end - start, column, dtype=np.int32))
+            weights.append(bm25_weights(
+                self.tf[start:end], self.doc_lengths[posting_docs],
+                bm25_idf(end - start, self.n_docs), self.avgdl, self.k1, self.b
+            ))
+        if not rows:
+            return [[] for _ in queries]
+        weight_matrix = sparse.csr_matrix(
+            (np.concatenate(weights), (np.concatenate(rows), np.concatenate(columns))),
+            shape=(self.n_docs, len(terms))
+        )
+
+        # (docs x terms) @ (terms x queries) -> dense (docs x queries) scores
+        query_dense = query_matrix[:, terms].T.toarray()
+        scores = weight_matrix @ query_dense
+        best = top_k_per_column(scores, top_k)
+        return [
+            [(int(i), float(scores[i, q])) for i in best[:, q] if scores[i, q] > 0]
+            for q in range(len(queries))
+        ]
@@ -0,0 +1,172 @@
+import re
+import logging
+
+import lxml.html
+from lxml import etree
+from bs4 import UnicodeDammit
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Part of the scraped page cache key, so cached text from another extractor is not reused
+EXTRACTOR_VERSION = "main-1"
+
+# Elements that never hold article text
+REMOVED_TAGS = [
+    "script", "style", "noscript", "template", "iframe", "object", "embed", "svg", "canvas",
+    "form", "button", "input", "select", "textarea", "nav", "header", "footer", "aside", "menu", "dialog"
+]
+
+# class/id words of navigation, banners and other page furniture
+BOILERPLATE = re.compile(
+    r'(?:^|[\s_-])(?:cookie|consent|gdpr|banner|nav|navbar|menu|breadcrumbs?|footer|header|masthead|sidebar|'
+    r'widget|share|sharing|social|comments?|related|recommended|promo|advert|ads?|sponsor|newsletter|'
+    r'subscribe|signup|popup|modal|overlay|skip|toolbar|pagination|pager|disclaimer|legal)(?:$|[\s_-])',
+    re.IGNORECASE
+)
+
+# Elements scored as paragraphs; a div counts too when it has no block-level children
+PARAGRAPH_TAGS = {"p", "pre", "blockquote", "li", "dd", "td", "h1", "h2", "h3", "h4", "h5", "h6"}
+
+# Elements that start a new line in the extracted text
+BLOCK_TAGS = PARAGRAPH_TAGS | {
+    "div", "section", "article", "main", "table", "tr", "ul", "ol", "dl", "dt", "figure", "figcaption", "br", "hr"
+}
+
+# Paragraphs shorter than this are not scored
+MIN_PARAGRAPH_CHARS = 25
+
+# Below this many characters of main content, the whole cleaned page is returned instead
+MIN_CONTENT_CHARS = 200
+
+def _text_length(text):
+    return len(" ".join(text.split()))
+
+def _remove_boilerplate(root):
+    """Drop non-content elements and elements whose class or id marks them as page furniture."""
+    for el in list(root.iter(*REMOVED_TAGS)):
+        if el.getparent() is not None:
+            el.drop_tree()
+    page_chars = _text_length(root.text_content())
+    for el in root.xpath("//*[@class or @id]"):
+        if el.tag in ("html", "body", "article", "main") or el.getparent() is None:
+            continue
+        if not BOILERPLATE.search(f"{el.get('class', '')} {el.get('id', '')}"):
+            continue
+        # A wrapper such as "page has-sidebar" can hold the article itself
+        chars, link_density, _ = _block_stats(el)
+        if chars > page_chars / 2 and link_density < 0.3:
+            continue
+        el.drop_tree()
+    for el in list(root.iter(etree.Comment, etree.ProcessingInstruction)):
+        if el.getparent() is not None:
+            el.drop_tree()
+
+def _is_paragraph(el):
+    if el.tag in PARAGRAPH_TAGS:
+        return True
+    return el.tag == "div" and not any(child.tag in BLOCK_TAGS and child.tag != "br" for child in el)
+
+def _block_stats(el):
+    """Return (characters, link density, text density) of an element.
+
+    Text density is characters per descendant element, which is low for
+    menus and link lists and high for running prose.
+    """
+    chars = _text_length(el.text_content())
+    if not chars:
+        return 0, 1.0, 0.0
+    link_chars = sum(_text_length(a.text_content()) for a in el.iter("a"))
+    tags = sum(1 for _ in el.iterdescendants())
+    return chars, min(link_chars / chars, 1.0), chars / (tags + 1)
+
+def score_blocks(root):
+    """Score candidate containers by the paragraphs they hold.
+
+    Each paragraph scores by its length and commas, scaled down by its link
+    density and by a low text density; the score goes to its parent and
+    half of it to its grandparent. A container's total is then scaled by
+    its own link density. Returns {element: score}.
+    """
+    scores = {}
+    for el in root.iter():
+        if not isinstance(el.tag, str) or not _is_paragraph(el):
+            continue
+        chars, link_density, text_density = _block_stats(el)
+        if chars < MIN_PARAGRAPH_CHARS:
+            continue
+        text = el.text_content()
+        score = (1 + text.count(",") + min(chars / 100, 3)) * (1 - link_density) * min(text_density / 20, 1)
+        parent = el.getparent()
+        if parent is None:
+            continue
+        scores[parent] = scores.get(parent, 0) + score
+        grandparent = parent.getparent()
+        if grandparent is not None:
+            scores[grandparent] = scores.get(grandparent, 0) + score / 2
+    for el in scores:
+        scores[el] *= 1 - _block_stats(el)[1]
+    return scores
+
+def _select_content(scores):
+    """Return the best container and the sibling containers that score close to it, in document order."""
+    best = max(scores, key=scores.get)
+    parent = best.getparent()
+    if parent is None:
+        return [best]
+    threshold = max(10, scores[best] * 0.2)
+    selected = []
+    for sibling in parent:
+        if sibling is best:
+            selected.append(sibling)
+        elif scores.get(sibling, 0) >= threshold:
+            selected.append(sibling)
+        elif isinstance(sibling.tag, str) and sibling.tag == "p":
+            chars, link_density, _ = _block_stats(sibling)
+            if chars >= 80 and link_density < 0.25:
+                selected.append(sibling)
+    return selected
+
+def _element_text(el):
+    """Text of an element with a line break around each block-level element and link-heavy blocks left out."""
+    for block in list(el.iter(*BLOCK_TAGS)):
+        if block is not el and block.tag not in ("br", "hr") and block.getparent() is not None:
+            chars, link_density, _ = _block_stats(block)
+            if chars and link_density > 0.5:
+                block.drop_tree()
+                continue
+        block.tail = "\n" + (block.tail or "")
+        if block.tag not in ("br", "hr"):
+            block.text = "\n" + (block.text or "")
+    lines = (" ".join(line.split()) for line in el.text_content().splitlines())
+    return "\n".join(line for line in lines if line)
+
+def parse_html(html, encoding=None):
+    """Parse HTML given as text, or as bytes in encoding (detected from the markup when None)."""
+    if isinstance(html, bytes):
+        html = UnicodeDammit(html, [encoding] if encoding else [], is_html=True).unicode_markup
+    # lxml refuses text that still carries an XML encoding declaration
+    html = re.sub(r'^\s*<\?xml[^>]*\?>', '', html)
+    return lxml.html.document_fromstring(html or "<html></html>")
+
+def extract_main_content(html, encoding=None):
+    """Extract the main article text of an HTML page, without navigation, banners and footers.
+
+    Boilerplate elements are removed, the remaining blocks are scored by
+    text and link density, and the text of the best-scoring container and
+    its strong siblings is returned, one block per line. Pages without a
+    clear main block fall back to all of their cleaned text.
+    """
+    root = parse_html(html, encoding)
+    _remove_boilerplate(root)
+    body = root.find("body")
+    if body is None:
+        body = root
+
+    scores = score_blocks(body)
+    if scores:
+        content = "\n".join(_element_text(el) for el in _select_content(scores))
+        if len(content) >= MIN_CONTENT_CHARS:
+            return content
+    return _element_text(body)
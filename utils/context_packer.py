@@ -0,0 +1,122 @@
+import os
+import re
+import logging
+
+from utils.tokens import CHARS_PER_TOKEN, estimate_tokens
+from utils.llm_client import DEFAULT_MODEL
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tokens of source context allowed per prompt, per model. Kept well below the
+# context window so instructions and the JSON answer always fit, and so that
+# prompt size, latency and cost stay predictable.
+MODEL_CONTEXT_BUDGETS = {
+    "gemini-1.5-pro": 32000,
+    "gemini-1.5-flash": 16000,
+}
+
+# Default budget for RAG prompts, which should stay focused
+DEFAULT_RAG_BUDGET = 2000
+
+# Approximate tokens taken by each chunk's header line in the prompt
+CHUNK_HEADER_TOKENS = 12
+
+# Never add a truncated chunk shorter than this
+MIN_PARTIAL_TOKENS = 50
+
+# Sentence-ending punctuation followed by whitespace
+SENTENCE_END = re.compile(r'[.!?](?=\s)')
+
+def context_budget(model_name=DEFAULT_MODEL):
+    """Return the source-context token budget for a model (overridable with CONTEXT_TOKEN_BUDGET)."""
+    override = os.getenv("CONTEXT_TOKEN_BUDGET")
+    if override:
+        return int(override)
+    return MODEL_CONTEXT_BUDGETS.get(model_name, MODEL_CONTEXT_BUDGETS[DEFAULT_MODEL])
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to at most max_tokens, ending at a sentence boundary where possible."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    limit = max(0, max_tokens * CHARS_PER_TOKEN)
+    head = text[:limit]
+
+    # Prefer the last sentence end, then the last whitespace
+    last_sentence = None
+    for match in SENTENCE_END.finditer(head):
+        last_sentence = match
+    if last_sentence is not None:
+        return head[:last_sentence.end()]
+    cut = head.rfind(" ")
+    return head[:cut] if cut > 0 else head
+
+def pack_chunks(hits, chunks, budget_tokens, header_tokens=CHUNK_HEADER_TOKENS):
+    """Greedily fill a token budget with retrieved chunks in priority order.
+
+    hits is a list of (chunk index, score), highest value first. Chunks that
+    do not fit are skipped; if room remains at the end, the best skipped
+    chunk is truncated at a sentence boundary to fill it. Returns the packed
+    [(chunk index, score, text)] and the estimated tokens used.
+    """
+    packed = []
+    used = 0
+    first_skipped = None
+    for i, score in hits:
+        text = chunks[i]
+        cost = estimate_tokens(text) + header_tokens
+        if used + cost <= budget_tokens:
+            packed.append((i, score, text))
+            used += cost
+        elif first_skipped is None:
+            first_skipped = (i, score, text)
+
+    remaining = budget_tokens - used - header_tokens
+    if first_skipped is not None and remaining >= MIN_PARTIAL_TOKENS:
+        i, score, text = first_skipped
+        partial = truncate_to_tokens(text, remaining)
+        if partial:
+            packed.append((i, score, partial))
+            used += estimate_tokens(partial) + header_tokens
+
+    return packed, used
+
+def pack_source_text(user_query, text, budget_tokens, retrieval_method="bm25"):
+    """Fit a knowledge source into a token budget for standard (non-RAG) generation.
+
+    Text that already fits is returned whole. Otherwise chunks are ranked by
+    relevance to the query, packed greedily into the budget and emitted in
+    their original document order. Chunks overlap, so neighbouring packed
+    chunks are joined at their offsets rather than repeating the overlap.
+    Returns (text, tokens_used).
+    """
+    tokens = estimate_tokens(text)
+    if tokens <= budget_tokens:
+        return text, tokens
+
+    # Imported here to avoid a circular import with rag_tools
+    from utils.rag_tools import load_or_build_index
+
+    chunks, index = load_or_build_index(text, retrieval_method)
+    hits = index.search(user_query, top_k=len(chunks))
+    # Chunks with no query terms at all keep their document order at the end
+    ranked = {i for i, _ in hits}
+    hits += [(i, 0.0) for i in range(len(chunks)) if i not in ranked]
+
+    packed, _ = pack_chunks(hits, chunks, budget_tokens, header_tokens=1)
+    packed.sort(key=lambda item: item[0])
+
+    # Merge packed chunks into runs of contiguous source text; a truncated chunk ends early
+    runs = []
+    for i, _, chunk in packed:
+        start = int(chunks.spans[i][0])
+        end = start + len(chunk)
+        if runs and start <= runs[-1][1]:
+            runs[-1][1] = max(runs[-1][1], end)
+        else:
+            runs.append([start, end])
+    packed_text = "\n...\n".join(chunks.text[start:end] for start, end in runs)
+    used = estimate_tokens(packed_text)
+    logger.info(f"Packed {len(packed)} of {len(chunks)} chunks into {used} of {budget_tokens} tokens ({tokens} available)")
+    return packed_text, used
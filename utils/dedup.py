@@ -0,0 +1,145 @@
+import re
+import zlib
+import logging
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Words per shingle
+SHINGLE_SIZE = 5
+
+# MinHash signature length, split into BANDS bands of ROWS_PER_BAND rows for LSH.
+# 16 bands of 8 rows make pairs above ~0.7 Jaccard similarity very likely to
+# share a bucket, while dissimilar pairs almost never do.
+NUM_PERMUTATIONS = 128
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+
+# Estimated Jaccard similarity above which two texts count as duplicates
+DEFAULT_THRESHOLD = 0.8
+
+# Lines shorter than this are left alone by passage-level deduplication
+MIN_PASSAGE_WORDS = 8
+
+WORD_PATTERN = re.compile(r'\w+')
+
+_rng = np.random.default_rng(0x5EED)
+_PERM_A = _rng.integers(1, 2 ** 63, size=NUM_PERMUTATIONS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_PERM_B = _rng.integers(0, 2 ** 63, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_SHINGLE_PRIME = np.uint64(0x100000001B3)
+
+def _mix64(x):
+    """Vectorized 64-bit finalizer so shingle hashes are well spread."""
+    x = (x ^ (x >> np.uint64(33))) * np.uint64(0xFF51AFD7ED558CCD)
+    x = (x ^ (x >> np.uint64(33))) * np.uint64(0xC4CEB9FE1A85EC53)
+    return x ^ (x >> np.uint64(33))
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """Return the unique 64-bit hashes of a text's word shingles."""
+    words = WORD_PATTERN.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    tokens = np.array([zlib.crc32(word.encode("utf-8")) for word in words], dtype=np.uint64)
+    size = min(size, len(tokens))
+
+    # Polynomial hash of each window of `size` consecutive words
+    n_shingles = len(tokens) - size + 1
+    shingles = np.zeros(n_shingles, dtype=np.uint64)
+    for offset in range(size):
+        shingles = shingles * _SHINGLE_PRIME + tokens[offset:offset + n_shingles]
+    return np.unique(_mix64(shingles))
+
+def minhash_signature(text):
+    """Return the MinHash signature of a text, or None if it has no words."""
+    shingles = shingle_hashes(text)
+    if len(shingles) == 0:
+        return None
+    # (shingles x permutations) universal hashes, minimum per permutation
+    return np.min(shingles[:, None] * _PERM_A + _PERM_B, axis=0)
+
+class MinHashLSH:
+    """LSH index over MinHash signatures that keeps only the first of each group of near-duplicates."""
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.buckets = {}
+        self.signatures = []
+
+    def _band_keys(self, signature):
+        return [
+            (band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes())
+            for band in range(BANDS)
+        ]
+
+    def add_if_new(self, signature):
+        """Insert a signature unless a near-duplicate is already indexed; returns True if inserted."""
+        keys = self._band_keys(signature)
+        candidates = set()
+        for key in keys:
+            candidates.update(self.buckets.get(key, ()))
+        for candidate in candidates:
+            if np.mean(self.signatures[candidate] == signature) >= self.threshold:
+                return False
+
+        position = len(self.signatures)
+        self.signatures.append(signature)
+        for key in keys:
+            self.buckets.setdefault(key, []).append(position)
+        return True
+
+def deduplicate(texts, threshold=DEFAULT_THRESHOLD):
+    """Return the indices of texts to keep, dropping near-duplicates of earlier texts."""
+    lsh = MinHashLSH(threshold)
+    keep = []
+    for i, text in enumerate(texts):
+        signature = minhash_signature(text)
+        if signature is None or lsh.add_if_new(signature):
+            keep.append(i)
+    return keep
+
+def remove_duplicate_passages(documents, threshold=DEFAULT_THRESHOLD, min_words=MIN_PASSAGE_WORDS):
+    """Drop lines that near-duplicate a line seen earlier in any of the documents.
+
+    Returns the cleaned documents and the number of passages removed.
+    """
+    lsh = MinHashLSH(threshold)
+    cleaned = []
+    removed = 0
+    for document in documents:
+        kept_lines = []
+        for line in document.split("\n"):
+            if len(WORD_PATTERN.findall(line)) >= min_words:
+                signature = minhash_signature(line)
+                if not lsh.add_if_new(signature):
+                    removed += 1
+                    continue
+            kept_lines.append(line)
+        cleaned.append("\n".join(kept_lines))
+    return cleaned, removed
+
+def deduplicate_scraped_content(search_results, scraped_contents, threshold=DEFAULT_THRESHOLD):
+    """Remove mirrored pages and repeated passages from scraped web content.
+
+    Near-duplicate pages are dropped together with their search result so
+    both lists stay aligned, then passages repeated across the remaining
+    pages are removed. Returns (search_results, scraped_contents, stats).
+    """
+    characters_before = sum(len(content) for content in scraped_contents)
+    keep = deduplicate(scraped_contents, threshold)
+    results = [search_results[i] for i in keep if i < len(search_results)]
+    contents, passages_removed = remove_duplicate_passages([scraped_contents[i] for i in keep], threshold)
+
+    characters_after = sum(len(content) for content in contents)
+    stats = {
+        "pages_removed": len(scraped_contents) - len(keep),
+        "passages_removed": passages_removed,
+        "characters_removed": characters_before - characters_after,
+        "characters_before": characters_before,
+    }
+    logger.info(
+        f"Deduplication removed {stats['pages_removed']} pages and {passages_removed} passages "
+        f"({stats['characters_removed']} of {characters_before} characters)"
+    )
+    return results, contents, stats
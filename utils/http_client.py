@@ -0,0 +1,150 @@
+import os
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Pages fetched at the same time, and open connections allowed to any one host
+SCRAPE_MAX_WORKERS = int(os.getenv("SCRAPE_MAX_WORKERS", "8"))
+SCRAPE_MAX_PER_HOST = int(os.getenv("SCRAPE_MAX_PER_HOST", "2"))
+
+# Seconds to connect, and between bytes once connected
+SCRAPE_CONNECT_TIMEOUT = float(os.getenv("SCRAPE_CONNECT_TIMEOUT", "5"))
+SCRAPE_READ_TIMEOUT = float(os.getenv("SCRAPE_READ_TIMEOUT", "10"))
+REQUEST_TIMEOUT = (SCRAPE_CONNECT_TIMEOUT, SCRAPE_READ_TIMEOUT)
+
+# Bytes read from an HTML or text page before the rest is dropped, and the
+# largest PDF or DOCX downloaded (a truncated document cannot be parsed)
+SCRAPE_MAX_PAGE_BYTES = int(float(os.getenv("SCRAPE_MAX_PAGE_MB", "2")) * 1024 * 1024)
+SCRAPE_MAX_DOCUMENT_BYTES = int(float(os.getenv("SCRAPE_MAX_DOCUMENT_MB", "20")) * 1024 * 1024)
+
+# Hosts whose keep-alive connection pools are kept open
+MAX_POOLED_HOSTS = 64
+
+# Open connections to the search API, kept apart from the scraping pools
+SEARCH_MAX_CONNECTIONS = int(os.getenv("SEARCH_MAX_CONNECTIONS", "8"))
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+_session = None
+_search_session = None
+_session_lock = threading.Lock()
+
+def _create_session(pool_connections, pool_maxsize, pool_block):
+    """Create a session with pooled keep-alive connections that retries connection errors and 502/503/504 once."""
+    retry = Retry(total=1, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=("GET", "HEAD"))
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def get_session():
+    """Return the process-wide HTTP session used for scraping, with pooled keep-alive connections.
+
+    Each host gets a pool of at most SCRAPE_MAX_PER_HOST connections; a
+    request to a host whose connections are all busy waits for one to be
+    released rather than opening another. Connection errors and 502/503/504
+    responses are retried once.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _create_session(MAX_POOLED_HOSTS, SCRAPE_MAX_PER_HOST, pool_block=True)
+        return _session
+
+def get_search_session():
+    """Return the process-wide HTTP session for search API calls.
+
+    Searches from every user share one API host, so they get their own pool
+    of SEARCH_MAX_CONNECTIONS connections that never blocks, instead of
+    queueing behind page fetches for the per-host scraping limit.
+    """
+    global _search_session
+    with _session_lock:
+        if _search_session is None:
+            _search_session = _create_session(1, SEARCH_MAX_CONNECTIONS, pool_block=False)
+        return _search_session
+
+def sniff_content_type(content_type, head, url=""):
+    """Classify a response as "html", "text", "pdf" or "docx" from its header and first bytes.
+    
+    Returns None for anything else (images, archives, media, executables),
+    so it can be rejected before the rest of the body is downloaded.
+    """
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    path = urlparse(url).path.lower()
+    start = head[:1024].lstrip().lower()
+    
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    if head.startswith(b"PK\x03\x04"):
+        # DOCX files are ZIP archives; other archives are rejected
+        if "wordprocessingml" in content_type or path.endswith(".docx"):
+            return "docx"
+        return None
+    if content_type.startswith(("image/", "audio/", "video/", "font/")):
+        return None
+    if content_type in ("text/html", "application/xhtml+xml") or start.startswith((b"<!doctype html", b"<html")):
+        return "html"
+    if content_type.startswith("text/") or content_type in ("application/json", "application/xml"):
+        return "text"
+    if b"\x00" not in head[:4096] and (b"<body" in start or b"<head" in start):
+        return "html"
+    return None
+
+def read_limited(chunks, max_bytes, head=b""):
+    """Read body chunks after head until more than max_bytes; returns (at most max_bytes of body, truncated).
+
+    A body of exactly max_bytes is not truncated: reading stops only once a
+    byte beyond the limit has arrived.
+    """
+    body = bytearray(head)
+    for chunk in chunks:
+        if len(body) > max_bytes:
+            break
+        body += chunk
+    return bytes(body[:max_bytes]), len(body) > max_bytes
+
+def fetch_all(items, fetch, max_workers=SCRAPE_MAX_WORKERS, on_result=None):
+    """Run fetch(item) for every item concurrently; returns the results in input order.
+
+    on_result(index, item, result) is called from the calling thread as
+    each fetch completes, in completion order, so it can update the UI.
+    fetch should handle its own errors; an exception is logged and the
+    result is None.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    if not items:
+        return results
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix="fetch") as executor:
+        futures = {
+            executor.submit(contextvars.copy_context().run, fetch, item): i
+            for i, item in enumerate(items)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                logger.error(f"Error fetching {items[i]}: {str(e)}")
+            if on_result:
+                on_result(i, items[i], results[i])
+    return results
@@ -0,0 +1,162 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Directory holding one sub-directory per cached index
+INDEX_CACHE_DIR = Path(os.getenv("RAG_INDEX_CACHE_DIR", ".cache/rag_index"))
+
+# Bump when the on-disk layout changes so stale entries are never read
+INDEX_FORMAT_VERSION = 3
+
+META_FILE = "meta.json"
+
+def index_key(text, **params):
+    """Return a content-addressed cache key for a text and its indexing parameters."""
+    digest = hashlib.sha256()
+    digest.update(f"v{INDEX_FORMAT_VERSION}:".encode("utf-8"))
+    digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8", errors="surrogatepass"))
+    return digest.hexdigest()
+
+def stored_format_version(index_dir):
+    """Return the format version an index directory was written with, or None if unreadable."""
+    try:
+        with open(Path(index_dir) / META_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f).get("format_version")
+    except (OSError, ValueError):
+        return None
+
+def save_index(key, arrays, metadata=None, cache_dir=None, format_version=INDEX_FORMAT_VERSION):
+    """Write a dict of NumPy arrays (plus JSON metadata) to the cache under key.
+
+    An entry already stored under key is kept if it has format_version,
+    and replaced otherwise.
+    """
+    cache_dir = Path(cache_dir or INDEX_CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    final_dir = cache_dir / key
+    if (final_dir / META_FILE).exists():
+        if stored_format_version(final_dir) == format_version:
+            return final_dir
+        # Move the outdated entry aside first, so readers never see it half deleted
+        stale_dir = Path(tempfile.mkdtemp(prefix=f".{key[:12]}-stale-", dir=cache_dir))
+        try:
+            os.rename(final_dir, stale_dir / key)
+        except OSError:
+            pass
+        shutil.rmtree(stale_dir, ignore_errors=True)
+
+    # Write into a private directory first and rename it into place, so
+    # concurrent Streamlit workers never observe a half-written index
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f".{key[:12]}-", dir=cache_dir))
+    try:
+        for name, array in arrays.items():
+            np.save(tmp_dir / f"{name}.npy", np.ascontiguousarray(array), allow_pickle=False)
+
+        meta = dict(metadata or {})
+        meta["arrays"] = sorted(arrays)
+        meta["format_version"] = format_version
+        with open(tmp_dir / META_FILE, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+        try:
+            os.rename(tmp_dir, final_dir)
+        except OSError:
+            # Another process stored the same index first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except Exception as e:
+        logger.error(f"Error saving index {key}: {str(e)}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return None
+
+    return final_dir
+
+def load_index(key, cache_dir=None, format_version=INDEX_FORMAT_VERSION):
+    """Load a cached index as read-only memory-mapped arrays, or None on a miss or another format version."""
+    index_dir = Path(cache_dir or INDEX_CACHE_DIR) / key
+    meta_path = index_dir / META_FILE
+    if not meta_path.exists():
+        return None
+
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get("format_version") != format_version:
+            return None
+
+        arrays = {
+            name: np.load(index_dir / f"{name}.npy", mmap_mode='r', allow_pickle=False)
+            for name in meta["arrays"]
+        }
+        return arrays, meta
+    except Exception as e:
+        logger.error(f"Error loading index {key}: {str(e)}")
+        return None
+
+def encode_strings(strings):
+    """Pack an iterable of strings into a UTF-8 byte buffer and an offsets array."""
+    buffer = bytearray()
+    offsets = [0]
+    for s in strings:
+        buffer += s.encode("utf-8", errors="surrogatepass")
+        offsets.append(len(buffer))
+    return np.frombuffer(bytes(buffer), dtype=np.uint8), np.asarray(offsets, dtype=np.int64)
+
+def utf8_byte_offsets(text, char_offsets):
+    """Convert character offsets into text to byte offsets into its UTF-8 encoding."""
+    code_points = np.frombuffer(text.encode("utf-32-le", errors="surrogatepass"), dtype=np.uint32)
+    widths = 1 + (code_points >= 0x80) + (code_points >= 0x800) + (code_points >= 0x10000)
+    boundaries = np.zeros(len(code_points) + 1, dtype=np.int64)
+    np.cumsum(widths, out=boundaries[1:])
+    return boundaries[np.asarray(char_offsets, dtype=np.int64)]
+
+class PackedStrings:
+    """Read-only sequence of strings backed by a (memory-mapped) byte buffer."""
+
+    def __init__(self, buffer, offsets):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def span(self, i):
+        """Return the (start, end) byte offsets of string i."""
+        return self.offsets[i], self.offsets[i + 1]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("PackedStrings index out of range")
+        start, end = self.span(i)
+        return self.buffer[start:end].tobytes().decode("utf-8", errors="surrogatepass")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+class ByteSpanStrings(PackedStrings):
+    """Read-only sequence of (possibly overlapping) byte spans of a UTF-8 buffer."""
+
+    def __init__(self, buffer, spans):
+        self.buffer = buffer
+        self.spans = spans
+
+    def __len__(self):
+        return len(self.spans)
+
+    def span(self, i):
+        return self.spans[i]
@@ -0,0 +1,385 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import datetime
+import contextlib
+from pathlib import Path
+import numpy as np
+from scipy import sparse
+
+from utils.index_cache import (
+    save_index,
+    load_index,
+    utf8_byte_offsets,
+    ByteSpanStrings
+)
+from utils.bm25 import (
+    DEFAULT_K1,
+    DEFAULT_B,
+    term_counts,
+    query_term_ids,
+    top_k_indices,
+    top_k_per_column,
+    bm25_idf,
+    bm25_weights
+)
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Directory holding one sub-directory per named knowledge base
+KNOWLEDGE_BASE_DIR = Path(os.getenv("KNOWLEDGE_BASE_DIR", "knowledge_bases"))
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_LOCK_FILE = ".manifest.lock"
+SEGMENTS_DIR = "segments"
+
+# Bump when the segment layout changes. Segments are persistent, unlike the
+# disposable index cache, so they are versioned separately; documents whose
+# segment has another version are dropped from the manifest to be re-added.
+# Started at the index cache version the first segments were written with.
+SEGMENT_FORMAT_VERSION = 3
+
+# A manifest lock file older than this many seconds was left by a crashed process
+MANIFEST_LOCK_TIMEOUT = 30
+
+# Loaded indexes, keyed by knowledge base and the manifest's segment list
+_index_cache = {}
+
+def safe_knowledge_base_name(name):
+    """Turn a display name into a directory-safe knowledge base identifier."""
+    safe_name = re.sub(r'[^\w\s-]', '', name).strip().lower()
+    return re.sub(r'[-\s]+', '_', safe_name)
+
+def content_hash(data):
+    """Return the SHA-256 hex digest of raw file bytes or text."""
+    if isinstance(data, str):
+        data = data.encode("utf-8", errors="surrogatepass")
+    return hashlib.sha256(data).hexdigest()
+
+def _knowledge_base_dir(name):
+    return KNOWLEDGE_BASE_DIR / safe_knowledge_base_name(name)
+
+def list_knowledge_bases():
+    """Return the names of all knowledge bases on disk."""
+    if not KNOWLEDGE_BASE_DIR.exists():
+        return []
+    return sorted(
+        path.name for path in KNOWLEDGE_BASE_DIR.iterdir()
+        if (path / MANIFEST_FILE).exists()
+    )
+
+def load_manifest(name):
+    """Load a knowledge base manifest, or None if it does not exist."""
+    manifest_path = _knowledge_base_dir(name) / MANIFEST_FILE
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_manifest(name, manifest):
+    """Atomically replace a knowledge base manifest."""
+    kb_dir = _knowledge_base_dir(name)
+    tmp_path = kb_dir / f".{MANIFEST_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, kb_dir / MANIFEST_FILE)
+
+@contextlib.contextmanager
+def _manifest_lock(name):
+    """Serialize read-modify-write updates of a manifest across threads and processes.
+
+    The lock is a file created with O_EXCL in the knowledge base directory;
+    one older than MANIFEST_LOCK_TIMEOUT seconds is taken to be stale and
+    removed.
+    """
+    kb_dir = _knowledge_base_dir(name)
+    kb_dir.mkdir(parents=True, exist_ok=True)
+    lock_path = kb_dir / MANIFEST_LOCK_FILE
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - lock_path.stat().st_mtime > MANIFEST_LOCK_TIMEOUT:
+                    logger.warning(f"Removing stale manifest lock of knowledge base {name}")
+                    lock_path.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.05)
+    try:
+        os.write(fd, str(os.getpid()).encode("ascii"))
+        os.close(fd)
+        yield
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            lock_path.unlink()
+
+def create_knowledge_base(name, description=""):
+    """Create an empty knowledge base (no-op if it already exists) and return its identifier."""
+    safe_name = safe_knowledge_base_name(name)
+    if not safe_name:
+        raise ValueError("Knowledge base name must contain letters or digits")
+
+    with _manifest_lock(safe_name):
+        if load_manifest(safe_name) is None:
+            (_knowledge_base_dir(safe_name) / SEGMENTS_DIR).mkdir(parents=True, exist_ok=True)
+            _save_manifest(safe_name, {
+                "name": name,
+                "description": description,
+                "date_created": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "documents": []
+            })
+            logger.info(f"Created knowledge base: {safe_name}")
+    return safe_name
+
+def has_document(name, document_hash):
+    """Check whether a document with this content hash is already in the knowledge base."""
+    manifest = load_manifest(name)
+    return bool(manifest) and any(doc["hash"] == document_hash for doc in manifest["documents"])
+
+def _build_segment(text, chunk_size, overlap):
+    """Chunk and index one document into segment arrays."""
+    # Imported here to avoid a circular import with rag_tools
+    from utils.rag_tools import chunk_documents
+
+    chunks = chunk_documents([text], chunk_size=chunk_size, overlap=overlap)
+    counts = term_counts(chunks).tocsc()
+    counts.sort_indices()
+
+    # Keep only the non-empty posting lists: (term, offset) pairs instead of a
+    # full-width CSC pointer array keeps small segments small
+    df = np.diff(counts.indptr)
+    terms = np.flatnonzero(df).astype(np.int64)
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(df[terms], out=term_offsets[1:])
+
+    return {
+        "text_utf8": np.frombuffer(text.encode("utf-8", errors="surrogatepass"), dtype=np.uint8),
+        "chunk_byte_spans": utf8_byte_offsets(text, chunks.spans),
+        "terms": terms,
+        "term_offsets": term_offsets,
+        "postings_docs": counts.indices.astype(np.int32),
+        "postings_tf": counts.data.astype(np.float32),
+        "doc_lengths": np.asarray(counts.sum(axis=1), dtype=np.float32).ravel(),
+    }
+
+def add_document(name, document_name, text, document_hash=None, chunk_size=1000, overlap=200):
+    """Chunk and index one document into its own segment of the knowledge base.
+
+    Existing segments are never touched, so adding a file costs only that
+    file's chunking and indexing. Returns False if the document is already present.
+    """
+    safe_name = create_knowledge_base(name)
+    document_hash = document_hash or content_hash(text)
+    if has_document(safe_name, document_hash):
+        logger.info(f"Document '{document_name}' already in knowledge base {safe_name}")
+        return False
+    if not text or not text.strip():
+        logger.warning(f"Skipping empty document '{document_name}'")
+        return False
+
+    segment_id = content_hash(f"{document_hash}:{chunk_size}:{overlap}")
+    segments_dir = _knowledge_base_dir(safe_name) / SEGMENTS_DIR
+    loaded = load_index(segment_id, cache_dir=segments_dir, format_version=SEGMENT_FORMAT_VERSION)
+    if loaded is None:
+        arrays = _build_segment(text, chunk_size, overlap)
+        save_index(
+            segment_id, arrays, {"document_name": document_name},
+            cache_dir=segments_dir, format_version=SEGMENT_FORMAT_VERSION
+        )
+    else:
+        arrays, _ = loaded
+
+    with _manifest_lock(safe_name):
+        manifest = load_manifest(safe_name)
+        if any(doc["hash"] == document_hash for doc in manifest["documents"]):
+            return False
+        manifest["documents"].append({
+            "name": document_name,
+            "hash": document_hash,
+            "segment": segment_id,
+            "characters": len(text),
+            "chunks": len(arrays["doc_lengths"]),
+            "date_added": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        })
+        _save_manifest(safe_name, manifest)
+
+    logger.info(f"Added '{document_name}' to knowledge base {safe_name}")
+    return True
+
+def _drop_documents(name, document_hashes):
+    """Remove documents whose segment cannot be read from the manifest, so they can be added again."""
+    with _manifest_lock(name):
+        manifest = load_manifest(name)
+        manifest["documents"] = [doc for doc in manifest["documents"] if doc["hash"] not in document_hashes]
+        _save_manifest(name, manifest)
+    logger.warning(f"Dropped {len(document_hashes)} unreadable document(s) from knowledge base {name}; add them again")
+
+class KnowledgeBaseChunks:
+    """Read-only chunk sequence spanning every segment of a knowledge base."""
+
+    def __init__(self, segments, bases, doc_ids):
+        self.segments = segments
+        self.bases = bases
+        self.doc_ids = doc_ids
+
+    def __len__(self):
+        return int(self.bases[-1])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        segment = int(np.searchsorted(self.bases, i, side='right')) - 1
+        return self.segments[segment][i - int(self.bases[segment])]
+
+    def __iter__(self):
+        for segment in self.segments:
+            yield from segment
+
+class KnowledgeBaseIndex:
+    """BM25 over all segments of a knowledge base with corpus-wide statistics.
+
+    Each segment keeps raw term counts, so document frequencies and the
+    average chunk length are combined across segments at query time and
+    adding a document never re-weights or rebuilds the others. The term
+    lists of all segments are merged once per index (a new index is built
+    whenever segments are added or dropped), so a query term is found with
+    one binary search however many segments there are.
+    """
+
+    engine = "knowledge_base"
+
+    def __init__(self, segment_arrays, k1=DEFAULT_K1, b=DEFAULT_B):
+        self.segment_arrays = segment_arrays
+        self.k1 = k1
+        self.b = b
+        lengths = [arrays["doc_lengths"] for arrays in segment_arrays]
+        self.bases = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum([len(l) for l in lengths], out=self.bases[1:])
+        self.n_docs = int(self.bases[-1])
+        self.avgdl = float(sum(float(np.sum(l)) for l in lengths) / self.n_docs) if self.n_docs else 0.0
+
+        # Merged term map: for every (term, segment) pair, the segment and its posting offsets
+        terms = [np.asarray(arrays["terms"]) for arrays in segment_arrays]
+        offsets = [np.asarray(arrays["term_offsets"]) for arrays in segment_arrays]
+        empty = [np.empty(0, dtype=np.int64)]
+        all_terms = np.concatenate(terms or empty)
+        order = np.argsort(all_terms, kind="stable")
+        self.terms = all_terms[order]
+        self.term_segments = np.repeat(np.arange(len(terms)), [len(t) for t in terms])[order]
+        self.posting_starts = np.concatenate([o[:-1] for o in offsets] or empty)[order]
+        self.posting_ends = np.concatenate([o[1:] for o in offsets] or empty)[order]
+
+    def _term_postings(self, terms):
+        """Yield (term position, global chunk ids, BM25 weights) for each query term found in the index."""
+        lows = np.searchsorted(self.terms, terms, side="left")
+        highs = np.searchsorted(self.terms, terms, side="right")
+        for position, (low, high) in enumerate(zip(lows, highs)):
+            if low == high:
+                continue
+            df = int(np.sum(self.posting_ends[low:high] - self.posting_starts[low:high]))
+            idf = bm25_idf(df, self.n_docs)
+            docs = []
+            weights = []
+            for entry in range(low, high):
+                segment = self.term_segments[entry]
+                arrays = self.segment_arrays[segment]
+                p = slice(self.posting_starts[entry], self.posting_ends[entry])
+                local_docs = arrays["postings_docs"][p]
+                docs.append(local_docs + self.bases[segment])
+                weights.append(bm25_weights(
+                    arrays["postings_tf"][p], arrays["doc_lengths"][local_docs], idf, self.avgdl, self.k1, self.b
+                ))
+            yield position, np.concatenate(docs), np.concatenate(weights)
+
+    def search(self, query, top_k=3):
+        """Return [(global chunk index, score)] for the top_k chunks matching the query."""
+        postings = list(self._term_postings(query_term_ids(query)))
+        if not postings:
+            return []
+        candidates, inverse = np.unique(np.concatenate([docs for _, docs, _ in postings]), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate([weights for _, _, weights in postings]))
+        return [(int(candidates[i]), float(scores[i])) for i in top_k_indices(scores, top_k)]
+
+    def search_batch(self, queries, top_k=3):
+        """Score several queries with one sparse-dense multiply, as BM25Index does; returns one hit list per query."""
+        query_matrix = term_counts(queries)
+        query_matrix.data[:] = 1.0
+        terms = np.unique(query_matrix.indices)
+        postings = list(self._term_postings(terms))
+        if not postings or self.n_docs == 0:
+            return [[] for _ in queries]
+
+        # Gather the BM25-weighted postings of every query term into a (chunks x terms) matrix
+        weight_matrix = sparse.csr_matrix(
+            (
+                np.concatenate([weights for _, _, weights in postings]),
+                (
+                    np.concatenate([docs for _, docs, _ in postings]),
+                    np.concatenate([np.full(len(docs), column, dtype=np.int32) for column, docs, _ in postings])
+                )
+            ),
+            shape=(self.n_docs, len(terms))
+        )
+
+        # (chunks x terms) @ (terms x queries) -> dense (chunks x queries) scores
+        scores = weight_matrix @ query_matrix[:, terms].T.toarray()
+        best = top_k_per_column(scores, top_k)
+        return [
+            [(int(i), float(scores[i, q])) for i in best[:, q] if scores[i, q] > 0]
+            for q in range(len(queries))
+        ]
+
+def load_knowledge_base_index(name):
+    """Return (chunks, index, documents) for a knowledge base, or None if it is empty."""
+    manifest = load_manifest(name)
+    if not manifest or not manifest["documents"]:
+        return None
+
+    documents = manifest["documents"]
+    cache_key = (safe_knowledge_base_name(name), tuple(doc["segment"] for doc in documents))
+    if cache_key in _index_cache:
+        return _index_cache[cache_key]
+
+    segments_dir = _knowledge_base_dir(name) / SEGMENTS_DIR
+    loaded_segments = []
+    unreadable = []
+    for document in documents:
+        loaded = load_index(document["segment"], cache_dir=segments_dir, format_version=SEGMENT_FORMAT_VERSION)
+        if loaded is None:
+            logger.error(f"Missing or outdated segment for '{document['name']}' in knowledge base {name}")
+            unreadable.append(document["hash"])
+        else:
+            loaded_segments.append((document, loaded[0]))
+
+    if unreadable:
+        _drop_documents(name, unreadable)
+    if not loaded_segments:
+        return None
+    documents = [document for document, _ in loaded_segments]
+    cache_key = (safe_knowledge_base_name(name), tuple(doc["segment"] for doc in documents))
+
+    segment_arrays = []
+    segment_chunks = []
+    doc_ids = []
+    for doc_id, (_, arrays) in enumerate(loaded_segments):
+        segment_arrays.append(arrays)
+        segment_chunks.append(ByteSpanStrings(arrays["text_utf8"], arrays["chunk_byte_spans"]))
+        doc_ids.append(np.full(len(arrays["doc_lengths"]), doc_id, dtype=np.int64))
+
+    index = KnowledgeBaseIndex(segment_arrays)
+    chunks = KnowledgeBaseChunks(segment_chunks, index.bases, np.concatenate(doc_ids))
+    result = (chunks, index, documents)
+
+    # Keep only the latest version of each knowledge base in memory
+    for key in [key for key in _index_cache if key[0] == cache_key[0]]:
+        del _index_cache[key]
+    _index_cache[cache_key] = result
+    return result
@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import contextlib
+import contextvars
+from pathlib import Path
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# SQLite database shared by every Streamlit worker process
+LLM_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", ".cache/llm_responses.sqlite3"))
+
+# Entries older than this are treated as misses and removed
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Least recently used entries are evicted beyond these limits
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+
+# Set LLM_CACHE_DISABLED=1 to always call the model
+LLM_CACHE_DISABLED = os.getenv("LLM_CACHE_DISABLED", "").lower() in ("1", "true", "yes")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# Per-context switch so one generation can skip the cache without affecting others
+_bypass = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+def cache_key(model_name, prompt, generation_config=None, provider="gemini"):
+    """Hash a provider, model name, prompt and generation config into a cache key.
+
+    The provider keeps responses of the offline stub backend from ever
+    being served to callers of the real model with the same name.
+    """
+    payload = json.dumps(
+        {"provider": provider, "model": model_name, "config": generation_config or {}},
+        sort_keys=True, default=str
+    )
+    digest = hashlib.sha256(payload.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(prompt.encode("utf-8", errors="surrogatepass"))
+    return digest.hexdigest()
+
+@contextlib.contextmanager
+def bypass():
+    """Skip cache reads and writes for LLM calls made inside this block."""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+def is_bypassed():
+    """Return True if the cache is disabled globally or for the current context."""
+    return LLM_CACHE_DISABLED or _bypass.get()
+
+class ResponseCache:
+    """Persistent LRU/TTL cache of LLM responses in SQLite.
+
+    The database runs in WAL mode, so readers in one process never block on
+    a writer in another, and each operation uses its own short-lived
+    connection so the cache is safe across threads and processes.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_bytes=LLM_CACHE_MAX_BYTES, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._initialized = True
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, key):
+        """Return the cached response for key, or None on a miss."""
+        now = time.time()
+        with contextlib.closing(self._connect()) as conn:
+            row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self._count(conn, "misses")
+                return None
+            conn.execute("UPDATE responses SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._count(conn, "hits")
+            return row[0]
+
+    def put(self, key, model_name, response):
+        """Store a response, then evict expired and least recently used entries over the limits."""
+        now = time.time()
+        size = len(response.encode("utf-8", errors="surrogatepass"))
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model_name, response, size, now, now)
+                )
+                conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+                self._evict(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self, conn):
+        """Delete least recently used entries until the size and count limits hold."""
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+            evicted += 1
+        self._count(conn, "evictions", evicted)
+
+    def _count(self, conn, name, amount=1):
+        """Add to a shared counter."""
+        conn.execute(
+            "INSERT INTO stats (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?",
+            (name, amount, amount)
+        )
+
+    def stats(self):
+        """Return hit/miss/eviction counters and the current size of the cache."""
+        with contextlib.closing(self._connect()) as conn:
+            counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "evictions": counters.get("evictions", 0),
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def clear(self):
+        """Remove every cached response and reset the counters."""
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("DELETE FROM responses")
+            conn.execute("DELETE FROM stats")
+
+# Shared by every caller in this process
+response_cache = ResponseCache()
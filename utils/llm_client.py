@@ -0,0 +1,197 @@
+import os
+import time
+import logging
+import itertools
+import threading
+
+from utils.llm_cache import response_cache, cache_key, is_bypassed
+from utils.llm_providers import create_provider
+from utils.llm_usage import usage_tracker
+from utils.rate_limiter import RateLimiter, backoff_delay
+from utils.tokens import estimate_tokens
+from utils.response_processing import IncrementalJSONParser
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gemini-1.5-pro"
+
+# Budget shared by every session in this process
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "60"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+
+# Retries for quota and transient server errors
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "4"))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "1.0"))
+GEMINI_BACKOFF_CAP = float(os.getenv("GEMINI_BACKOFF_CAP", "32.0"))
+
+rate_limiter = RateLimiter(GEMINI_RPM, GEMINI_TPM)
+
+# Backend chosen by LLM_PROVIDER, created on first use
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_provider():
+    """Return the process-wide LLM provider."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = create_provider()
+        return _provider
+
+def set_provider(provider):
+    """Replace the process-wide LLM provider (e.g. with a StubProvider for benchmarks)."""
+    global _provider
+    with _provider_lock:
+        _provider = provider
+
+def call_with_retry(request, prompt, provider, usage=None):
+    """Run request() within the rate limit, retrying quota and transient errors with jittered backoff.
+
+    If usage is a dict, the time spent queued or backing off and the number
+    of retries are added to its wait_seconds and retries.
+    """
+    if usage is None:
+        usage = {}
+    usage.setdefault("wait_seconds", 0.0)
+    usage.setdefault("retries", 0)
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        usage["wait_seconds"] += rate_limiter.acquire(estimate_tokens(prompt))
+        try:
+            return request()
+        except Exception as e:
+            if not isinstance(e, provider.retryable_errors):
+                raise
+            if attempt == GEMINI_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt, GEMINI_BACKOFF_BASE, GEMINI_BACKOFF_CAP)
+            rate_limiter.record_retry()
+            usage["retries"] += 1
+            usage["wait_seconds"] += delay
+            logger.warning(f"LLM call failed ({type(e).__name__}), retrying in {delay:.1f}s (attempt {attempt + 1} of {GEMINI_MAX_RETRIES})")
+            time.sleep(delay)
+
+def _cached_response(key):
+    """Return a cached response, treating cache errors as misses."""
+    try:
+        return response_cache.get(key)
+    except Exception as e:
+        logger.error(f"Error reading LLM response cache: {str(e)}")
+        return None
+
+def _cache_response(key, model_name, text):
+    """Store a response, logging instead of failing on cache errors."""
+    try:
+        response_cache.put(key, model_name, text)
+    except Exception as e:
+        logger.error(f"Error writing LLM response cache: {str(e)}")
+
+def _record_call(model_name, prompt, text, usage, start, **fields):
+    """Record a provider call, falling back to estimated token counts when the backend reports none."""
+    prompt_tokens = usage.get("prompt_tokens", estimate_tokens(prompt))
+    output_tokens = usage.get("output_tokens", estimate_tokens(text))
+    usage_tracker.record(
+        model_name,
+        prompt_tokens=prompt_tokens,
+        output_tokens=output_tokens,
+        latency=time.perf_counter() - start,
+        wait_seconds=usage.get("wait_seconds", 0.0),
+        retries=usage.get("retries", 0),
+        **fields
+    )
+    return output_tokens
+
+def generate_text(prompt, model_name=DEFAULT_MODEL, generation_config=None):
+    """Generate a response with Gemini, served from the shared response cache when possible.
+
+    Failed calls and empty responses are never cached; errors propagate to the caller.
+    """
+    start = time.perf_counter()
+    provider = get_provider()
+    use_cache = not is_bypassed()
+    if use_cache:
+        key = cache_key(model_name, prompt, generation_config, provider.name)
+        cached = _cached_response(key)
+        if cached is not None:
+            logger.info(f"LLM cache hit for {model_name} ({key[:12]})")
+            usage_tracker.record(model_name, latency=time.perf_counter() - start, cached=True)
+            return cached
+
+    usage = {}
+    try:
+        text = call_with_retry(
+            lambda: provider.generate(prompt, model_name, generation_config, usage=usage), prompt, provider, usage
+        )
+    except Exception:
+        # Calls rejected before generating anything are not billed
+        usage.setdefault("prompt_tokens", 0)
+        _record_call(model_name, prompt, "", usage, start, status="error")
+        raise
+    output_tokens = _record_call(model_name, prompt, text, usage, start)
+    rate_limiter.charge_tokens(output_tokens)
+
+    if use_cache and text:
+        _cache_response(key, model_name, text)
+    return text
+
+def stream_text(prompt, model_name=DEFAULT_MODEL, generation_config=None):
+    """Yield a Gemini response in fragments as it is generated.
+
+    A cached response is yielded in one piece; a complete streamed response
+    is added to the cache, so streaming and non-streaming calls share entries.
+    """
+    start = time.perf_counter()
+    provider = get_provider()
+    use_cache = not is_bypassed()
+    if use_cache:
+        key = cache_key(model_name, prompt, generation_config, provider.name)
+        cached = _cached_response(key)
+        if cached is not None:
+            logger.info(f"LLM cache hit for {model_name} ({key[:12]})")
+            usage_tracker.record(model_name, latency=time.perf_counter() - start, cached=True, streamed=True)
+            yield cached
+            return
+
+    usage = {}
+
+    def start_stream():
+        # Errors usually surface on the first fragment, so it is fetched inside the retry
+        stream = iter(provider.stream(prompt, model_name, generation_config, usage=usage))
+        return itertools.chain([next(stream, "")], stream)
+
+    parts = []
+    first_token_seconds = None
+    try:
+        for text in call_with_retry(start_stream, prompt, provider, usage):
+            if not text:
+                continue
+            if first_token_seconds is None:
+                first_token_seconds = time.perf_counter() - start
+            parts.append(text)
+            yield text
+    except Exception:
+        usage.setdefault("prompt_tokens", 0)
+        _record_call(model_name, prompt, "".join(parts), usage, start, streamed=True,
+                     first_token_seconds=first_token_seconds, status="error")
+        raise
+
+    text = "".join(parts)
+    output_tokens = _record_call(model_name, prompt, text, usage, start, streamed=True, first_token_seconds=first_token_seconds)
+    rate_limiter.charge_tokens(output_tokens)
+    if use_cache and text:
+        _cache_response(key, model_name, text)
+
+def generate_json_streaming(prompt, on_variable=None, model_name=DEFAULT_MODEL, generation_config=None):
+    """Stream a JSON-object response, calling on_variable(key, value) as each member completes.
+
+    Returns the full response text for the caller's final parse.
+    """
+    parser = IncrementalJSONParser() if on_variable else None
+    parts = []
+    for fragment in stream_text(prompt, model_name, generation_config):
+        parts.append(fragment)
+        if parser:
+            for key, value in parser.feed(fragment):
+                on_variable(key, value)
+    return "".join(parts)
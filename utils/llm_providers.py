@@ -0,0 +1,194 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+
+from utils.tokens import CHARS_PER_TOKEN, estimate_tokens
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Select the backend with LLM_PROVIDER=gemini (default) or LLM_PROVIDER=stub
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+
+class LLMProvider:
+    """Interface implemented by every LLM backend."""
+
+    name = "base"
+
+    # Exceptions worth retrying with backoff (quota and transient errors)
+    retryable_errors = ()
+
+    def generate(self, prompt, model_name, generation_config=None, usage=None):
+        """Return the complete response text.
+
+        If usage is a dict, the backend sets its prompt_tokens and
+        output_tokens from the response's token counts.
+        """
+        raise NotImplementedError
+
+    def stream(self, prompt, model_name, generation_config=None, usage=None):
+        """Return an iterator of response text fragments, filling usage like generate()."""
+        raise NotImplementedError
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini backend, configured on first use rather than at import time."""
+
+    name = "gemini"
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key
+        self._genai = None
+        self._models = {}
+        self._lock = threading.Lock()
+        self.retryable_errors = ()
+
+    def _client(self):
+        with self._lock:
+            if self._genai is None:
+                import google.generativeai as genai
+                from google.api_core import exceptions as google_exceptions
+
+                genai.configure(api_key=self.api_key or os.getenv("GOOGLE_API_KEY"))
+                self.retryable_errors = (
+                    google_exceptions.ResourceExhausted,
+                    google_exceptions.TooManyRequests,
+                    google_exceptions.ServiceUnavailable,
+                    google_exceptions.InternalServerError,
+                    google_exceptions.DeadlineExceeded,
+                )
+                self._genai = genai
+            return self._genai
+
+    def get_model(self, model_name, generation_config=None):
+        """Return the shared GenerativeModel for a model name and generation config."""
+        genai = self._client()
+        key = (model_name, json.dumps(generation_config or {}, sort_keys=True, default=str))
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = genai.GenerativeModel(model_name, generation_config=generation_config)
+            return self._models[key]
+
+    @staticmethod
+    def _read_usage(response, usage):
+        """Copy Gemini's usage_metadata token counts into usage."""
+        metadata = getattr(response, "usage_metadata", None)
+        if usage is not None and metadata is not None:
+            usage["prompt_tokens"] = metadata.prompt_token_count
+            usage["output_tokens"] = metadata.candidates_token_count
+
+    def generate(self, prompt, model_name, generation_config=None, usage=None):
+        response = self.get_model(model_name, generation_config).generate_content(prompt)
+        self._read_usage(response, usage)
+        return response.text
+
+    def stream(self, prompt, model_name, generation_config=None, usage=None):
+        for chunk in self.get_model(model_name, generation_config).generate_content(prompt, stream=True):
+            # Every chunk carries the running totals; the last one has the final counts
+            self._read_usage(chunk, usage)
+            try:
+                yield chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. only a finish reason)
+                continue
+
+class StubProviderError(Exception):
+    """Simulated transient backend failure raised by StubProvider."""
+
+class StubProvider(LLMProvider):
+    """Deterministic offline backend for load tests and benchmarks.
+
+    Responses depend only on the prompt. Prompts asking for template
+    variables get a JSON object with one paragraph per variable, so the
+    whole pipeline can run without network. Latency (seconds to first
+    token), throughput (tokens per second) and error rate are configurable;
+    failures come from a seeded generator, so runs are reproducible.
+    """
+
+    name = "stub"
+    retryable_errors = (StubProviderError,)
+
+    VARIABLES_PATTERN = re.compile(r'variables to be used in a document template:\s*\n\s*(.+)')
+    WORDS = (
+        "the project delivers measurable value through clear goals steady execution and careful review "
+        "of risks costs timelines stakeholders and outcomes across every phase of the work"
+    ).split()
+
+    def __init__(self, latency=0.5, tokens_per_second=200.0, error_rate=0.0, words_per_variable=60, fragment_tokens=8, seed=0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.words_per_variable = words_per_variable
+        self.fragment_tokens = fragment_tokens
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency=float(os.getenv("STUB_LLM_LATENCY", "0.5")),
+            tokens_per_second=float(os.getenv("STUB_LLM_TOKENS_PER_SECOND", "200")),
+            error_rate=float(os.getenv("STUB_LLM_ERROR_RATE", "0")),
+            seed=int(os.getenv("STUB_LLM_SEED", "0")),
+        )
+
+    def _paragraph(self, seed_text):
+        digest = hashlib.sha256(seed_text.encode("utf-8", errors="surrogatepass")).digest()
+        rng = random.Random(digest)
+        words = [rng.choice(self.WORDS) for _ in range(self.words_per_variable)]
+        return " ".join(words).capitalize() + "."
+
+    def response_for(self, prompt):
+        """Return the deterministic response text for a prompt."""
+        match = self.VARIABLES_PATTERN.search(prompt)
+        if not match:
+            return self._paragraph(prompt)
+        variables = [var.strip() for var in match.group(1).split(",") if var.strip()]
+        content = {var: self._paragraph(f"{var}\0{prompt}") for var in variables}
+        return "```json\n" + json.dumps(content, indent=2) + "\n```"
+
+    def _maybe_fail(self):
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+        if failed:
+            raise StubProviderError("Simulated 429: quota exceeded")
+
+    def _estimate_usage(self, prompt, text, usage):
+        if usage is not None:
+            usage["prompt_tokens"] = estimate_tokens(prompt)
+            usage["output_tokens"] = estimate_tokens(text)
+
+    def generate(self, prompt, model_name, generation_config=None, usage=None):
+        self._maybe_fail()
+        text = self.response_for(prompt)
+        time.sleep(self.latency + len(text) / CHARS_PER_TOKEN / self.tokens_per_second)
+        self._estimate_usage(prompt, text, usage)
+        return text
+
+    def stream(self, prompt, model_name, generation_config=None, usage=None):
+        self._maybe_fail()
+        text = self.response_for(prompt)
+        self._estimate_usage(prompt, text, usage)
+        time.sleep(self.latency)
+        step = self.fragment_tokens * CHARS_PER_TOKEN
+        for start in range(0, len(text), step):
+            fragment = text[start:start + step]
+            time.sleep(len(fragment) / CHARS_PER_TOKEN / self.tokens_per_second)
+            yield fragment
+
+PROVIDERS = {
+    "gemini": GeminiProvider,
+    "stub": StubProvider.from_env,
+}
+
+def create_provider(name=LLM_PROVIDER):
+    """Create the LLM provider registered under name."""
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider '{name}'; expected one of {', '.join(PROVIDERS)}")
+    logger.info(f"Using LLM provider: {name}")
+    return PROVIDERS[name]()
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextlib
+import contextvars
+from collections import deque
+from pathlib import Path
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# One JSON line per LLM call, for capacity planning; set LLM_USAGE_LOG= (empty) to disable
+LLM_USAGE_LOG = os.getenv("LLM_USAGE_LOG", ".cache/llm_usage.jsonl")
+
+# Recent calls kept in memory for the per-session and per-document summaries
+LLM_USAGE_MAX_RECORDS = int(os.getenv("LLM_USAGE_MAX_RECORDS", "20000"))
+
+# USD per million (prompt, output) tokens
+MODEL_PRICES = {
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+}
+
+# Attributed to every call made in the current context
+_session_id = contextvars.ContextVar("llm_usage_session", default=None)
+_document_id = contextvars.ContextVar("llm_usage_document", default=None)
+
+def new_usage_id():
+    """Return a new random session or document id."""
+    return uuid.uuid4().hex[:12]
+
+@contextlib.contextmanager
+def usage_scope(session_id=None, document_id=None):
+    """Attribute the LLM calls made inside this block to a session and/or document."""
+    tokens = []
+    if session_id is not None:
+        tokens.append((_session_id, _session_id.set(session_id)))
+    if document_id is not None:
+        tokens.append((_document_id, _document_id.set(document_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+def call_cost(model_name, prompt_tokens, output_tokens):
+    """Return the list-price cost in USD of a call, or 0.0 for unknown models."""
+    prompt_price, output_price = MODEL_PRICES.get(model_name, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + output_tokens * output_price) / 1_000_000
+
+class UsageTracker:
+    """Records token counts, latency and cost of every LLM call.
+
+    Records are kept in a bounded in-memory buffer for the results page and
+    appended to a JSONL log shared by every process.
+    """
+
+    def __init__(self, log_path=LLM_USAGE_LOG, max_records=LLM_USAGE_MAX_RECORDS):
+        self.log_path = Path(log_path) if log_path else None
+        self._records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    def record(self, model_name, prompt_tokens=0, output_tokens=0, latency=0.0, cached=False, streamed=False,
+               first_token_seconds=None, wait_seconds=0.0, retries=0, status="ok"):
+        """Record one call, attributed to the current session and document; returns the record."""
+        entry = {
+            "timestamp": time.time(),
+            "session_id": _session_id.get(),
+            "document_id": _document_id.get(),
+            "model": model_name,
+            "prompt_tokens": prompt_tokens,
+            "output_tokens": output_tokens,
+            "latency_seconds": round(latency, 4),
+            "first_token_seconds": round(first_token_seconds, 4) if first_token_seconds is not None else None,
+            "wait_seconds": round(wait_seconds, 4),
+            "retries": retries,
+            "cached": cached,
+            "streamed": streamed,
+            "status": status,
+            # Cached responses cost nothing
+            "cost_usd": 0.0 if cached else call_cost(model_name, prompt_tokens, output_tokens),
+        }
+        with self._lock:
+            self._records.append(entry)
+            if self.log_path:
+                try:
+                    self.log_path.parent.mkdir(parents=True, exist_ok=True)
+                    # One write per line, so appends from several processes do not interleave
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(entry) + "\n")
+                except Exception as e:
+                    logger.error(f"Error writing LLM usage log: {str(e)}")
+        return entry
+
+    def records(self, session_id=None, document_id=None):
+        """Return the recorded calls, optionally only those of one session or document."""
+        with self._lock:
+            records = list(self._records)
+        if session_id is not None:
+            records = [r for r in records if r["session_id"] == session_id]
+        if document_id is not None:
+            records = [r for r in records if r["document_id"] == document_id]
+        return records
+
+    def summary(self, session_id=None, document_id=None):
+        """Aggregate calls, tokens, latency and cost, in total and per model."""
+        records = self.records(session_id, document_id)
+        by_model = {}
+        for r in records:
+            model = by_model.setdefault(r["model"], {"calls": 0, "prompt_tokens": 0, "output_tokens": 0, "cost_usd": 0.0})
+            model["calls"] += 1
+            model["prompt_tokens"] += r["prompt_tokens"]
+            model["output_tokens"] += r["output_tokens"]
+            model["cost_usd"] += r["cost_usd"]
+        latencies = [r["latency_seconds"] for r in records if not r["cached"]]
+        return {
+            "calls": len(records),
+            "cached_calls": sum(1 for r in records if r["cached"]),
+            "failed_calls": sum(1 for r in records if r["status"] != "ok"),
+            "prompt_tokens": sum(r["prompt_tokens"] for r in records),
+            "output_tokens": sum(r["output_tokens"] for r in records),
+            "cost_usd": sum(r["cost_usd"] for r in records),
+            "total_latency_seconds": sum(latencies),
+            "max_latency_seconds": max(latencies, default=0.0),
+            "wait_seconds": sum(r["wait_seconds"] for r in records),
+            "by_model": by_model,
+        }
+
+# Shared by every caller in this process
+usage_tracker = UsageTracker()
@@ -0,0 +1,143 @@
+import os
+import re
+import time
+import logging
+
+from utils.llm_client import DEFAULT_MODEL
+from utils.llm_usage import call_cost, usage_tracker
+from utils.section_generation import generate_in_groups, group_variables
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Short fields go to the fast tier, long-form sections stay on the pro tier
+FAST_MODEL = os.getenv("FAST_MODEL", "gemini-1.5-flash")
+PRO_MODEL = os.getenv("PRO_MODEL", DEFAULT_MODEL)
+
+# Above this much prompt context every variable goes to the pro tier
+FAST_MAX_CONTEXT_TOKENS = int(os.getenv("FAST_MAX_CONTEXT_TOKENS", "16000"))
+
+# Variable names that denote short factual fields: the whole name or its last word,
+# so customer_name is simple but company_overview is not
+SIMPLE_FIELD = re.compile(
+    r'^(?:\w+_)?(?:name|date|title|subject|email|phone|contact|address|company|author|agent|signature|'
+    r'sender|recipient|reference|number|id|city|country|greeting|salutation)$'
+)
+
+# Output speed assumed for a model before any of its calls have been observed
+NOMINAL_SECONDS_PER_TOKEN = {
+    "gemini-1.5-pro": 1 / 50,
+    "gemini-1.5-flash": 1 / 150,
+}
+
+def inline_variables(template_text):
+    """Return the variables placed inside a line of text, as opposed to alone on their own line."""
+    inline = set()
+    for line in template_text.splitlines():
+        names = re.findall(r'{{\s*(\w+)\s*}}', line)
+        if names and re.sub(r'{{\s*\w+\s*}}', '', line).strip():
+            inline.update(names)
+    return inline
+
+class ModelRouter:
+    """Assigns each template variable to the fast or pro model.
+
+    A variable is simple, and goes to the fast model, when it sits inside a
+    line of template text (a name in a greeting, a date after a label) or
+    its name denotes a short field; a variable alone on its own line is a
+    long-form section and goes to the pro model. Large contexts always use
+    the pro model. Routing is off unless the template's "routing" entry
+    in templates/index.json sets "enabled": true; the entry can also list
+    "fast" and "pro" variables explicitly and change
+    "fast_max_context_tokens".
+    """
+
+    def __init__(self, template_text="", config=None, fast_model=FAST_MODEL, pro_model=PRO_MODEL):
+        self.config = config or {}
+        self.enabled = self.config.get("enabled", False)
+        self.fast_model = self.config.get("fast_model", fast_model)
+        self.pro_model = self.config.get("pro_model", pro_model)
+        self.max_fast_context = self.config.get("fast_max_context_tokens", FAST_MAX_CONTEXT_TOKENS)
+        self.fast = set(self.config.get("fast", []))
+        self.pro = set(self.config.get("pro", []))
+        self.inline = inline_variables(template_text or "")
+
+    def is_simple(self, variable):
+        if variable in self.fast:
+            return True
+        if variable in self.pro:
+            return False
+        return variable in self.inline or bool(SIMPLE_FIELD.match(variable.lower()))
+
+    def assign(self, variables, context_tokens=0):
+        """Return {variable: model name} for a prompt carrying context_tokens of source context."""
+        if not self.enabled or context_tokens > self.max_fast_context:
+            return {var: self.pro_model for var in variables}
+        return {var: self.fast_model if self.is_simple(var) else self.pro_model for var in variables}
+
+def routed_groups(variables, models, group_size=None):
+    """Split variables into single-model groups in template order, optionally of at most group_size."""
+    groups = []
+    for model in dict.fromkeys(models[var] for var in variables):
+        tier = [var for var in variables if models[var] == model]
+        groups.extend(group_variables(tier, group_size) if group_size else [tier])
+    return groups
+
+def generate_routed(variables, generate_group, models, group_size=None, on_variable=None, report=None):
+    """Generate each model's variables in separate concurrent calls.
+
+    generate_group(group, on_variable, model_name) must return a
+    {variable: content} dict; models maps each variable to its model.
+    """
+    groups = routed_groups(variables, models, group_size)
+    tiers = {}
+    for var in variables:
+        tiers.setdefault(models[var], []).append(var)
+    logger.info("Routing " + ", ".join(f"{len(tier)} variables to {model}" for model, tier in tiers.items()))
+    if report is not None:
+        report["routing"] = tiers
+        report["routing_started"] = time.time()
+
+    return generate_in_groups(
+        variables,
+        lambda group, emit: generate_group(group, emit, models[group[0]]),
+        groups=groups,
+        on_variable=on_variable,
+        report=report
+    )
+
+def seconds_per_token(model_name):
+    """Observed seconds per output token of a model in this process, or its nominal speed."""
+    records = [r for r in usage_tracker.records() if r["model"] == model_name and not r["cached"] and r["status"] == "ok"]
+    tokens = sum(r["output_tokens"] for r in records)
+    if tokens:
+        return sum(r["latency_seconds"] for r in records) / tokens
+    return NOMINAL_SECONDS_PER_TOKEN.get(model_name, NOMINAL_SECONDS_PER_TOKEN.get(PRO_MODEL, 1 / 50))
+
+def routing_savings(records, pro_model=PRO_MODEL, since=None):
+    """Estimate the cost and latency saved by routing a document's generation calls.
+
+    Without routing, the pro call would have written the routed variables
+    too, in the same prompt. So each routed call saves its output tokens at
+    the pro price, minus its whole cost: its prompt repeats the source
+    context and is pure overhead. The tiers run concurrently, so latency is
+    compared as wall-clock time: the longest call against the longest pro
+    call plus the routed output at the pro model's speed. Pass since (the
+    report's "routing_started") to leave out earlier calls of the document,
+    such as summaries.
+    """
+    calls = [
+        r for r in records
+        if not r["cached"] and r["status"] == "ok" and (since is None or r["timestamp"] >= since)
+    ]
+    routed = [r for r in calls if r["model"] != pro_model]
+    if not routed:
+        return {"calls": 0, "cost_saved_usd": 0.0, "latency_saved_seconds": 0.0}
+
+    routed_tokens = sum(r["output_tokens"] for r in routed)
+    cost_saved = call_cost(pro_model, 0, routed_tokens) - sum(r["cost_usd"] for r in routed)
+    pro_seconds = max((r["latency_seconds"] for r in calls if r["model"] == pro_model), default=0.0)
+    wall_clock = max(r["latency_seconds"] for r in calls)
+    latency_saved = pro_seconds + routed_tokens * seconds_per_token(pro_model) - wall_clock
+    return {"calls": len(routed), "cost_saved_usd": cost_saved, "latency_saved_seconds": latency_saved}
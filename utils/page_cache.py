@@ -0,0 +1,156 @@
+import os
+import time
+import zlib
+import sqlite3
+import logging
+import contextlib
+from pathlib import Path
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# SQLite database of extracted page text, shared by every Streamlit worker process
+SCRAPE_CACHE_PATH = Path(os.getenv("SCRAPE_CACHE_PATH", ".cache/scraped_pages.sqlite3"))
+
+# Pages validated within this many seconds are served without any request;
+# older ones are revalidated with a conditional GET
+SCRAPE_CACHE_FRESHNESS = int(os.getenv("SCRAPE_CACHE_FRESHNESS", "3600"))
+
+# Least recently used pages are evicted beyond this much compressed text
+SCRAPE_CACHE_MAX_BYTES = int(os.getenv("SCRAPE_CACHE_MAX_MB", "64")) * 1024 * 1024
+
+# Set SCRAPE_CACHE_DISABLED=1 to always fetch pages in full
+SCRAPE_CACHE_DISABLED = os.getenv("SCRAPE_CACHE_DISABLED", "").lower() in ("1", "true", "yes")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    text BLOB NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    size INTEGER NOT NULL,
+    validated REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_last_access ON pages (last_access);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+class PageCache:
+    """Persistent cache of extracted page text with HTTP validators, stored zlib-compressed in SQLite.
+
+    get() returns the entry and whether it is still fresh; a stale entry's
+    ETag and Last-Modified are used for a conditional GET, and a 304 answer
+    only marks it validated again. Like the LLM response cache, the database
+    runs in WAL mode with one short-lived connection per operation.
+    """
+
+    def __init__(self, path=SCRAPE_CACHE_PATH, freshness=SCRAPE_CACHE_FRESHNESS, max_bytes=SCRAPE_CACHE_MAX_BYTES):
+        self.path = Path(path)
+        self.freshness = freshness
+        self.max_bytes = max_bytes
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._initialized = True
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, url):
+        """Return {"text", "etag", "last_modified", "fresh"} for a cached page, or None."""
+        now = time.time()
+        with contextlib.closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT text, etag, last_modified, validated FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                self._count(conn, "misses")
+                return None
+            conn.execute("UPDATE pages SET last_access = ? WHERE url = ?", (now, url))
+            fresh = now - row[3] <= self.freshness
+            if fresh:
+                self._count(conn, "hits")
+        return {
+            "text": zlib.decompress(row[0]).decode("utf-8"),
+            "etag": row[1],
+            "last_modified": row[2],
+            "fresh": fresh,
+        }
+
+    def put(self, url, text, etag=None, last_modified=None):
+        """Store a page's extracted text and validators, then evict least recently used pages over the limit."""
+        now = time.time()
+        data = zlib.compress(text.encode("utf-8"), 6)
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO pages (url, text, etag, last_modified, size, validated, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (url, data, etag, last_modified, len(data), now, now)
+                )
+                self._evict(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def revalidated(self, url):
+        """Mark a cached page as fresh again after a 304 Not Modified answer."""
+        now = time.time()
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("UPDATE pages SET validated = ?, last_access = ? WHERE url = ?", (now, now, url))
+            self._count(conn, "revalidations")
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for url, size in conn.execute("SELECT url, size FROM pages ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+            total -= size
+            evicted += 1
+        self._count(conn, "evictions", evicted)
+
+    def _count(self, conn, name, amount=1):
+        """Add to a shared counter."""
+        conn.execute(
+            "INSERT INTO stats (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?",
+            (name, amount, amount)
+        )
+
+    def stats(self):
+        """Return hit, revalidation, miss and eviction counters and the current size of the cache."""
+        with contextlib.closing(self._connect()) as conn:
+            counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+        return {
+            "hits": counters.get("hits", 0),
+            "revalidations": counters.get("revalidations", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def clear(self):
+        """Remove every cached page and reset the counters."""
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("DELETE FROM pages")
+            conn.execute("DELETE FROM stats")
+
+# Shared by every caller in this process
+page_cache = PageCache()
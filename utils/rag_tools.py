@@ -1,23 +1,35 @@
 import streamlit as st
-import google.generativeai as genai
-import os
 import re
 from tqdm import tqdm
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
 import logging
 from bs4 import BeautifulSoup
 import markdown
 
+from utils.index_cache import (
+    index_key,
+    load_index,
+    save_index,
+    encode_strings,
+    PackedStrings
+)
+from utils.bm25 import BM25Index, top_k_indices, top_k_per_column
+from utils.vector_store import DenseVectorIndex
+from utils.knowledge_base import load_knowledge_base_index
+from utils.reranking import mmr_rerank, MMR_FETCH_FACTOR, MAX_MMR_CANDIDATES
+from utils.tokens import estimate_tokens
+from utils.context_packer import DEFAULT_RAG_BUDGET, MIN_PARTIAL_TOKENS, pack_chunks
+from utils.llm_client import DEFAULT_MODEL, generate_json_streaming
+from utils.section_generation import generate_in_groups
+from utils.model_routing import generate_routed
+from utils.response_processing import process_variables_response
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Configure Gemini API
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=GOOGLE_API_KEY)
-
 def preprocess_text(text):
     """Preprocess text for embedding and retrieval."""
     # Convert to lowercase
@@ -28,35 +40,109 @@ def preprocess_text(text):
     text = re.sub(r'\s+', ' ', text).strip()
     return text
 
-def chunk_text(text, chunk_size=1000, overlap=200):
-    """Split text into overlapping chunks."""
-    # Split the text into sentences
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    chunks = []
-    current_chunk = ""
+# Sentence boundaries: whitespace that follows sentence-ending punctuation
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+def iter_sentence_spans(text, start=0, end=None):
+    """Yield (start, end) offsets of the non-empty sentences in text[start:end]."""
+    if end is None:
+        end = len(text)
+    pos = start
+    for match in SENTENCE_BOUNDARY.finditer(text, start, end):
+        if match.start() > pos:
+            yield pos, match.start()
+        pos = match.end()
+    if end > pos:
+        yield pos, end
+
+def iter_chunk_offsets(text, chunk_size=1000, overlap=200, start=0, end=None):
+    """Lazily split text into overlapping sentence-aligned chunks, yielding (start, end) offsets."""
+    chunk_start = chunk_end = None
     
-    for sentence in sentences:
+    for sentence_start, sentence_end in iter_sentence_spans(text, start, end):
+        if chunk_start is None:
+            chunk_start, chunk_end = sentence_start, sentence_end
+            continue
+        
+        chunk_length = chunk_end - chunk_start
         # If adding this sentence would exceed the chunk size
-        if len(current_chunk) + len(sentence) > chunk_size and current_chunk:
-            chunks.append(current_chunk)
+        if chunk_length + (sentence_end - sentence_start) > chunk_size:
+            yield chunk_start, chunk_end
             # Keep the overlap from the end of the current chunk
-            if len(current_chunk) > overlap:
-                current_chunk = current_chunk[-overlap:] + " " + sentence
+            if chunk_length > overlap:
+                chunk_start = chunk_end - overlap
             else:
-                current_chunk = sentence
-        else:
-            current_chunk += " " + sentence if current_chunk else sentence
+                chunk_start = sentence_start
+        chunk_end = sentence_end
     
-    # Add the last chunk if it's not empty
-    if current_chunk:
-        chunks.append(current_chunk)
+    # Emit the last chunk if it's not empty
+    if chunk_start is not None:
+        yield chunk_start, chunk_end
+
+# Separator placed between documents when several sources share one index
+DOCUMENT_SEPARATOR = "\n\n"
+
+def chunk_spans(text, chunk_size=1000, overlap=200):
+    """Return the chunk offsets of text as an (n, 2) int64 array."""
+    flat = np.fromiter(
+        (offset for span in iter_chunk_offsets(text, chunk_size, overlap) for offset in span),
+        dtype=np.int64
+    )
+    return flat.reshape(-1, 2)
+
+def chunk_documents(documents, chunk_size=1000, overlap=200):
+    """Chunk several documents into one TextChunks, recording each chunk's source document.
     
-    return chunks
+    Documents are joined with DOCUMENT_SEPARATOR but chunked separately, so no
+    chunk spans two documents and every chunk maps back to exactly one source.
+    """
+    text = DOCUMENT_SEPARATOR.join(documents)
+    
+    def iter_spans():
+        base = 0
+        for doc_id, document in enumerate(documents):
+            for start, end in iter_chunk_offsets(text, chunk_size, overlap, base, base + len(document)):
+                yield start
+                yield end
+                yield doc_id
+            base += len(document) + len(DOCUMENT_SEPARATOR)
+    
+    flat = np.fromiter(iter_spans(), dtype=np.int64).reshape(-1, 3)
+    return TextChunks(text, flat[:, :2], flat[:, 2])
+
+class TextChunks:
+    """Read-only sequence of chunks sliced on demand from the original text.
+    
+    spans holds the (start, end) character offsets of each chunk and doc_ids
+    the index of the source document it came from.
+    """
+
+    def __init__(self, text, spans, doc_ids=None):
+        self.text = text
+        self.spans = spans
+        self.doc_ids = doc_ids if doc_ids is not None else np.zeros(len(spans), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        start, end = self.spans[i]
+        return self.text[start:end]
+
+    def __iter__(self):
+        for start, end in self.spans:
+            yield self.text[start:end]
+
+def chunk_text(text, chunk_size=1000, overlap=200):
+    """Split text into overlapping chunks."""
+    return [text[start:end] for start, end in iter_chunk_offsets(text, chunk_size, overlap)]
 
 def create_embeddings(chunks):
     """Create TF-IDF embeddings for text chunks."""
-    # Process chunks for TF-IDF
-    processed_chunks = [preprocess_text(chunk) for chunk in chunks]
+    # Process chunks for TF-IDF lazily, so callers can pass a generator
+    processed_chunks = (preprocess_text(chunk) for chunk in chunks)
     
     # Create TF-IDF vectorizer
     vectorizer = TfidfVectorizer()
@@ -72,37 +158,206 @@ def retrieve_relevant_chunks(query, chunks, tfidf_matrix, vectorizer, top_k=3):
     # Transform the query to TF-IDF
     query_vector = vectorizer.transform([processed_query])
     
-    # Calculate similarity scores
-    similarity_scores = cosine_similarity(query_vector, tfidf_matrix).flatten()
+    # TF-IDF rows are L2-normalized, so a sparse dot product is the cosine similarity
+    similarity_scores = (tfidf_matrix @ query_vector.T).toarray().ravel()
     
-    # Get the indices of the top_k most similar chunks
-    top_indices = similarity_scores.argsort()[-top_k:][::-1]
+    # Get the indices of the top_k most similar chunks without a full sort
+    top_indices = top_k_indices(similarity_scores, top_k)
     
     # Return the top chunks and their scores
     return [(chunks[i], similarity_scores[i]) for i in top_indices]
 
-def generate_rag_content(user_query, variables, knowledge_data):
-    """Generate content using RAG approach with local knowledge."""
-    if not knowledge_data:
-        return {}
+class TfidfIndex:
+    """TF-IDF retrieval engine over a fitted vectorizer and chunk matrix."""
+
+    engine = "tfidf"
+
+    def __init__(self, tfidf_matrix, vectorizer):
+        self.tfidf_matrix = tfidf_matrix
+        self.vectorizer = vectorizer
+
+    @classmethod
+    def build(cls, chunks):
+        """Fit the vectorizer and embed an iterable of chunk strings."""
+        tfidf_matrix, vectorizer = create_embeddings(chunks)
+        return cls(tfidf_matrix.tocsr(), vectorizer)
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        """Rebuild the fitted vectorizer and matrix from (memory-mapped) cached arrays."""
+        vocabulary = PackedStrings(arrays["vocab_buffer"], arrays["vocab_offsets"])
+        vectorizer = TfidfVectorizer(vocabulary=list(vocabulary))
+        vectorizer.idf_ = np.asarray(arrays["idf"])
+        tfidf_matrix = sparse.csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]),
+            shape=tuple(meta["shape"])
+        )
+        return cls(tfidf_matrix, vectorizer)
+
+    def to_arrays(self):
+        """Return (arrays, metadata) suitable for utils.index_cache.save_index."""
+        vocab_buffer, vocab_offsets = encode_strings(self.vectorizer.get_feature_names_out().tolist())
+        arrays = {
+            "vocab_buffer": vocab_buffer,
+            "vocab_offsets": vocab_offsets,
+            "idf": self.vectorizer.idf_,
+            "data": self.tfidf_matrix.data,
+            "indices": self.tfidf_matrix.indices,
+            "indptr": self.tfidf_matrix.indptr,
+        }
+        return arrays, {"engine": self.engine, "shape": list(self.tfidf_matrix.shape)}
+
+    def search(self, query, top_k=3):
+        """Return [(chunk index, score)] for the top_k most similar chunks sharing a term with the query."""
+        return [
+            (int(i), float(score))
+            for i, score in retrieve_relevant_chunks(
+                query, range(self.tfidf_matrix.shape[0]), self.tfidf_matrix, self.vectorizer, top_k
+            )
+            if score > 0
+        ]
+
+    def search_batch(self, queries, top_k=3):
+        """Score several queries with one sparse-dense multiply; returns one hit list per query."""
+        query_matrix = self.vectorizer.transform([preprocess_text(query) for query in queries])
+        # (chunks x terms) @ (terms x queries) -> dense (chunks x queries) similarities
+        scores = self.tfidf_matrix @ query_matrix.T.toarray()
+        best = top_k_per_column(scores, top_k)
+        # Chunks sharing no term with a query are left out, as BM25 does
+        return [
+            [(int(i), float(scores[i, q])) for i in best[:, q] if scores[i, q] > 0]
+            for q in range(len(queries))
+        ]
+
+# Retrieval engines selectable from the verify page
+RETRIEVAL_ENGINES = {
+    "tfidf": TfidfIndex,
+    "bm25": BM25Index,
+    "dense": DenseVectorIndex,
+}
+
+def load_or_build_index(documents, retrieval_method="tfidf", chunk_size=1000, overlap=200):
+    """Return (chunks, index) for one text or a list of documents, reusing the on-disk index cache."""
+    if isinstance(documents, str):
+        documents = [documents]
+    text = DOCUMENT_SEPARATOR.join(documents)
     
-    # Chunk the knowledge data
-    chunks = chunk_text(knowledge_data)
+    engine = RETRIEVAL_ENGINES[retrieval_method]
+    key = index_key(
+        text,
+        engine=retrieval_method,
+        chunk_size=chunk_size,
+        overlap=overlap,
+        document_lengths=[len(document) for document in documents]
+    )
     
-    # Create embeddings
-    tfidf_matrix, vectorizer = create_embeddings(chunks)
+    cached = load_index(key)
+    if cached is not None:
+        arrays, meta = cached
+        # The key is derived from the text, so the stored offsets slice it directly
+        chunks = TextChunks(text, arrays["chunk_spans"], arrays["chunk_doc_ids"])
+        logger.info(f"Loaded cached {retrieval_method} index {key[:12]} ({len(chunks)} chunks)")
+        return chunks, engine.from_arrays(arrays, meta)
     
-    # Retrieve relevant chunks
-    relevant_chunks = retrieve_relevant_chunks(
-        user_query, chunks, tfidf_matrix, vectorizer
-    )
+    # Only offsets are materialized; chunk strings are sliced on demand
+    chunks = chunk_documents(documents, chunk_size=chunk_size, overlap=overlap)
+    index = engine.build(chunks)
     
-    # Format relevant chunks for the prompt
-    formatted_chunks = "\n\n".join(
-        [f"CHUNK (relevance: {score:.2f}):\n{chunk}" for chunk, score in relevant_chunks]
-    )
+    arrays, meta = index.to_arrays()
+    arrays.update(chunk_spans=chunks.spans, chunk_doc_ids=chunks.doc_ids)
+    save_index(key, arrays, meta)
+    logger.info(f"Built {retrieval_method} index {key[:12]} ({len(chunks)} chunks)")
+    return chunks, index
+
+def build_variable_query(user_query, variable):
+    """Build a retrieval query focused on one template variable."""
+    return f"{variable.replace('_', ' ')} {user_query}"
+
+def retrieve_context(index, chunks, user_query, variables, top_k=3, per_variable=False, per_variable_top_k=2, mmr_lambda=None, token_budget=None, report=None):
+    """Retrieve the chunks to put in a RAG prompt.
+    
+    Returns the de-duplicated [(chunk index, score, text)] hits (user query
+    hits first) and a {variable: [chunk index]} map of the context selected
+    for each variable (empty unless per_variable). All queries are scored in
+    one batched pass. With mmr_lambda set, the user query hits are re-ranked
+    with Maximal Marginal Relevance from a larger candidate pool. With a
+    token_budget, the budget rather than top_k decides how many chunks are
+    used: candidates are packed greedily and the last one may be truncated
+    at a sentence boundary.
+    """
+    priority_k = top_k
+    if token_budget is not None:
+        # Over-fetch so the budget, not a fixed count, limits the context
+        top_k = max(top_k, token_budget // MIN_PARTIAL_TOKENS)
+    fetch_k = min(top_k * MMR_FETCH_FACTOR, max(top_k, MAX_MMR_CANDIDATES)) if mmr_lambda is not None else top_k
+    if per_variable:
+        queries = [user_query] + [build_variable_query(user_query, var) for var in variables]
+        results = index.search_batch(queries, top_k=max(fetch_k, per_variable_top_k))
+    else:
+        results = [index.search(user_query, top_k=fetch_k)]
+    
+    query_hits = results[0]
+    if mmr_lambda is not None:
+        # A large budget over-fetches many candidates; only the best ones are re-ranked
+        pool = query_hits[:MAX_MMR_CANDIDATES]
+        measure = None
+        if token_budget is not None:
+            # Compare only what each ranking would get into the prompt under the same budget
+            def measure(order):
+                packed_ids = {i for i, _, _ in pack_chunks([pool[p] for p in order], chunks, token_budget)[0]}
+                return [p for p in order if pool[p][0] in packed_ids]
+        query_hits, mmr_stats = mmr_rerank(
+            pool, [chunks[i] for i, _ in pool], top_k, lambda_mult=mmr_lambda, measure=measure
+        )
+        logger.info(
+            f"MMR kept {mmr_stats['selected']} of {mmr_stats['candidates']} candidates, "
+            f"saving ~{mmr_stats['tokens_saved']} redundant tokens"
+        )
+        if report is not None:
+            report["mmr"] = mmr_stats
+    else:
+        query_hits = query_hits[:top_k]
+    
+    # Priority order: the best query hits, then each variable's picks, then the rest of the pool
+    selected = dict(query_hits[:priority_k])
+    per_variable_chunks = {}
+    for var, hits in zip(variables, results[1:]):
+        per_variable_chunks[var] = []
+        for i, score in hits[:per_variable_top_k]:
+            selected.setdefault(i, score)
+            per_variable_chunks[var].append(i)
+    for i, score in query_hits[priority_k:]:
+        selected.setdefault(i, score)
+    
+    if token_budget is None:
+        return [(i, score, chunks[i]) for i, score in selected.items()], per_variable_chunks
+    
+    packed, used = pack_chunks(list(selected.items()), chunks, token_budget)
+    packed_ids = {i for i, _, _ in packed}
+    per_variable_chunks = {
+        var: [i for i in indices if i in packed_ids] for var, indices in per_variable_chunks.items()
+    }
+    logger.info(f"Packed {len(packed)} of {len(selected)} candidate chunks into ~{used} of {token_budget} tokens")
+    if report is not None:
+        report["context_budget"] = token_budget
+        report["context_candidates"] = len(selected)
+    return packed, per_variable_chunks
+
+def format_variable_guide(per_variable, chunk_numbers):
+    """Describe which numbered chunks to draw on for each variable."""
+    if not per_variable:
+        return ""
+    lines = ["Most relevant chunks for each variable:"]
+    for var, indices in per_variable.items():
+        numbers = ", ".join(str(chunk_numbers[i]) for i in indices)
+        lines.append(f"- {var}: CHUNK {numbers}" if numbers else f"- {var}: use the general knowledge above")
+    return "\n    ".join(lines)
+
+def generate_from_context(user_query, variables, formatted_chunks, variable_guide="", source_label="RAG", on_variable=None, model_name=DEFAULT_MODEL):
+    """Generate content for the given variables with Gemini from formatted retrieved context.
     
-    # Generate content with Gemini
+    The response is streamed; on_variable(name, value) is called as each value completes.
+    """
     prompt = f"""
     Generate content for a document based on the following:
     
@@ -114,166 +369,132 @@ def generate_rag_content(user_query, variables, knowledge_data):
     Please provide content for the following variables to be used in a document template:
     {', '.join(variables)}
     
+    {variable_guide}
+    
     For each variable, provide accurate, relevant, and well-written content based on the information in the sources.
     Format your response as JSON with each variable as a key.
     Ensure the content is properly formatted and professional.
     """
     
     try:
-        model = genai.GenerativeModel('gemini-1.5-pro')
-        response = model.generate_content(prompt)
-        
-        # Extract JSON from response
-        content = response.text
-        
-        # Try to find JSON in the response
-        json_match = re.search(r'```json\s*([\s\S]*?)\s*```', content)
-        if json_match:
-            json_str = json_match.group(1)
-        else:
-            # Assume the entire response is JSON
-            json_str = content
-            
-        # Clean up the JSON string
-        json_str = json_str.strip()
-        
-        # Parse JSON
-        try:
-            import json
-            variables_content = json.loads(json_str)
-            
-            # Clean up any markdown formatting from the content
-            for key in variables_content:
-                if isinstance(variables_content[key], str):
-                    # Remove markdown headings, bold, italic, etc.
-                    variables_content[key] = re.sub(r'^#+\s+', '', variables_content[key], flags=re.MULTILINE)  # Remove heading markers
-                    variables_content[key] = re.sub(r'\*\*(.*?)\*\*', r'\1', variables_content[key])  # Remove bold
-                    variables_content[key] = re.sub(r'\*(.*?)\*', r'\1', variables_content[key])  # Remove italic
-                    variables_content[key] = re.sub(r'`(.*?)`', r'\1', variables_content[key])  # Remove code ticks
-                    variables_content[key] = re.sub(r'```.*?```', '', variables_content[key], flags=re.DOTALL)  # Remove code blocks
-                    variables_content[key] = re.sub(r'<[^>]*>', '', variables_content[key])  # Remove HTML tags
-            
-            return variables_content
-        except json.JSONDecodeError:
-            # If parsing fails, try to create a JSON object manually
-            variables_content = {}
-            for var in variables:
-                pattern = fr'["\']?{var}["\']?\s*:\s*["\']([^"\']+)["\']'
-                match = re.search(pattern, json_str)
-                if match:
-                    variables_content[var] = match.group(1)
-                else:
-                    variables_content[var] = f"[Content for {var} not found]"
-            return variables_content
-            
+        content = generate_json_streaming(prompt, on_variable, model_name=model_name)
+        return process_variables_response(content, variables)
     except Exception as e:
-        logger.error(f"Error generating content with RAG: {str(e)}")
+        logger.error(f"Error generating content with {source_label}: {str(e)}")
         return {var: f"[Error generating content for {var}]" for var in variables}
 
+def generate_rag_content(user_query, variables, knowledge_data, retrieval_method="tfidf", per_variable=False, knowledge_base=None, mmr_lambda=None, token_budget=DEFAULT_RAG_BUDGET, group_size=None, on_variable=None, report=None, router=None):
+    """Generate content using RAG approach with local knowledge or a persistent knowledge base.
+    
+    Retrieved chunks are packed into token_budget tokens of context. With a
+    group_size, variables are generated concurrently in groups of that size;
+    with a ModelRouter, simple fields go to the fast model in separate calls.
+    on_variable(name, value) is called as each streamed value completes.
+    If a report dict is passed, retrieval statistics are added to it.
+    """
+    kb_documents = None
+    if knowledge_base:
+        # Persistent knowledge bases are already indexed, segment by segment
+        loaded = load_knowledge_base_index(knowledge_base)
+        if loaded is None:
+            return {}
+        chunks, index, kb_documents = loaded
+    elif not knowledge_data:
+        return {}
+    else:
+        # Chunk and index the knowledge data (or reuse a cached index)
+        chunks, index = load_or_build_index(knowledge_data, retrieval_method)
+    
+    # Retrieve relevant chunks, optionally with focused context for each variable
+    hits, per_variable_chunks = retrieve_context(
+        index, chunks, user_query, variables, top_k=3,
+        per_variable=per_variable, mmr_lambda=mmr_lambda, token_budget=token_budget, report=report
+    )
+    chunk_numbers = {i: n + 1 for n, (i, _, _) in enumerate(hits)}
+    
+    # Format relevant chunks for the prompt, citing the source document when known
+    formatted_chunks = "\n\n".join(
+        [
+            f"CHUNK {chunk_numbers[i]} (relevance: {score:.2f}):\n"
+            + (f"Source: {kb_documents[chunks.doc_ids[i]]['name']}\n" if kb_documents else "")
+            + text
+            for i, score, text in hits
+        ]
+    )
+    if report is not None:
+        report["context_chunks"] = len(hits)
+        report["context_tokens"] = estimate_tokens(formatted_chunks)
+    
+    # Generate content with Gemini, optionally in concurrent groups of variables
+    def generate_group(group, emit, model_name=DEFAULT_MODEL):
+        group_guide = format_variable_guide(
+            {var: per_variable_chunks[var] for var in group if var in per_variable_chunks}, chunk_numbers
+        )
+        return generate_from_context(
+            user_query, group, formatted_chunks, group_guide, source_label="RAG", on_variable=emit, model_name=model_name
+        )
+    
+    if router is not None:
+        models = router.assign(variables, estimate_tokens(formatted_chunks))
+        return generate_routed(variables, generate_group, models, group_size, on_variable=on_variable, report=report)
+    if group_size:
+        return generate_in_groups(variables, generate_group, group_size, on_variable=on_variable, report=report)
+    return generate_group(variables, on_variable)
+
 def extract_text_from_html(html_content):
     """Extract plain text from HTML content."""
     soup = BeautifulSoup(html_content, 'html.parser')
     return soup.get_text()
 
-def create_rag_from_scraped_content(search_results, scraped_contents, user_query, variables):
-    """Create RAG from scraped web content."""
+def create_rag_from_scraped_content(search_results, scraped_contents, user_query, variables, retrieval_method="tfidf", per_variable=False, mmr_lambda=None, token_budget=DEFAULT_RAG_BUDGET, group_size=None, on_variable=None, report=None, router=None):
+    """Create RAG from scraped web content.
+    
+    Retrieved chunks are packed into token_budget tokens of context. With a
+    group_size, variables are generated concurrently in groups of that size;
+    with a ModelRouter, simple fields go to the fast model in separate calls.
+    on_variable(name, value) is called as each streamed value completes.
+    If a report dict is passed, retrieval statistics are added to it.
+    """
     if not search_results or not scraped_contents:
         return {}
     
-    # Combine all scraped content
-    combined_content = "\n\n".join(scraped_contents)
-    
-    # Chunk the combined content
-    chunks = chunk_text(combined_content)
-    
-    # Create embeddings
-    tfidf_matrix, vectorizer = create_embeddings(chunks)
+    # Chunk and index each scraped page, remembering which page every chunk came from
+    chunks, index = load_or_build_index(scraped_contents, retrieval_method)
     
-    # Retrieve relevant chunks
-    relevant_chunks = retrieve_relevant_chunks(
-        user_query, chunks, tfidf_matrix, vectorizer, top_k=5
+    # Retrieve relevant chunks, optionally with focused context for each variable
+    hits, per_variable_chunks = retrieve_context(
+        index, chunks, user_query, variables, top_k=5,
+        per_variable=per_variable, mmr_lambda=mmr_lambda, token_budget=token_budget, report=report
     )
+    chunk_numbers = {i: n + 1 for n, (i, _, _) in enumerate(hits)}
     
     # Format relevant chunks for the prompt with their sources
     formatted_chunks = ""
-    for i, (chunk, score) in enumerate(relevant_chunks):
-        source_idx = 0
-        for j, content in enumerate(scraped_contents):
-            if chunk in content:
-                source_idx = j
-                break
+    for n, (chunk_idx, score, chunk) in enumerate(hits):
+        source_idx = int(chunks.doc_ids[chunk_idx])
         
         if source_idx < len(search_results):
             source_info = f"Source: {search_results[source_idx]['title']} ({search_results[source_idx]['link']})"
         else:
             source_info = "Source: Unknown"
             
-        formatted_chunks += f"CHUNK {i+1} (relevance: {score:.2f}):\n{source_info}\n{chunk}\n\n"
+        formatted_chunks += f"CHUNK {n+1} (relevance: {score:.2f}):\n{source_info}\n{chunk}\n\n"
+    if report is not None:
+        report["context_chunks"] = len(hits)
+        report["context_tokens"] = estimate_tokens(formatted_chunks)
     
-    # Generate content with Gemini
-    prompt = f"""
-    Generate content for a document based on the following:
-    
-    User Query: {user_query}
-    
-    Relevant Knowledge:
-    {formatted_chunks}
-    
-    Please provide content for the following variables to be used in a document template:
-    {', '.join(variables)}
-    
-    For each variable, provide accurate, relevant, and well-written content based on the information in the sources.
-    Format your response as JSON with each variable as a key.
-    Ensure the content is properly formatted and professional.
-    """
+    # Generate content with Gemini, optionally in concurrent groups of variables
+    def generate_group(group, emit, model_name=DEFAULT_MODEL):
+        group_guide = format_variable_guide(
+            {var: per_variable_chunks[var] for var in group if var in per_variable_chunks}, chunk_numbers
+        )
+        return generate_from_context(
+            user_query, group, formatted_chunks, group_guide, source_label="web RAG", on_variable=emit, model_name=model_name
+        )
     
-    try:
-        model = genai.GenerativeModel('gemini-1.5-pro')
-        response = model.generate_content(prompt)
-        
-        # Extract JSON from response
-        content = response.text
-        
-        # Parse JSON
-        try:
-            import json
-            # Try to find JSON in the response
-            json_match = re.search(r'```json\s*([\s\S]*?)\s*```', content)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                # Assume the entire response is JSON
-                json_str = content
-                
-            # Clean up the JSON string
-            json_str = json_str.strip()
-            
-            variables_content = json.loads(json_str)
-            
-            # Clean up any markdown formatting from the content
-            for key in variables_content:
-                if isinstance(variables_content[key], str):
-                    # Remove markdown headings, bold, italic, etc.
-                    variables_content[key] = re.sub(r'^#+\s+', '', variables_content[key], flags=re.MULTILINE)  # Remove heading markers
-                    variables_content[key] = re.sub(r'\*\*(.*?)\*\*', r'\1', variables_content[key])  # Remove bold
-                    variables_content[key] = re.sub(r'\*(.*?)\*', r'\1', variables_content[key])  # Remove italic
-                    variables_content[key] = re.sub(r'`(.*?)`', r'\1', variables_content[key])  # Remove code ticks
-                    variables_content[key] = re.sub(r'```.*?```', '', variables_content[key], flags=re.DOTALL)  # Remove code blocks
-                    variables_content[key] = re.sub(r'<[^>]*>', '', variables_content[key])  # Remove HTML tags
-            
-            return variables_content
-        except json.JSONDecodeError:
-            # If parsing fails, try to create a JSON object manually
-            variables_content = {}
-            for var in variables:
-                pattern = fr'["\']?{var}["\']?\s*:\s*["\']([^"\']+)["\']'
-                match = re.search(pattern, json_str)
-                if match:
-                    variables_content[var] = match.group(1)
-                else:
-                    variables_content[var] = f"[Content for {var} not found]"
-            return variables_content
-            
-    except Exception as e:
-        logger.error(f"Error generating content with web RAG: {str(e)}")
-        return {var: f"[Error generating content for {var}]" for var in variables}
\ No newline at end of file
+    if router is not None:
+        models = router.assign(variables, estimate_tokens(formatted_chunks))
+        return generate_routed(variables, generate_group, models, group_size, on_variable=on_variable, report=report)
+    if group_size:
+        return generate_in_groups(variables, generate_group, group_size, on_variable=on_variable, report=report)
+    return generate_group(variables, on_variable)
\ No newline at end of file
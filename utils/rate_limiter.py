@@ -0,0 +1,103 @@
+import time
+import random
+import logging
+import threading
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at rate_per_minute.
+
+    The balance may go negative when usage is charged after the fact (e.g.
+    output tokens), which simply delays the next acquirers.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Take amount tokens now and return how long the caller must wait before using them."""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Requests larger than the bucket would otherwise wait forever
+            amount = min(amount, self.capacity)
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def charge(self, amount):
+        """Deduct tokens used after the fact without waiting."""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= amount
+
+class RateLimiter:
+    """Process-wide requests-per-minute and tokens-per-minute budget with wait metrics."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.lock = threading.Lock()
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.total_requests = 0
+        self.waited_requests = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.retries = 0
+
+    def acquire(self, estimated_tokens):
+        """Block until one request and estimated_tokens fit in the budget; returns the time waited."""
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        with self.lock:
+            self.total_requests += 1
+            if wait > 0:
+                self.waited_requests += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                self.queue_depth += 1
+                self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        if wait > 0:
+            logger.info(f"Rate limit: waiting {wait:.1f}s ({self.queue_depth} requests queued)")
+            try:
+                time.sleep(wait)
+            finally:
+                with self.lock:
+                    self.queue_depth -= 1
+        return wait
+
+    def charge_tokens(self, tokens):
+        """Account for tokens that were not known when the request was admitted."""
+        self.tokens.charge(tokens)
+
+    def record_retry(self):
+        with self.lock:
+            self.retries += 1
+
+    def metrics(self):
+        """Return queue depth, wait-time and retry counters."""
+        with self.lock:
+            return {
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "requests": self.total_requests,
+                "waited_requests": self.waited_requests,
+                "total_wait_seconds": self.total_wait,
+                "max_wait_seconds": self.max_wait,
+                "average_wait_seconds": self.total_wait / self.total_requests if self.total_requests else 0.0,
+                "retries": self.retries,
+            }
+
+def backoff_delay(attempt, base=1.0, cap=32.0):
+    """Exponential backoff with full jitter for the given retry attempt (0-based)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -0,0 +1,92 @@
+import numpy as np
+from sklearn.preprocessing import normalize
+
+from utils.bm25 import term_counts
+from utils.tokens import estimate_tokens
+
+# Weight of relevance versus novelty in Maximal Marginal Relevance
+DEFAULT_MMR_LAMBDA = 0.7
+
+# Candidates at least this similar to a selected chunk are treated as duplicates
+DUPLICATE_THRESHOLD = 0.9
+
+# How many candidates to retrieve per final chunk before re-ranking
+MMR_FETCH_FACTOR = 4
+
+# Most candidates re-ranked at once; the dense similarity matrix grows with its square
+MAX_MMR_CANDIDATES = 256
+
+def candidate_similarity(texts):
+    """Return the dense cosine-similarity matrix of a small set of texts."""
+    counts = term_counts(texts).tocsr()
+    counts.data = np.log1p(counts.data)
+    vectors = normalize(counts)
+    return (vectors @ vectors.T).toarray()
+
+def redundant_tokens(order, similarity, tokens):
+    """Estimate tokens repeated across a selection: each chunk's tokens scaled by its
+    highest similarity to any chunk placed before it."""
+    total = 0.0
+    for position in range(1, len(order)):
+        overlap = similarity[order[position], order[:position]].max()
+        total += tokens[order[position]] * overlap
+    return int(round(total))
+
+def mmr_rerank(hits, texts, top_k, lambda_mult=DEFAULT_MMR_LAMBDA, duplicate_threshold=DUPLICATE_THRESHOLD, measure=None):
+    """Re-rank retrieved [(chunk index, score)] hits with Maximal Marginal Relevance.
+
+    Returns the selected hits and a stats dict comparing the selection with
+    the plain top_k by score, including the estimated tokens saved. When
+    only part of a ranking reaches the prompt, measure(order) should return
+    the positions of order that do (for example, those that fit a token
+    budget); both rankings are then compared on those positions alone.
+    """
+    n = len(hits)
+    if n == 0:
+        return [], {
+            "candidates": 0,
+            "selected": 0,
+            "lambda": lambda_mult,
+            "baseline_tokens": 0,
+            "selected_tokens": 0,
+            "baseline_redundant_tokens": 0,
+            "selected_redundant_tokens": 0,
+            "tokens_saved": 0,
+        }
+
+    scores = np.array([score for _, score in hits], dtype=np.float64)
+    relevance = scores / scores.max() if scores.max() > 0 else scores
+    similarity = candidate_similarity(texts)
+    tokens = np.array([estimate_tokens(text) for text in texts])
+
+    selected = []
+    max_similarity = np.zeros(n)
+    available = np.ones(n, dtype=bool)
+    while len(selected) < top_k and available.any():
+        mmr = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        mmr[~available] = -np.inf
+        best = int(np.argmax(mmr))
+        selected.append(best)
+        available[best] = False
+        # Track each candidate's similarity to its closest selected chunk
+        np.maximum(max_similarity, similarity[:, best], out=max_similarity)
+        available &= max_similarity < duplicate_threshold
+
+    baseline = list(range(min(top_k, n)))
+    if measure is not None:
+        baseline, selected_used = measure(baseline), measure(selected)
+    else:
+        selected_used = selected
+    baseline_redundant = redundant_tokens(baseline, similarity, tokens)
+    selected_redundant = redundant_tokens(selected_used, similarity, tokens)
+    stats = {
+        "candidates": n,
+        "selected": len(selected),
+        "lambda": lambda_mult,
+        "baseline_tokens": int(tokens[baseline].sum()),
+        "selected_tokens": int(tokens[selected_used].sum()),
+        "baseline_redundant_tokens": baseline_redundant,
+        "selected_redundant_tokens": selected_redundant,
+        "tokens_saved": baseline_redundant - selected_redundant,
+    }
+    return [hits[i] for i in selected], stats
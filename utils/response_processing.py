@@ -0,0 +1,239 @@
+import re
+import json
+import logging
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# ```json fenced block around the model's answer
+JSON_FENCE = re.compile(r'```json\s*([\s\S]*?)\s*```')
+
+# Characters that can start any construct the sanitizer removes
+MARKUP_CHARS = re.compile(r'[`#*<]')
+
+# Markdown/HTML clean-up rules, applied in order: each rule runs over the
+# output of the previous one, so nested emphasis such as ***x*** is fully
+# stripped. A rule is skipped when its marker does not occur in the text.
+SANITIZE_RULES = [
+    ("#", re.compile(r'^#+\s+', re.MULTILINE), ''),         # Heading markers (removed)
+    ("**", re.compile(r'\*\*(.*?)\*\*'), r'\1'),            # Bold (text kept)
+    ("*", re.compile(r'\*(.*?)\*'), r'\1'),                 # Italic (text kept)
+    ("`", re.compile(r'`(.*?)`'), r'\1'),                   # Code ticks (text kept)
+    ("```", re.compile(r'```.*?```', re.DOTALL), ''),       # Code blocks (removed)
+    ("<", re.compile(r'<[^>]*>'), ''),                      # HTML tags (removed)
+]
+
+# Template responses: code fences and a leaked CSS preamble
+TEMPLATE_FENCE = re.compile(r'```jinja2?|```')
+TEMPLATE_CSS = re.compile(r'^body\s*{.*?}\s*h1,\s*h2,\s*h3\s*{.*?}\s*table\s*{.*?}.*?$', re.MULTILINE)
+
+# Scanner patterns for the streaming parser
+STRUCTURAL = re.compile(r'["{}\[\]:,]')
+STRING_SPECIAL = re.compile(r'["\\]')
+NON_SPACE = re.compile(r'\S')
+
+# Python-style literals models sometimes emit instead of JSON ones
+LITERALS = {"True": True, "False": False, "None": None}
+
+# Marks a value that could not be decoded (null is a valid value)
+_INVALID = object()
+
+# Consumed input kept before the streaming buffer is compacted
+COMPACT_THRESHOLD = 65536
+
+def sanitize_text(text):
+    """Strip markdown headings, emphasis, code and HTML tags with precompiled patterns."""
+    # Most values are already plain text, as the prompts ask for
+    if not MARKUP_CHARS.search(text):
+        return text
+    for marker, pattern, replacement in SANITIZE_RULES:
+        if marker in text:
+            text = pattern.sub(replacement, text)
+    return text
+
+def extract_json_text(content):
+    """Return the JSON part of a response: the ```json block if present, else the whole text."""
+    match = JSON_FENCE.search(content)
+    return (match.group(1) if match else content).strip()
+
+def clean_template_response(text):
+    """Remove code fences and a leaked CSS preamble from a generated template."""
+    text = TEMPLATE_FENCE.sub('', text).strip()
+    return TEMPLATE_CSS.sub('', text)
+
+def _decode(raw):
+    """Decode one JSON value, tolerating raw control characters and Python literals."""
+    try:
+        return json.loads(raw, strict=False)
+    except json.JSONDecodeError:
+        if raw in LITERALS:
+            return LITERALS[raw]
+        logger.warning(f"Skipping malformed JSON value: {raw[:80]}")
+        return _INVALID
+
+class IncrementalJSONParser:
+    """Parse a streamed JSON object, yielding each top-level member as soon as its value is complete.
+
+    Text before the first '{' (such as a ```json fence) is ignored. String
+    values are emitted at their closing quote, objects and arrays when they
+    close, and numbers/literals at the following ',' or '}'. The scanner
+    jumps between structural characters, so long string values cost one
+    regex search rather than a Python step per character. finish() repairs
+    a response that was cut off in the middle of a string value.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.depth = 0
+        self.in_string = False
+        self.finished = False
+        self.key = None
+        self.token_start = None
+        self.value_start = None
+        self.awaiting_value = False
+
+    def feed(self, text):
+        """Consume a fragment of the response; returns the newly completed [(key, value)] members."""
+        completed = []
+        self.buffer += text
+        buffer = self.buffer
+        while self.position < len(buffer) and not self.finished:
+            if self.in_string:
+                match = STRING_SPECIAL.search(buffer, self.position)
+                if match is None:
+                    self.position = len(buffer)
+                    break
+                if match.group() == "\\":
+                    if match.start() + 1 >= len(buffer):
+                        # Wait for the escaped character
+                        self.position = match.start()
+                        break
+                    self.position = match.start() + 2
+                    continue
+                self.in_string = False
+                if self.depth == 1:
+                    self._close_string(match.start(), completed)
+                self.position = match.start() + 1
+                continue
+
+            if self.depth == 0:
+                start = buffer.find("{", self.position)
+                if start < 0:
+                    self.position = len(buffer)
+                    break
+                self.depth = 1
+                self.position = start + 1
+                continue
+
+            if self.awaiting_value:
+                match = NON_SPACE.search(buffer, self.position)
+                if match is None:
+                    self.position = len(buffer)
+                    break
+                self.awaiting_value = False
+                self.value_start = match.start()
+
+            match = STRUCTURAL.search(buffer, self.position)
+            if match is None:
+                self.position = len(buffer)
+                break
+            self._structural(match.group(), match.start(), completed)
+            self.position = match.start() + 1
+        self._compact()
+        return completed
+
+    def _compact(self):
+        """Drop consumed input so long streams are not re-copied on every fragment."""
+        keep = min(i for i in (self.position, self.token_start, self.value_start) if i is not None)
+        if keep < COMPACT_THRESHOLD:
+            return
+        self.buffer = self.buffer[keep:]
+        self.position -= keep
+        if self.token_start is not None:
+            self.token_start -= keep
+        if self.value_start is not None:
+            self.value_start -= keep
+
+    def _structural(self, char, i, completed):
+        if char == '"':
+            self.in_string = True
+            if self.depth == 1 and self.key is None:
+                self.token_start = i
+        elif char in "{[":
+            self.depth += 1
+        elif char in "}]":
+            self.depth -= 1
+            if self.depth == 1 and self.value_start is not None:
+                self._emit(self.buffer[self.value_start:i + 1], completed)
+            elif self.depth == 0:
+                self._emit_scalar(i, completed)
+                self.finished = True
+        elif char == ":" and self.depth == 1:
+            self.awaiting_value = True
+        elif char == "," and self.depth == 1:
+            self._emit_scalar(i, completed)
+            self.key = None
+
+    def _close_string(self, i, completed):
+        """Handle a closing quote at the top level: either a key or a string value."""
+        if self.key is None and self.token_start is not None:
+            key = _decode(self.buffer[self.token_start:i + 1])
+            self.key = None if key is _INVALID else key
+            self.token_start = None
+        elif self.value_start is not None:
+            self._emit(self.buffer[self.value_start:i + 1], completed)
+
+    def _emit_scalar(self, end, completed):
+        """Emit a pending number or literal that ends before position end."""
+        if self.key is not None and self.value_start is not None:
+            self._emit(self.buffer[self.value_start:end].strip(), completed)
+
+    def _emit(self, raw, completed):
+        value = _decode(raw)
+        if self.key is not None and value is not _INVALID:
+            completed.append((self.key, value))
+        self.value_start = None
+
+    def finish(self):
+        """Close a truncated response; returns the [(key, value)] member that was still open, if repairable."""
+        completed = []
+        if self.finished or self.depth != 1 or self.key is None or self.value_start is None:
+            return completed
+        if self.in_string:
+            raw = self.buffer[self.value_start:]
+            if raw.endswith("\\") and not raw.endswith("\\\\"):
+                raw = raw[:-1]
+            self._emit(raw + '"', completed)
+        else:
+            self._emit_scalar(len(self.buffer), completed)
+        return completed
+
+def repair_json_object(text):
+    """Recover every complete (or repairable) top-level member from malformed or truncated JSON."""
+    parser = IncrementalJSONParser()
+    members = parser.feed(text)
+    members += parser.finish()
+    return dict(members)
+
+def process_variables_response(content, variables):
+    """Turn a model response into a {variable: text} dict with sanitized string values.
+
+    Valid JSON is used as is. Otherwise the tolerant parser recovers what it
+    can, and requested variables it could not recover are marked as not found.
+    """
+    json_str = extract_json_text(content)
+    try:
+        result = json.loads(json_str, strict=False)
+        if not isinstance(result, dict):
+            raise ValueError("response is not a JSON object")
+    except ValueError:
+        result = repair_json_object(json_str)
+        for var in variables:
+            result.setdefault(var, f"[Content for {var} not found]")
+
+    for key, value in result.items():
+        if isinstance(value, str):
+            result[key] = sanitize_text(value)
+    return result
@@ -0,0 +1,214 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import contextlib
+import unicodedata
+from pathlib import Path
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# SQLite database of search results, shared by every Streamlit worker process
+SEARCH_CACHE_PATH = Path(os.getenv("SEARCH_CACHE_PATH", ".cache/search_results.sqlite3"))
+
+# Seconds before cached results are fetched again
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", str(24 * 3600)))
+
+# Least recently used queries are evicted beyond this many entries
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "5000"))
+
+# Set SEARCH_CACHE_DISABLED=1 to call the search API on every search
+SEARCH_CACHE_DISABLED = os.getenv("SEARCH_CACHE_DISABLED", "").lower() in ("1", "true", "yes")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    key TEXT PRIMARY KEY,
+    query TEXT NOT NULL,
+    results TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS searches_last_access ON searches (last_access);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+def normalize_query(query):
+    """Normalize a search query so trivially different spellings share one cache entry."""
+    query = unicodedata.normalize("NFKC", query).casefold()
+    query = re.sub(r'\s+', ' ', query)
+    return query.strip(" \t\n.,;:!?\"'")
+
+def search_key(query, num_results, engine="google"):
+    """Hash a normalized query, result count and engine into a cache key."""
+    payload = json.dumps({"q": normalize_query(query), "num": num_results, "engine": engine}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class _Flight:
+    """An upstream search in progress, awaited by identical concurrent searches."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+class SearchCache:
+    """Persistent TTL cache of search results in SQLite, with coalescing of identical searches.
+
+    search() returns cached results when present; otherwise the first caller
+    runs the upstream search and every identical search started in this
+    process before it finishes waits for, and shares, that one result.
+    Empty results and errors are never cached.
+    """
+
+    def __init__(self, path=SEARCH_CACHE_PATH, ttl=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._initialized = False
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if not self._initialized:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._initialized = True
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, key):
+        """Return the cached results for key, or None if absent or expired."""
+        now = time.time()
+        with contextlib.closing(self._connect()) as conn:
+            row = conn.execute("SELECT results, created FROM searches WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                return None
+            conn.execute("UPDATE searches SET last_access = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+
+    def put(self, key, query, results):
+        """Store results, then drop expired and least recently used entries over the limit."""
+        now = time.time()
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO searches (key, query, results, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, normalize_query(query), json.dumps(results), now, now)
+                )
+                conn.execute("DELETE FROM searches WHERE created < ?", (now - self.ttl,))
+                conn.execute(
+                    "DELETE FROM searches WHERE key IN (SELECT key FROM searches ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def search(self, query, num_results, fetch):
+        """Return the results of fetch(query, num_results), from the cache when possible."""
+        if SEARCH_CACHE_DISABLED:
+            return fetch(query, num_results)
+
+        key = search_key(query, num_results)
+        results = self._cached(key)
+        if results is not None:
+            self.count("hits")
+            return results
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            # An identical search is already on its way; share its result
+            flight.done.wait()
+            self.count("coalesced")
+            if flight.error is not None:
+                raise flight.error
+            return flight.results
+
+        try:
+            # A leader that finished between our lookup and taking the lock has stored its results
+            flight.results = self._cached(key)
+            if flight.results is not None:
+                self.count("hits")
+                return flight.results
+            self.count("misses")
+            flight.results = fetch(query, num_results)
+            if flight.results:
+                try:
+                    self.put(key, query, flight.results)
+                except Exception as e:
+                    logger.error(f"Search cache write error: {str(e)}")
+            return flight.results
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _cached(self, key):
+        try:
+            return self.get(key)
+        except Exception as e:
+            logger.error(f"Search cache read error: {str(e)}")
+            return None
+
+    def count(self, name, amount=1):
+        """Add to a shared counter."""
+        try:
+            with contextlib.closing(self._connect()) as conn:
+                conn.execute(
+                    "INSERT INTO stats (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?",
+                    (name, amount, amount)
+                )
+        except Exception as e:
+            logger.error(f"Search cache stats error: {str(e)}")
+
+    def stats(self):
+        """Return hit, coalesced and miss counters, the hit rate and the number of cached queries.
+
+        Misses are the searches that called the API; hits and coalesced
+        searches were answered without a call of their own.
+        """
+        with contextlib.closing(self._connect()) as conn:
+            counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            entries = conn.execute("SELECT COUNT(*) FROM searches").fetchone()[0]
+        hits = counters.get("hits", 0)
+        coalesced = counters.get("coalesced", 0)
+        misses = counters.get("misses", 0)
+        lookups = hits + coalesced + misses
+        return {
+            "hits": hits,
+            "coalesced": coalesced,
+            "misses": misses,
+            "hit_rate": (hits + coalesced) / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+    def clear(self):
+        """Remove every cached search and reset the counters."""
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("DELETE FROM searches")
+            conn.execute("DELETE FROM stats")
+
+# Shared by every caller in this process
+search_cache = SearchCache()
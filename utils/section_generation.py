@@ -0,0 +1,74 @@
+import os
+import time
+import queue
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Variables generated per Gemini call when generating in groups
+VARIABLE_GROUP_SIZE = int(os.getenv("VARIABLE_GROUP_SIZE", "6"))
+
+# Upper bound on concurrent Gemini calls for one document
+MAX_GENERATION_WORKERS = int(os.getenv("MAX_GENERATION_WORKERS", "4"))
+
+def group_variables(variables, group_size=VARIABLE_GROUP_SIZE):
+    """Split variables, in template order, into consecutive groups of at most group_size."""
+    return [variables[i:i + group_size] for i in range(0, len(variables), group_size)]
+
+def generate_in_groups(variables, generate_group, group_size=VARIABLE_GROUP_SIZE, max_workers=MAX_GENERATION_WORKERS, on_variable=None, report=None, groups=None):
+    """Generate variable content in concurrent groups and merge the results.
+
+    generate_group(group, on_variable) must return a {variable: content}
+    dict. Each group is a separate, smaller Gemini call, so a response that
+    fails to parse only affects its own group. Results are merged in
+    template order. on_variable callbacks from the workers are relayed to
+    the calling thread, so it can safely update the UI. Pass groups to use
+    a precomputed split instead of consecutive groups of group_size.
+    """
+    if groups is None:
+        groups = group_variables(variables, group_size)
+    if len(groups) <= 1:
+        return generate_group(variables, on_variable)
+
+    start = time.perf_counter()
+    results = {}
+    failed_groups = 0
+    events = queue.Queue()
+    emit = (lambda name, value: events.put((name, value))) if on_variable else None
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(groups)), thread_name_prefix="generate") as executor:
+        # Each task runs in a copy of the caller's context so per-request settings carry over
+        futures = {
+            executor.submit(contextvars.copy_context().run, generate_group, group, emit): group
+            for group in groups
+        }
+        if on_variable:
+            # Relay streamed values until every group has finished
+            pending = set(futures)
+            while pending or not events.empty():
+                try:
+                    on_variable(*events.get(timeout=0.1))
+                except queue.Empty:
+                    pending = {future for future in pending if not future.done()}
+        for future in as_completed(futures):
+            group = futures[future]
+            try:
+                results.update(future.result())
+            except Exception as e:
+                failed_groups += 1
+                logger.error(f"Error generating variables {', '.join(group)}: {str(e)}")
+                results.update({var: f"[Error generating content for {var}]" for var in group})
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Generated {len(variables)} variables in {len(groups)} groups ({failed_groups} failed) in {elapsed:.1f}s")
+    if report is not None:
+        report["generation_groups"] = len(groups)
+        report["generation_seconds"] = elapsed
+
+    # Template variables first, in order, then anything extra the model returned
+    merged = {var: results[var] for var in variables if var in results}
+    merged.update((key, value) for key, value in results.items() if key not in merged)
+    return merged
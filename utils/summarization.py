@@ -0,0 +1,213 @@
+import os
+import time
+import zlib
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utils.llm_cache import ResponseCache, cache_key, bypass, is_bypassed
+from utils.llm_client import generate_text, get_provider
+from utils.rag_tools import iter_sentence_spans
+from utils.tokens import CHARS_PER_TOKEN, estimate_tokens
+from utils.context_packer import truncate_to_tokens
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Chunk summaries are many small calls, so they default to the faster model
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gemini-1.5-flash")
+
+# Average chunk size for the map step, and the length asked of each summary
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "4000"))
+SUMMARY_TOKENS = int(os.getenv("SUMMARY_TOKENS", "400"))
+
+# Concurrent summary calls for one document
+MAX_SUMMARY_WORKERS = int(os.getenv("MAX_SUMMARY_WORKERS", "8"))
+
+# Chunk summaries are independent of the query, so they are kept for a long time
+SUMMARY_CACHE_PATH = os.getenv("SUMMARY_CACHE_PATH", ".cache/chunk_summaries.sqlite3")
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", str(30 * 24 * 3600)))
+
+# Bump when the summary prompt changes, so old summaries are not reused
+SUMMARY_PROMPT_VERSION = "1"
+
+summary_cache = ResponseCache(path=SUMMARY_CACHE_PATH, ttl=SUMMARY_CACHE_TTL)
+
+def content_defined_chunks(text, target_tokens=SUMMARY_CHUNK_TOKENS):
+    """Split text into sentence-aligned chunks whose boundaries depend only on local content.
+
+    A chunk may end after any sentence once it holds half the target size,
+    with a probability proportional to the sentence length decided by a
+    hash of the sentence itself, and must end at twice the target size. An
+    edit therefore only moves the boundaries next to it: the chunks of the
+    unchanged parts of a revised document are identical, and so are their
+    hashes. Sentences longer than the maximum are cut at whitespace.
+    """
+    target = target_tokens * CHARS_PER_TOKEN
+    min_size = target // 2
+    max_size = target * 2
+    chunks = []
+    chunk_start = None
+
+    for sentence_start, sentence_end in _bounded_spans(text, max_size):
+        if chunk_start is None:
+            chunk_start = sentence_start
+        elif sentence_end - chunk_start > max_size:
+            chunks.append(text[chunk_start:sentence_start].strip())
+            chunk_start = sentence_start
+
+        size = sentence_end - chunk_start
+        if size >= min_size:
+            sentence = text[sentence_start:sentence_end].encode("utf-8", errors="surrogatepass")
+            if zlib.crc32(sentence) / 2 ** 32 < (sentence_end - sentence_start) / (target - min_size):
+                chunks.append(text[chunk_start:sentence_end].strip())
+                chunk_start = None
+
+    if chunk_start is not None:
+        chunks.append(text[chunk_start:].strip())
+    return [chunk for chunk in chunks if chunk]
+
+def _bounded_spans(text, max_size):
+    """Yield sentence spans, cutting any longer than max_size at the last whitespace before the limit."""
+    for start, end in iter_sentence_spans(text):
+        while end - start > max_size:
+            cut = text.rfind(" ", start + 1, start + max_size)
+            if cut < 0:
+                cut = start + max_size
+            yield start, cut
+            start = cut
+        yield start, end
+
+def summary_key(chunk, model_name=SUMMARY_MODEL):
+    """Hash a chunk, with the provider, model and prompt version, into its summary cache key."""
+    return cache_key(model_name, f"{SUMMARY_PROMPT_VERSION}\0{chunk}", provider=get_provider().name)
+
+def summarize_chunk(chunk, model_name=SUMMARY_MODEL):
+    """Summarize one chunk, reusing the stored summary of identical text; returns (summary, cached)."""
+    use_cache = not is_bypassed()
+    key = summary_key(chunk, model_name)
+    if use_cache:
+        try:
+            cached = summary_cache.get(key)
+            if cached is not None:
+                return cached, True
+        except Exception as e:
+            logger.error(f"Error reading summary cache: {str(e)}")
+
+    prompt = f"""
+    Summarize the following section of a longer document.
+    Keep every fact, figure, date, name, definition and requirement; drop repetition and filler.
+    Write plain text without markdown, in at most {SUMMARY_TOKENS * 3 // 4} words.
+
+    SECTION:
+    {chunk}
+    """
+    # Stored in the summary cache instead, keyed by the chunk rather than the whole prompt
+    with bypass():
+        summary = generate_text(prompt, model_name).strip()
+
+    if use_cache and summary:
+        try:
+            summary_cache.put(key, model_name, summary)
+        except Exception as e:
+            logger.error(f"Error writing summary cache: {str(e)}")
+    return summary, False
+
+def summarize_chunks(chunks, model_name=SUMMARY_MODEL, max_workers=MAX_SUMMARY_WORKERS, on_progress=None):
+    """Summarize chunks in parallel; returns (summaries in chunk order, number served from cache).
+
+    A chunk whose summary fails is represented by its truncated text, so
+    the brief still covers it. on_progress(done, total) is called from the
+    calling thread as summaries complete.
+    """
+    summaries = [None] * len(chunks)
+    cached_count = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks))), thread_name_prefix="summarize") as executor:
+        futures = {
+            executor.submit(contextvars.copy_context().run, summarize_chunk, chunk, model_name): i
+            for i, chunk in enumerate(chunks)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            try:
+                summaries[i], cached = future.result()
+                cached_count += cached
+            except Exception as e:
+                logger.error(f"Error summarizing chunk {i + 1} of {len(chunks)}: {str(e)}")
+                summaries[i] = truncate_to_tokens(chunks[i], SUMMARY_TOKENS)
+            if on_progress:
+                on_progress(done, len(chunks))
+    return summaries, cached_count
+
+def group_summaries(summaries, max_tokens=SUMMARY_CHUNK_TOKENS):
+    """Join consecutive summaries into groups of at most max_tokens for the next reduce level."""
+    groups = []
+    current = []
+    used = 0
+    for summary in summaries:
+        cost = estimate_tokens(summary)
+        if current and used + cost > max_tokens:
+            groups.append("\n\n".join(current))
+            current, used = [], 0
+        current.append(summary)
+        used += cost
+    if current:
+        groups.append("\n\n".join(current))
+    return groups
+
+def write_brief(user_query, summaries, budget_tokens, model_name=SUMMARY_MODEL):
+    """Reduce the top-level summaries into one brief focused on the user's request."""
+    parts = "\n\n".join(f"[Part {i + 1}]\n{summary}" for i, summary in enumerate(summaries))
+    prompt = f"""
+    The following are summaries of consecutive parts of a source document, in order.
+    Combine them into one compact brief for writing a document that answers:
+
+    {user_query}
+
+    Keep the facts, figures, names and requirements relevant to that request, grouped by topic.
+    Write plain text without markdown, in at most {budget_tokens * 3 // 4} words.
+
+    {parts}
+    """
+    return truncate_to_tokens(generate_text(prompt, model_name).strip(), budget_tokens)
+
+def summarize_source(user_query, text, budget_tokens, model_name=SUMMARY_MODEL, on_progress=None, report=None):
+    """Map-reduce a knowledge source that is too large for the prompt into a brief of at most budget_tokens.
+
+    Chunks are summarized in parallel and cached by content hash, so a
+    revised document only re-summarizes the chunks that changed. Summaries
+    that together exceed one call are grouped and summarized again, level
+    by level, before the final query-focused brief is written.
+    """
+    start = time.perf_counter()
+    chunks = content_defined_chunks(text)
+    summaries, cached = summarize_chunks(chunks, model_name, on_progress=on_progress)
+    logger.info(f"Summarized {len(chunks)} chunks ({cached} from cache)")
+
+    levels = 1
+    while len(summaries) > 1 and sum(estimate_tokens(summary) for summary in summaries) > SUMMARY_CHUNK_TOKENS:
+        groups = group_summaries(summaries)
+        if len(groups) == len(summaries):
+            # Summaries are not shrinking; stop before looping forever
+            break
+        summaries, reused = summarize_chunks(groups, model_name)
+        cached += reused
+        levels += 1
+
+    try:
+        brief = write_brief(user_query, summaries, budget_tokens, model_name)
+    except Exception as e:
+        logger.error(f"Error writing source brief: {str(e)}")
+        brief = truncate_to_tokens("\n\n".join(summaries), budget_tokens)
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Reduced {len(chunks)} chunks over {levels} levels into a {estimate_tokens(brief)} token brief in {elapsed:.1f}s")
+    if report is not None:
+        report["summary_chunks"] = len(chunks)
+        report["summary_cached"] = cached
+        report["summary_levels"] = levels
+        report["summary_seconds"] = elapsed
+        report["context_tokens"] = estimate_tokens(brief)
+        report["context_budget"] = budget_tokens
+    return brief
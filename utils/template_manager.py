@@ -55,6 +55,19 @@ Sincerely,
     """
 }
 
+# Model routing for the default templates: short fields on the fast model, the rest on pro
+DEFAULT_TEMPLATE_ROUTING = {
+    "customer_complaint_response": {
+        "enabled": True,
+        "fast": ["customer_name", "issue_summary", "company_name", "contact_info", "agent_name"],
+        "pro": ["detailed_response"]
+    },
+    "product_report": {
+        "enabled": True,
+        "fast": ["product_name", "date", "author"]
+    }
+}
+
 def initialize_templates():
     """Initialize the templates directory with default templates if it doesn't exist."""
     # Create the templates index file if it doesn't exist
@@ -76,6 +89,8 @@ def initialize_templates():
                 "category": "default",
                 "source": "default"
             }
+            if name in DEFAULT_TEMPLATE_ROUTING:
+                template_index[name]["routing"] = DEFAULT_TEMPLATE_ROUTING[name]
         
         # Save the index
         with open(TEMPLATES_INDEX, 'w', encoding='utf-8') as f:
@@ -122,6 +137,12 @@ def get_template_content(template_name):
         logger.error(f"Error reading template '{template_name}': {str(e)}")
         return None
 
+def get_template_routing(template_name):
+    """Get the model routing settings of a template from the index, or None if it has none."""
+    template_index = get_template_list()
+    entry = template_index.get(template_name)
+    return entry.get("routing") if entry else None
+
 def save_new_template(template_name, template_content, description="", category="user", source="web_search"):
     """Save a new template to the templates directory."""
     # Make sure templates are initialized
@@ -163,7 +184,17 @@ def extract_variables_from_template(template_text):
     """Extract Jinja2 variables from a template."""
     variable_pattern = r'{{\s*(\w+)\s*}}'
     matches = re.findall(variable_pattern, template_text)
-    return list(set(matches))  # Return unique variable names
+    return list(dict.fromkeys(matches))  # Return unique variable names in template order
+
+def render_partial_template(template_text, partial_content, pending="_Generating..._"):
+    """Render a template with the variables generated so far, marking the rest as pending."""
+    values = {var: pending for var in extract_variables_from_template(template_text)}
+    values.update(partial_content)
+    try:
+        return Template(template_text).render(**values)
+    except Exception as e:
+        logger.error(f"Error rendering partial template: {str(e)}")
+        return None
 
 def validate_template(template_text):
     """Validate that a template is properly formatted."""
@@ -0,0 +1,8 @@
+# Average characters per token for English text with Gemini-style tokenizers
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text):
+    """Estimate the number of model tokens in a piece of text."""
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
@@ -0,0 +1,257 @@
+import os
+import shutil
+import weakref
+import tempfile
+import itertools
+import numpy as np
+from scipy import sparse
+
+from utils.bm25 import N_FEATURES, term_counts, top_k_indices
+from utils.index_cache import INDEX_CACHE_DIR
+
+# Dimensionality of the projected dense vectors
+EMBEDDING_DIM = 256
+
+# Chunks embedded per batch while building (bounds peak memory)
+EMBED_BATCH_SIZE = 4096
+
+# Rows copied per step when grouping vectors by inverted list
+REORDER_BATCH_SIZE = 65536
+
+# Hits scoring below this share no terms with the query; what remains is projection noise
+MIN_DENSE_SCORE = 0.05
+
+# Corpora smaller than this are searched exhaustively
+MIN_ANN_VECTORS = 4096
+
+# Inverted lists scanned per query
+DEFAULT_NPROBE = 16
+
+# Training sample for the coarse quantizer
+KMEANS_SAMPLES_PER_LIST = 256
+KMEANS_MAX_SAMPLES = 131072
+
+_PROJECTION_SEED = np.uint64(0x9E3779B97F4A7C15)
+
+def _splitmix64(x):
+    """Vectorized SplitMix64 finalizer over a uint64 array."""
+    x = x + _PROJECTION_SEED
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+def projection_rows(term_ids):
+    """Return the +/-1 random projection rows for the given hashed term ids.
+
+    Rows are derived from a hash of (term, dimension), so every process
+    computes the same projection without storing a N_FEATURES x DIM matrix.
+    """
+    cells = term_ids.astype(np.uint64)[:, None] * np.uint64(EMBEDDING_DIM) + np.arange(EMBEDDING_DIM, dtype=np.uint64)
+    signs = (_splitmix64(cells) >> np.uint64(63)).astype(np.float32)
+    return (1.0 - 2.0 * signs) / np.sqrt(EMBEDDING_DIM)
+
+def embed_counts(counts, idf):
+    """Project a (documents x hashed terms) count matrix to L2-normalized dense vectors."""
+    counts = counts.tocsr()
+    terms, local = np.unique(counts.indices, return_inverse=True)
+    # Sublinear tf-idf weighting, restricted to the terms actually present
+    weighted = sparse.csr_matrix(
+        (np.log1p(counts.data) * idf[terms][local], local.reshape(-1), counts.indptr),
+        shape=(counts.shape[0], len(terms))
+    )
+    vectors = np.asarray(weighted @ projection_rows(terms), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+def _batches(iterable, size):
+    """Yield lists of up to size items from an iterable."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def _spherical_kmeans(vectors, n_lists, iterations=20, seed=0):
+    """Cluster unit vectors into n_lists centroids on a bounded sample."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), n_lists * KMEANS_SAMPLES_PER_LIST, KMEANS_MAX_SAMPLES)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+    centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        membership = sparse.csr_matrix(
+            (np.ones(sample_size, dtype=np.float32), (assignment, np.arange(sample_size))),
+            shape=(n_lists, sample_size)
+        )
+        sums = np.asarray(membership @ sample)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        if empty.any():
+            # Re-seed empty lists from random sample points
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+
+    return centroids.astype(np.float32)
+
+def _assign(vectors, centroids, batch_size=65536):
+    """Return the nearest centroid of every vector."""
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batch_size):
+        batch = np.asarray(vectors[start:start + batch_size])
+        assignment[start:start + batch_size] = np.argmax(batch @ centroids.T, axis=1)
+    return assignment
+
+class DenseVectorIndex:
+    """Offline dense-vector retrieval engine with an IVF approximate nearest-neighbour index.
+
+    Vectors are stored grouped by inverted list, so each probed list is one
+    contiguous slice of the (memory-mapped) vector file. Loaded through
+    utils.index_cache, the arrays are opened read-only with mmap, and all
+    Streamlit worker processes share them through the OS page cache.
+    """
+
+    engine = "dense"
+
+    def __init__(self, vectors, chunk_ids, centroids, list_offsets, idf, nprobe=DEFAULT_NPROBE):
+        self.vectors = vectors
+        self.chunk_ids = chunk_ids
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.idf = idf
+        self.nprobe = nprobe
+        # Terms in no chunk get the highest idf
+        self.unseen_idf = float(idf.max()) if len(idf) else 0.0
+
+    @classmethod
+    def build(cls, chunks):
+        """Embed an iterable of chunk strings and build the IVF lists.
+
+        Vectors are written batch by batch to memory-mapped scratch files
+        in the index cache directory, so neither the vectors nor their
+        reordered copy have to fit in memory. The scratch files are removed
+        once the index is no longer used.
+        """
+        # First pass: document frequencies over the hashed term space
+        n_docs = 0
+        document_frequency = np.zeros(N_FEATURES, dtype=np.int64)
+        for batch in _batches(chunks, EMBED_BATCH_SIZE):
+            counts = term_counts(batch)
+            document_frequency += np.bincount(counts.indices, minlength=N_FEATURES)
+            n_docs += len(batch)
+        idf = (np.log((1 + n_docs) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        INDEX_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        work_dir = tempfile.mkdtemp(prefix=".dense-build-", dir=INDEX_CACHE_DIR)
+
+        # Second pass: project each batch to dense vectors
+        vectors = np.lib.format.open_memmap(
+            f"{work_dir}/vectors.npy", mode="w+", dtype=np.float32, shape=(n_docs, EMBEDDING_DIM)
+        )
+        start = 0
+        for batch in _batches(chunks, EMBED_BATCH_SIZE):
+            vectors[start:start + len(batch)] = embed_counts(term_counts(batch), idf)
+            start += len(batch)
+
+        if n_docs < MIN_ANN_VECTORS:
+            # Small corpora: a single list, i.e. exact search
+            centroids = np.zeros((1, EMBEDDING_DIM), dtype=np.float32)
+            list_offsets = np.array([0, n_docs], dtype=np.int64)
+            return cls._with_scratch(vectors, np.arange(n_docs, dtype=np.int64), centroids, list_offsets, idf, work_dir)
+
+        n_lists = int(min(4096, max(16, np.sqrt(n_docs))))
+        centroids = _spherical_kmeans(vectors, n_lists)
+        assignment = _assign(vectors, centroids)
+
+        order = np.argsort(assignment, kind='stable')
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=n_lists), out=list_offsets[1:])
+
+        # Group the rows by list into a second file, a slice at a time
+        grouped = np.lib.format.open_memmap(
+            f"{work_dir}/grouped_vectors.npy", mode="w+", dtype=np.float32, shape=(n_docs, EMBEDDING_DIM)
+        )
+        for start in range(0, n_docs, REORDER_BATCH_SIZE):
+            grouped[start:start + REORDER_BATCH_SIZE] = vectors[order[start:start + REORDER_BATCH_SIZE]]
+        del vectors
+        try:
+            os.remove(f"{work_dir}/vectors.npy")
+        except OSError:
+            # Still mapped on Windows; removed with the scratch directory
+            pass
+        return cls._with_scratch(grouped, order.astype(np.int64), centroids, list_offsets, idf, work_dir)
+
+    @classmethod
+    def _with_scratch(cls, vectors, chunk_ids, centroids, list_offsets, idf, work_dir):
+        """Create an index whose scratch directory is deleted along with it."""
+        vectors.flush()
+        index = cls(vectors, chunk_ids, centroids, list_offsets, idf)
+        weakref.finalize(index, shutil.rmtree, work_dir, True)
+        return index
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        """Rebuild the index from (memory-mapped) cached arrays."""
+        return cls(
+            arrays["vectors"],
+            arrays["vector_chunk_ids"],
+            arrays["centroids"],
+            arrays["list_offsets"],
+            arrays["term_idf"],
+            nprobe=meta.get("nprobe", DEFAULT_NPROBE)
+        )
+
+    def to_arrays(self):
+        """Return (arrays, metadata) suitable for utils.index_cache.save_index."""
+        arrays = {
+            "vectors": self.vectors,
+            "vector_chunk_ids": self.chunk_ids,
+            "centroids": self.centroids,
+            "list_offsets": self.list_offsets,
+            "term_idf": self.idf,
+        }
+        return arrays, {"engine": self.engine, "dim": EMBEDDING_DIM, "nprobe": self.nprobe}
+
+    def embed_queries(self, queries):
+        """Embed query strings into the index's vector space, ignoring terms that occur in no chunk."""
+        counts = term_counts(queries).tocsr()
+        # Unseen terms only add projection noise; a query of nothing else embeds to zero
+        counts.data[self.idf[counts.indices] >= self.unseen_idf] = 0
+        counts.eliminate_zeros()
+        return embed_counts(counts, self.idf)
+
+    def _search_vector(self, query_vector, top_k):
+        """Return [(chunk index, score)] for one embedded query."""
+        n_lists = len(self.list_offsets) - 1
+        if n_lists == 1:
+            probed = [0]
+        else:
+            probed = top_k_indices(self.centroids @ query_vector, self.nprobe)
+
+        ids = []
+        scores = []
+        for list_id in probed:
+            start, end = self.list_offsets[list_id], self.list_offsets[list_id + 1]
+            if start == end:
+                continue
+            scores.append(self.vectors[start:end] @ query_vector)
+            ids.append(self.chunk_ids[start:end])
+        if not scores:
+            return []
+
+        scores = np.concatenate(scores)
+        ids = np.concatenate(ids)
+        best = top_k_indices(scores, top_k)
+        # Chunks sharing no term with the query are left out, as BM25 does
+        return [(int(ids[i]), float(scores[i])) for i in best if scores[i] >= MIN_DENSE_SCORE]
+
+    def search(self, query, top_k=3):
+        """Return [(chunk index, score)] for the top_k nearest chunks."""
+        return self._search_vector(self.embed_queries([query])[0], top_k)
+
+    def search_batch(self, queries, top_k=3):
+        """Embed several queries at once and search each; returns one hit list per query."""
+        return [self._search_vector(vector, top_k) for vector in self.embed_queries(queries)]
@@ -1,9 +1,25 @@
 import streamlit as st
-import requests
 import os
+import re
+from io import BytesIO
 from bs4 import BeautifulSoup
 import logging
 
+from utils.http_client import (
+    get_session,
+    get_search_session,
+    fetch_all,
+    sniff_content_type,
+    read_limited,
+    REQUEST_TIMEOUT,
+    SCRAPE_MAX_PAGE_BYTES,
+    SCRAPE_MAX_DOCUMENT_BYTES
+)
+from utils.document_processing import extract_text_from_pdf, extract_text_from_docx
+from utils.content_extraction import extract_main_content, EXTRACTOR_VERSION
+from utils.page_cache import page_cache, SCRAPE_CACHE_DISABLED
+from utils.search_cache import search_cache
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -11,8 +27,14 @@ logger = logging.getLogger(__name__)
 # Get the API key from environment variables
 SERP_API_KEY = os.getenv("SERP_API_KEY")
 
-def search_web(query, num_results=5):
-    """Search the web and return top results."""
+# Limit text length to prevent excessive content
+MAX_PAGE_CHARACTERS = 15000
+
+# "main" keeps only a page's main content; "full" keeps all of its text
+SCRAPE_EXTRACTOR = os.getenv("SCRAPE_EXTRACTOR", "main").lower()
+
+def fetch_search_results(query, num_results=5):
+    """Call the search API and return its top organic results."""
     url = "https://serpapi.com/search"
     params = {
         "api_key": SERP_API_KEY,
@@ -21,61 +43,168 @@ def search_web(query, num_results=5):
         "num": num_results
     }
     
+    response = get_search_session().get(url, params=params, timeout=REQUEST_TIMEOUT)
+    data = response.json()
+    
+    results = []
+    for result in data.get("organic_results", [])[:num_results]:
+        results.append({
+            "title": result.get("title", ""),
+            "link": result.get("link", ""),
+            "snippet": result.get("snippet", "")
+        })
+    return results
+
+def search_web(query, num_results=5):
+    """Search the web and return top results.
+    
+    Results are cached by normalized query, and identical searches running
+    at the same time share a single API call.
+    """
     st.info(f"Searching for information about: {query}")
     
     try:
-        response = requests.get(url, params=params)
-        data = response.json()
+        results = search_cache.search(query, num_results, fetch_search_results)
         
-        if "organic_results" not in data:
+        if not results:
             st.error("No search results found. Please try a different query.")
             return []
             
-        results = []
-        for result in data["organic_results"][:num_results]:
-            results.append({
-                "title": result.get("title", ""),
-                "link": result.get("link", ""),
-                "snippet": result.get("snippet", "")
-            })
         return results
     except Exception as e:
         st.error(f"Error searching the web: {str(e)}")
         logger.error(f"Search error: {str(e)}")
         return []
 
+class UnsupportedContentError(Exception):
+    """Raised for responses that are not worth downloading or cannot be turned into text."""
+
+def clean_text(text):
+    """Collapse whitespace and drop empty lines, then cut the text to MAX_PAGE_CHARACTERS."""
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return '\n'.join(chunk for chunk in chunks if chunk)[:MAX_PAGE_CHARACTERS]
+
+def extract_full_text(html, encoding=None):
+    """Extract all of the text of an HTML page, given as text or as bytes in encoding."""
+    soup = BeautifulSoup(html, 'html.parser', from_encoding=encoding if isinstance(html, bytes) else None)
+    
+    # Remove script and style elements
+    for script in soup(["script", "style"]):
+        script.extract()
+        
+    # Get text and clean it
+    return clean_text(soup.get_text(separator=' ', strip=True))
+
+def extract_page_text(html, encoding=None):
+    """Extract the readable text of an HTML page, given as text or as bytes in encoding."""
+    if SCRAPE_EXTRACTOR == "full":
+        return extract_full_text(html, encoding)
+    try:
+        return clean_text(extract_main_content(html, encoding))
+    except Exception as e:
+        logger.error(f"Main content extraction error: {str(e)}")
+        return extract_full_text(html, encoding)
+
+def extract_response_text(response, url):
+    """Download a streamed response within the size limits and extract its text by content type.
+    
+    The first chunk decides the type: HTML and plain text are read up to
+    SCRAPE_MAX_PAGE_BYTES and the rest is never downloaded, PDF and DOCX
+    files go to the document extractors, and anything else is rejected
+    before its body is read. Raises UnsupportedContentError for rejected content.
+    """
+    content_type = response.headers.get("Content-Type", "")
+    chunks = response.iter_content(64 * 1024)
+    head = next(chunks, b"")
+    kind = sniff_content_type(content_type, head, url)
+    if kind is None:
+        raise UnsupportedContentError(f"unsupported content type {content_type or 'unknown'}")
+    
+    if kind in ("pdf", "docx"):
+        declared = int(response.headers.get("Content-Length") or 0)
+        if declared > SCRAPE_MAX_DOCUMENT_BYTES:
+            raise UnsupportedContentError(f"{kind.upper()} is larger than {SCRAPE_MAX_DOCUMENT_BYTES // (1024 * 1024)} MB")
+        body, truncated = read_limited(chunks, SCRAPE_MAX_DOCUMENT_BYTES, head)
+        if truncated:
+            raise UnsupportedContentError(f"{kind.upper()} is larger than {SCRAPE_MAX_DOCUMENT_BYTES // (1024 * 1024)} MB")
+        extract = extract_text_from_pdf if kind == "pdf" else extract_text_from_docx
+        text = clean_text(extract(BytesIO(body)))
+        if not text:
+            # The extractors return "" for damaged files and scanned pages without text
+            raise UnsupportedContentError(f"no text could be extracted from the {kind.upper()}")
+        return text
+    
+    body, truncated = read_limited(chunks, SCRAPE_MAX_PAGE_BYTES, head)
+    if truncated:
+        logger.info(f"Read the first {SCRAPE_MAX_PAGE_BYTES:,} bytes of {url}")
+    charset = re.search(r'charset=["\']?([\w-]+)', content_type, re.IGNORECASE)
+    encoding = charset.group(1) if charset else None
+    if kind == "html":
+        return extract_page_text(body, encoding)
+    return clean_text(body.decode(encoding or "utf-8", errors="replace"))
+
 def scrape_webpage(url):
-    """Scrape content from a webpage."""
+    """Scrape content from a webpage.
+    
+    Extracted text is cached on disk with the page's ETag and Last-Modified
+    validators: a fresh entry is returned without any request, and a stale
+    one is revalidated with a conditional GET that costs no body on a 304.
+    """
+    # Text extracted by another extractor is cached under a different key
+    cache_key = f"{EXTRACTOR_VERSION if SCRAPE_EXTRACTOR != 'full' else 'full'} {url}"
+    cached = None
+    if not SCRAPE_CACHE_DISABLED:
+        try:
+            cached = page_cache.get(cache_key)
+        except Exception as e:
+            logger.error(f"Page cache read error ({url}): {str(e)}")
+    if cached and cached["fresh"]:
+        return cached["text"]
+    
+    headers = {}
+    if cached and cached["etag"]:
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached["last_modified"]:
+        headers["If-Modified-Since"] = cached["last_modified"]
+    
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        
-        if response.status_code != 200:
-            return f"Failed to retrieve content from {url}"
+        # Pooled keep-alive session, limited to a few connections per host; the
+        # body is streamed so oversized and binary responses are cut off early
+        with get_session().get(url, headers=headers, timeout=REQUEST_TIMEOUT, stream=True) as response:
+            if response.status_code == 304 and cached:
+                page_cache.revalidated(cache_key)
+                return cached["text"]
             
-        soup = BeautifulSoup(response.text, 'html.parser')
+            if response.status_code != 200:
+                return f"Failed to retrieve content from {url}"
+                
+            text = extract_response_text(response, url)
         
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.extract()
-            
-        # Get text and clean it
-        text = soup.get_text(separator=' ', strip=True)
+        # Empty pages are not cached, so a transient failure is not served until it expires
+        if text and not SCRAPE_CACHE_DISABLED and "no-store" not in response.headers.get("Cache-Control", "").lower():
+            try:
+                page_cache.put(cache_key, text, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+            except Exception as e:
+                logger.error(f"Page cache write error ({url}): {str(e)}")
         
-        # Clean up whitespace
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = '\n'.join(chunk for chunk in chunks if chunk)
-        
-        # Limit text length to prevent excessive content
-        return text[:15000]  # Limit to 15k characters
+        return text
         
+    except UnsupportedContentError as e:
+        logger.info(f"Skipped {url}: {str(e)}")
+        return f"Skipped {url}: {str(e)}"
     except Exception as e:
         logger.error(f"Scraping error ({url}): {str(e)}")
         return f"Error scraping {url}: {str(e)}"
 
+def scrape_webpages(urls, on_page=None):
+    """Scrape several webpages concurrently; returns their contents in the order of urls.
+    
+    on_page(index, url, content) is called from the calling thread as each
+    page completes, in whatever order they finish.
+    """
+    return fetch_all(urls, scrape_webpage, on_result=on_page)
+
 def format_source_data(search_results, scraped_contents):
     """Format the source data for use with Gemini."""
     formatted_data = "## SOURCE DATA:\n\n"
@@ -101,11 +230,8 @@ def search_for_template_by_name(template_name):
     if not search_results:
         return None
         
-    # Then scrape the content from each result
-    scraped_contents = []
-    for result in search_results:
-        content = scrape_webpage(result["link"])
-        scraped_contents.append(content)
+    # Then scrape the content from all results concurrently
+    scraped_contents = scrape_webpages([result["link"] for result in search_results])
     
     # Format the data for the AI
     formatted_data = format_source_data(search_results, scraped_contents)